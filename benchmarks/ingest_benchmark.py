@@ -0,0 +1,384 @@
+# benchmarks/ingest_benchmark.py
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass
+
+from config.config import Config
+
+KIB = 1024
+MIB = 1024 * KIB
+GIB = 1024 * MIB
+# Every file starts with its index in this many bytes, which is also the smallest file size
+HEADER_SIZE = 8
+
+# Size classes as (smallest, largest) file size, sizes are drawn log-uniformly in between
+SIZE_CLASSES = {
+    "tiny": (0, 4 * KIB),
+    "small": (4 * KIB, 1 * MIB),
+    "mixed": (1 * KIB, 64 * MIB),
+    "large": (1 * GIB, 4 * GIB),
+}
+# Metrics that get worse when they grow, all others get worse when they shrink
+LOWER_IS_BETTER = ("p50_ms", "p99_ms", "seconds")
+COMPARED_METRICS = ("files_per_second", "bytes_per_second", "p50_ms", "p99_ms")
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """
+    A synthetic inbox that is archived in one run
+    """
+    name: str
+    file_count: int
+    size_class: str
+    # Directory levels between the inbox and the files, 0 puts all files directly into the inbox
+    depth: int
+    # Files that already exist in the archive before the run
+    archive_files: int = 0
+
+
+SCENARIOS = {scenario.name: scenario for scenario in (
+    Scenario("flat-1k-tiny", 1_000, "tiny", 0),
+    Scenario("deep-1k-tiny", 1_000, "tiny", 6),
+    Scenario("flat-1k-small", 1_000, "small", 0),
+    Scenario("flat-1k-mixed", 1_000, "mixed", 0),
+    Scenario("flat-1k-tiny-full-archive", 1_000, "tiny", 0, archive_files=100_000),
+    Scenario("flat-100k-tiny", 100_000, "tiny", 0),
+    Scenario("deep-100k-tiny", 100_000, "tiny", 6),
+    Scenario("flat-4-large", 4, "large", 0),
+)}
+DEFAULT_SCENARIOS = ("flat-1k-tiny", "deep-1k-tiny", "flat-1k-small", "flat-1k-mixed")
+
+
+@dataclass
+class Result:
+    """
+    Measurements of one scenario on one target
+    """
+    scenario: str
+    target: str
+    files: int
+    failed: int
+    bytes: int
+    seconds: float
+    files_per_second: float
+    bytes_per_second: float
+    p50_ms: float
+    p99_ms: float
+
+
+def file_sizes(scenario: Scenario, seed: int) -> list[int]:
+    """
+    Draws the file sizes of a scenario, the same seed always yields the same sizes
+    Sizes below HEADER_SIZE are raised to it, so every file can hold its unique header
+    """
+    rng = random.Random(seed)
+    smallest, largest = SIZE_CLASSES[scenario.size_class]
+    sizes = []
+    low, high = math.log2(max(smallest, 1)), math.log2(max(largest, 1))
+    for _ in range(scenario.file_count):
+        sizes.append(max(HEADER_SIZE, min(largest, int(2 ** rng.uniform(low, high)))))
+    return sizes
+
+
+def generate_inbox(scenario: Scenario, inbox: str, seed: int) -> int:
+    """
+    Writes the files of a scenario below inbox
+    Every file starts with its own index, so no two files are duplicates of each other
+
+    :return: Total number of bytes written
+    """
+    rng = random.Random(seed)
+    block = rng.randbytes(MIB)
+    total = 0
+    for index, size in enumerate(file_sizes(scenario, seed)):
+        directory = inbox
+        for level in range(scenario.depth):
+            directory = os.path.join(directory, f"d{level}_{index % (level + 2)}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"scan_{index:07d}.pdf"), "wb") as f:
+            f.write(index.to_bytes(HEADER_SIZE, "little"))
+            remaining = size - HEADER_SIZE
+            while remaining > 0:
+                written = f.write(block[:min(remaining, len(block))])
+                remaining -= written
+        total += size
+    return total
+
+
+def generate_archive(archive_root: str, file_count: int) -> None:
+    """
+    Fills an archive with tiny files spread over all destination directories of job_settings
+    """
+    for index in range(file_count):
+        specialization, exam_part, file_type, year, period = job_settings(index)
+        directory = os.path.join(archive_root, specialization, exam_part, year, period)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"{file_type}_20000101000000_{index}.pdf"), "wb") as f:
+            f.write(b"archived" + index.to_bytes(8, "little"))
+
+
+def job_settings(index: int) -> tuple:
+    """
+    Cycles through the settings, so the files are spread over many destination directories
+    """
+    specializations = Config.get_specializations()
+    exam_parts = Config.get_exam_parts()
+    file_types = Config.get_file_types()
+    periods = Config.get_periods()
+    return (
+        specializations[index % len(specializations)],
+        exam_parts[index // len(specializations) % len(exam_parts)],
+        file_types[index % len(file_types)],
+        str(2020 + index % 5),
+        periods[index // 7 % len(periods)],
+    )
+
+
+def run_scenario(scenario: Scenario, target: str, work_dir: str, archive_dir: str, seed: int, workers: int,
+                 dedup: bool, catalog: bool) -> Result:
+    """
+    Generates the inbox of a scenario in work_dir and archives it into archive_dir
+    Only the archiving is timed. The dedup index, catalog, journal and routing rules are kept in a temporary
+    data directory, so the benchmark never touches the real application data
+    """
+    from core.directory_scanner import scan_paths
+    from core.file_processor import FileJob, FileProcessor
+    from core.processing_engine import ProcessingEngine, ProcessingListener
+    from core.dedup_index import DedupIndex
+    from core.archive_catalog import ArchiveCatalog
+    from core.batch_journal import BatchJournal
+    from core.routing_rules import RoutingRules
+
+    class TimingListener(ProcessingListener):
+        def __init__(self) -> None:
+            self.lock = threading.Lock()
+            self.started = {}
+            self.latencies = []
+            self.failed = 0
+
+        def on_started(self, job_id, job) -> None:
+            with self.lock:
+                self.started[job_id] = time.perf_counter()
+
+        def on_finished(self, job_id, destination_path) -> None:
+            finished = time.perf_counter()
+            with self.lock:
+                self.latencies.append(finished - self.started.pop(job_id))
+
+        def on_failed(self, job_id, error) -> None:
+            with self.lock:
+                self.started.pop(job_id, None)
+                self.failed += 1
+
+    inbox = tempfile.mkdtemp(prefix="inbox_", dir=work_dir)
+    archive_root = tempfile.mkdtemp(prefix="archive_", dir=archive_dir)
+    data_dir = tempfile.mkdtemp(prefix="data_", dir=work_dir)
+    file_processor = None
+    try:
+        total_bytes = generate_inbox(scenario, inbox, seed)
+        generate_archive(archive_root, scenario.archive_files)
+        file_processor = FileProcessor(
+            archive_root=archive_root,
+            dedup_index=DedupIndex(os.path.join(data_dir, "dedup.sqlite")) if dedup else None,
+            catalog=ArchiveCatalog(os.path.join(data_dir, "catalog.sqlite")) if catalog else None,
+            journal=BatchJournal(os.path.join(data_dir, "journal.jsonl")),
+            # Does not exist, the default layout is measured
+            routing=RoutingRules(os.path.join(data_dir, "routing.json")),
+        )
+        listener = TimingListener()
+        engine = ProcessingEngine(file_processor, listener, max_workers=workers)
+
+        start = time.perf_counter()
+        jobs = (FileJob(file_path, *job_settings(index)) for index, file_path in enumerate(scan_paths([inbox], routing=file_processor.routing)))
+        engine.submit_many(jobs).join()
+        engine.shutdown(wait=True)
+        seconds = time.perf_counter() - start
+
+        latencies = sorted(listener.latencies)
+        files = len(latencies)
+        return Result(
+            scenario=scenario.name,
+            target=target,
+            files=files,
+            failed=listener.failed,
+            bytes=total_bytes,
+            seconds=round(seconds, 4),
+            files_per_second=round(files / seconds, 2) if seconds else 0.0,
+            bytes_per_second=round(total_bytes / seconds, 2) if seconds else 0.0,
+            p50_ms=round(percentile(latencies, 50) * 1000, 3),
+            p99_ms=round(percentile(latencies, 99) * 1000, 3),
+        )
+    finally:
+        if file_processor is not None:
+            file_processor.close()
+            for store in (file_processor.dedup_index, file_processor.catalog):
+                if store is not None:
+                    store.close()
+        for directory in (inbox, archive_root, data_dir):
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def percentile(sorted_values: list[float], percent: float) -> float:
+    """
+    Nearest-rank percentile of already sorted values, 0 for no values
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(percent / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+
+def median_result(results: list[Result]) -> Result:
+    """
+    Combines repeated runs of the same scenario into their median per metric
+    """
+    combined = asdict(results[0])
+    for metric in ("seconds", "files_per_second", "bytes_per_second", "p50_ms", "p99_ms"):
+        combined[metric] = round(statistics.median(getattr(result, metric) for result in results), 4)
+    combined["failed"] = max(result.failed for result in results)
+    return Result(**combined)
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> list[str]:
+    """
+    Compares two result files
+
+    :param tolerance: Allowed relative change before a metric counts as regression, e.g. 0.1 for 10 %
+    :return: One message per regression
+    """
+    baseline_results = {(result["scenario"], result["target"]): result for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        reference = baseline_results.get((result["scenario"], result["target"]))
+        if reference is None:
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = reference[metric], result[metric]
+            if not old:
+                continue
+            change = (new - old) / old
+            if (change > tolerance) if metric in LOWER_IS_BETTER else (change < -tolerance):
+                regressions.append(f"{result['scenario']} [{result['target']}] {metric}: {old} -> {new} ({change:+.1%})")
+    return regressions
+
+
+def command_run(args) -> int:
+    """
+    Runs the selected scenarios on the same and, if available, on a different file system
+    """
+    scenarios = [SCENARIOS[name] for name in args.scenarios or DEFAULT_SCENARIOS]
+    work_dir = os.path.abspath(args.work_dir or tempfile.gettempdir())
+    targets = [("same-fs", work_dir)]
+    if args.cross_dir:
+        cross_dir = os.path.abspath(args.cross_dir)
+        if os.stat(cross_dir).st_dev == os.stat(work_dir).st_dev:
+            print(f"Warnung: {cross_dir} liegt im selben Dateisystem wie {work_dir}", file=sys.stderr)
+        targets.append(("cross-fs", cross_dir))
+
+    results = []
+    for scenario in scenarios:
+        for target, archive_dir in targets:
+            runs = [
+                run_scenario(scenario, target, work_dir, archive_dir, args.seed, args.workers,
+                             not args.no_dedup, not args.no_catalog)
+                for _ in range(args.repeat)
+            ]
+            result = median_result(runs)
+            results.append(result)
+            print(f"{result.scenario:<28} {result.target:<9} {result.files_per_second:>10.1f} Dateien/s "
+                  f"{result.bytes_per_second / MIB:>9.1f} MiB/s  p50 {result.p50_ms:.2f} ms  p99 {result.p99_ms:.2f} ms"
+                  + (f"  {result.failed} fehlgeschlagen" if result.failed else ""), flush=True)
+
+    report = {
+        "meta": {
+            "version": Config.get_version(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "workers": args.workers or Config.get_max_workers(),
+        },
+        "results": [asdict(result) for result in results],
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Ergebnisse gespeichert in {args.output}")
+
+    if args.baseline:
+        return command_compare(argparse.Namespace(baseline=args.baseline, current=args.output, tolerance=args.tolerance))
+    return 0
+
+
+def command_compare(args) -> int:
+    """
+    Reports the regressions of a result file against a baseline, exits with 1 if there are any
+    """
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    regressions = compare(baseline, current, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print("Keine Regressionen")
+    return 1 if regressions else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Creates the argument parser with the run and compare commands
+    """
+    parser = argparse.ArgumentParser(prog="ingest_benchmark", description="Durchsatz und Latenz der Dateiverarbeitung messen")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Szenarien ausführen und Ergebnisse speichern")
+    run_parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), help="Szenarien (Standard: " + ", ".join(DEFAULT_SCENARIOS) + ")")
+    run_parser.add_argument("--work-dir", help="Ordner für Eingang und Archiv im selben Dateisystem (Standard: temporärer Ordner)")
+    run_parser.add_argument("--cross-dir", help="Archivordner in einem anderen Dateisystem, z. B. /dev/shm oder ein Loop-Mount")
+    run_parser.add_argument("--output", "-o", default="benchmark_results.json", help="Ergebnisdatei (JSON)")
+    run_parser.add_argument("--baseline", "-b", help="Ergebnisse anschließend mit dieser Datei vergleichen")
+    run_parser.add_argument("--tolerance", type=float, default=0.1, help="Erlaubte relative Verschlechterung (Standard: 0.1)")
+    run_parser.add_argument("--repeat", type=int, default=3, help="Wiederholungen je Szenario, gemeldet wird der Median")
+    run_parser.add_argument("--seed", type=int, default=1, help="Startwert für die erzeugten Dateien")
+    run_parser.add_argument("--workers", "-w", type=int, default=None, help="Anzahl paralleler Verarbeitungen")
+    run_parser.add_argument("--no-dedup", action="store_true", help="Ohne Duplikaterkennung messen")
+    run_parser.add_argument("--no-catalog", action="store_true", help="Ohne Katalog messen")
+    run_parser.set_defaults(handler=command_run)
+
+    compare_parser = commands.add_parser("compare", help="Zwei Ergebnisdateien vergleichen")
+    compare_parser.add_argument("baseline", help="Referenzergebnisse")
+    compare_parser.add_argument("current", help="Neue Ergebnisse")
+    compare_parser.add_argument("--tolerance", type=float, default=0.1, help="Erlaubte relative Verschlechterung (Standard: 0.1)")
+    compare_parser.set_defaults(handler=command_compare)
+
+    return parser
+
+
+def main(argv: list[str] = None) -> int:
+    """
+    Run the benchmark command line interface
+
+    Returns:
+        int: The exit status of the command
+    """
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,746 @@
+# cli.py
+
+import argparse
+import csv
+import json
+import os
+import sys
+
+from config.config import Config
+
+MANIFEST_FIELDS = ("file_path", "specialization", "exam_part", "file_type", "year", "period")
+
+
+def read_manifest(manifest_path: str, errors: list):
+    """
+    Opens a CSV or JSONL manifest and lazily yields its rows as dicts
+    CSV manifests need a header row with the MANIFEST_FIELDS, JSONL manifests contain one object per line.
+    The file is opened right away, so a missing manifest is reported before any file is processed
+
+    :param manifest_path: Path of the manifest, the format is chosen by the extension
+    :param errors: Lines that are not a JSON object are appended to it
+    :return: Iterator over (line_number, row) tuples
+    :raises OSError: If the manifest cannot be opened
+    """
+    f = open(manifest_path, newline="", encoding="utf-8-sig")
+    if manifest_path.lower().endswith((".jsonl", ".ndjson")):
+        return _jsonl_rows(manifest_path, f, errors)
+    return _csv_rows(f)
+
+
+def _jsonl_rows(manifest_path: str, f, errors: list):
+    with f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as error:
+                errors.append(f"{manifest_path}:{line_number}: invalid JSON ({error})")
+                continue
+            if not isinstance(row, dict):
+                errors.append(f"{manifest_path}:{line_number}: invalid row (not an object)")
+                continue
+            yield line_number, row
+
+
+def _csv_rows(f):
+    with f:
+        for line_number, row in enumerate(csv.DictReader(f), start=2):
+            yield line_number, row
+
+
+def manifest_jobs(manifest_path: str, errors: list):
+    """
+    Converts the manifest rows into FileJobs, invalid rows are appended to errors
+
+    :return: Iterator over FileJobs
+    :raises OSError: If the manifest cannot be opened
+    """
+    return _manifest_jobs(manifest_path, read_manifest(manifest_path, errors), errors)
+
+
+def _manifest_jobs(manifest_path: str, rows, errors: list):
+    from core.file_processor import FileJob
+
+    choices = {
+        "specialization": Config.get_specializations(),
+        "exam_part": Config.get_exam_parts(),
+        "file_type": Config.get_file_types(),
+        "period": Config.get_periods(),
+    }
+    for line_number, row in rows:
+        values = {field: str(row.get(field) or "").strip() for field in MANIFEST_FIELDS}
+        missing = [field for field, value in values.items() if not value]
+        invalid = [field for field, allowed in choices.items() if values[field] and values[field] not in allowed]
+        if missing or invalid or not values["year"].isdigit():
+            errors.append(f"{manifest_path}:{line_number}: invalid row (missing: {missing}, invalid: {invalid})")
+            continue
+        if not os.path.isabs(values["file_path"]):
+            values["file_path"] = os.path.join(os.path.dirname(os.path.abspath(manifest_path)), values["file_path"])
+        yield FileJob(**values)
+
+
+def settings_from_args(args) -> dict:
+    """
+    :return: The five settings given as options, missing ones are None
+    """
+    return {
+        "specialization": args.specialization,
+        "exam_part": args.exam_part,
+        "file_type": args.file_type,
+        "year": args.year,
+        "period": args.period,
+    }
+
+
+def classified_jobs(file_paths, fallback: dict, errors: list):
+    """
+    Infers the settings of each file, files that cannot be classified are appended to errors
+
+    :param file_paths: Iterable of files
+    :param fallback: Settings used for fields that could not be inferred
+    :return: Iterator over FileJobs
+    """
+    from core.file_classifier import ClassificationError, FileClassifier
+
+    classifier = FileClassifier()
+    for file_path in file_paths:
+        try:
+            yield classifier.classify_job(file_path, fallback)
+        except ClassificationError as e:
+            errors.append(str(e))
+
+
+def build_file_processor(args):
+    """
+    Creates the FileProcessor configured by the common command line options
+    """
+    from core.file_processor import FileProcessor
+
+    dedup_index = None
+    catalog = None
+    if not args.no_dedup:
+        from core.dedup_index import DedupIndex
+        dedup_index = DedupIndex()
+    if not args.no_catalog:
+        from core.archive_catalog import ArchiveCatalog
+        catalog = ArchiveCatalog()
+    search_index = None
+    if not args.no_index:
+        from core.search_index import SearchIndex
+        search_index = SearchIndex()
+    metrics = build_metrics(args)
+    io_scheduler = None
+    if not args.no_io_scheduler:
+        from core.io_scheduler import IoScheduler
+        io_scheduler = IoScheduler(metrics, dict(args.io_limit or []))
+    from core.batch_journal import BatchJournal
+    return FileProcessor(archive_root=args.archive_dir, dedup_index=dedup_index, catalog=catalog, journal=BatchJournal(),
+                         metrics=metrics, upload_backend=build_upload_backend(args), search_index=search_index,
+                         verify=args.verify, io_scheduler=io_scheduler, routing=build_routing(args))
+
+
+def build_routing(args):
+    """
+    Loads the routing rules selected with --routing
+    """
+    from core.routing_rules import RoutingRules
+    try:
+        return RoutingRules(args.routing)
+    except (OSError, ValueError) as error:
+        raise SystemExit(f"Regeldatei kann nicht gelesen werden: {error}")
+
+
+def parse_io_limit(value: str) -> tuple[str, tuple]:
+    """
+    Parses PATH=COPIES[:MiB/s] of --io-limit
+
+    :return: (path, (concurrent copies, bytes per second or None))
+    """
+    path, separator, limit = value.rpartition("=")
+    copies, _, bandwidth = limit.partition(":")
+    try:
+        if not separator or not path or int(copies) < 1:
+            raise ValueError(value)
+        return path, (int(copies), int(float(bandwidth) * 1024 * 1024) if bandwidth else None)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Ungültige Begrenzung {value}, erwartet PFAD=ANZAHL oder PFAD=ANZAHL:MiB/s") from None
+
+
+def build_upload_backend(args):
+    """
+    Creates the upload backend selected with --upload, None if files are only archived locally
+    """
+    if not args.upload:
+        return None
+    from core.upload_backend import create_backend
+    return create_backend(args.upload)
+
+
+def build_metrics(args):
+    """
+    Creates the metrics selected with --metrics, None if they are disabled
+    """
+    if args.metrics == "none":
+        return None
+    if args.metrics in ("jsonl", "prometheus") and not args.metrics_file:
+        raise SystemExit(f"--metrics {args.metrics} benötigt --metrics-file")
+    from core.metrics import Metrics, create_sink
+    if args.metrics == "log":
+        import logging
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    try:
+        return Metrics(create_sink(args.metrics, args.metrics_file))
+    except (OSError, ValueError) as error:
+        raise SystemExit(f"Metriken können nicht geschrieben werden: {error}")
+
+
+def run_jobs(args, jobs) -> int:
+    """
+    Processes the jobs on the processing engine and reports the results on stdout/stderr
+
+    :return: Number of failed jobs
+    """
+    from core.processing_engine import ProcessingEngine, ProcessingListener
+
+    class ConsoleListener(ProcessingListener):
+        def __init__(self) -> None:
+            self.failed = 0
+            self.sources = {}
+
+        def on_queued(self, job_id, job) -> None:
+            self.sources[job_id] = job.file_path
+
+        def on_finished(self, job_id, destination_path) -> None:
+            print(f"{self.sources.pop(job_id)} -> {destination_path}", flush=False)
+
+        def on_failed(self, job_id, error) -> None:
+            self.failed += 1
+            print(f"{self.sources.pop(job_id, '?')}: {error}", file=sys.stderr)
+
+        def on_feed_failed(self, error) -> None:
+            self.failed += 1
+            print(f"Abbruch beim Lesen der Dateiliste: {error}", file=sys.stderr)
+
+    listener = ConsoleListener()
+    file_processor = build_file_processor(args)
+    file_processor.recover()
+    engine = ProcessingEngine(file_processor, listener, max_workers=args.workers)
+    engine.submit_many(jobs).join()
+    engine.shutdown(wait=True)
+    file_processor.close()
+    file_processor.metrics.close()
+    if file_processor.upload_backend:
+        file_processor.upload_backend.close()
+    if file_processor.search_index:
+        file_processor.search_index.close()
+    sys.stdout.flush()
+    return listener.failed
+
+
+def command_process(args) -> int:
+    """
+    Processes the files given on the command line with one set of settings
+    """
+    from core.file_processor import FileJob
+    from core.directory_scanner import scan_paths
+
+    if not args.classify:
+        missing = [name for name, value in settings_from_args(args).items() if not value]
+        if missing:
+            print(f"Fehlende Einstellungen: {', '.join(missing)} (oder --classify verwenden)", file=sys.stderr)
+            return 2
+    # scan_paths skips what does not exist, a mistyped argument must not pass unnoticed
+    not_found = [path for path in args.paths if not os.path.exists(path)]
+    for path in not_found:
+        print(f"{path}: Datei oder Ordner nicht gefunden", file=sys.stderr)
+    paths = [path for path in args.paths if path not in not_found]
+    # Archived files are not picked up again, whether the archive lies in a scanned folder or below each file
+    files = scan_paths(paths, routing=build_routing(args), skip_dirs=[args.archive_dir] if args.archive_dir else ())
+
+    if args.classify:
+        errors = []
+        failed = run_jobs(args, classified_jobs(files, settings_from_args(args), errors))
+        for error in errors:
+            print(error, file=sys.stderr)
+        return 1 if failed or errors or not_found else 0
+
+    failed = run_jobs(args, (FileJob(file_path, **settings_from_args(args)) for file_path in files))
+    return 1 if failed or not_found else 0
+
+
+def command_classify(args) -> int:
+    """
+    Prints the settings inferred for each file with their confidence
+    """
+    from core.directory_scanner import scan_paths
+    from core.file_classifier import FIELDS, FileClassifier
+
+    classifier = FileClassifier(threshold=args.threshold)
+    for file_path in scan_paths(args.paths):
+        classification = classifier.classify(file_path)
+        fields = " ".join(
+            f"{name}={classification.values[name] or '-'}({classification.confidence[name]:.2f})" for name in FIELDS
+        )
+        print(f"{file_path}\t{fields}")
+    return 0
+
+
+def command_manifest(args) -> int:
+    """
+    Processes the files listed in a manifest, each with its own settings
+    """
+    errors = []
+    try:
+        jobs = manifest_jobs(args.manifest, errors)
+    except OSError as error:
+        print(f"Manifest kann nicht gelesen werden: {error}", file=sys.stderr)
+        return 1
+    failed = run_jobs(args, jobs)
+    for error in errors:
+        print(error, file=sys.stderr)
+    return 1 if failed or errors else 0
+
+
+def command_catalog(args) -> int:
+    """
+    Imports an archive tree into the catalog or queries it
+    """
+    from core.archive_catalog import ArchiveCatalog
+
+    catalog = ArchiveCatalog()
+    if args.catalog_command == "import":
+        print(f"{catalog.import_tree(args.archive_dir, args.workers, build_routing(args))} Dateien importiert")
+        return 0
+
+    entries = catalog.query(args.specialization, args.exam_part, args.year, args.period, args.file_type, args.limit)
+    for entry in entries:
+        print(entry.path)
+    return 0
+
+
+def command_search(args) -> int:
+    """
+    Searches the full-text index of the archived files
+    """
+    from core.search_index import SearchIndex
+
+    search_index = SearchIndex()
+    hits = search_index.search(" ".join(args.query), args.specialization, args.exam_part, args.year, args.period,
+                               args.file_type, args.limit)
+    for hit in hits:
+        print(hit.path)
+        print(f"    {' '.join(hit.snippet.split())}")
+    search_index.close()
+    return 0 if hits else 1
+
+
+def command_reindex(args) -> int:
+    """
+    Brings the full-text index up to date with the catalog, only new and changed files are extracted
+    """
+    from core.archive_catalog import ArchiveCatalog
+    from core.search_index import SearchIndex
+
+    catalog = ArchiveCatalog()
+    search_index = SearchIndex(max_workers=args.workers)
+    extracted, removed = search_index.update(catalog.query(), prune=args.prune)
+    print(f"{extracted} Dateien indiziert, {removed} entfernt, {search_index.count()} im Index")
+    search_index.close()
+    catalog.close()
+    return 0
+
+
+def command_verify_archive(args) -> int:
+    """
+    Checks the archived files against the hashes stored in the catalog
+    """
+    from core.archive_catalog import ArchiveCatalog
+    from core.archive_verifier import ArchiveVerifier
+
+    catalog = ArchiveCatalog()
+    entries = catalog.query(args.specialization, args.exam_part, args.year, args.period, args.file_type)
+    labels = {"changed": "GEÄNDERT", "missing": "FEHLT"}
+    counts = {}
+    for result in ArchiveVerifier(catalog, args.workers).verify(entries, record=args.record):
+        counts[result.status] = counts.get(result.status, 0) + 1
+        if result.status in labels:
+            print(f"{labels[result.status]} {result.path}", flush=True)
+    catalog.close()
+    print(f"{counts.get('ok', 0)} in Ordnung, {counts.get('changed', 0)} geändert, {counts.get('missing', 0)} fehlen, "
+          f"{counts.get('recorded', 0)} Prüfsummen neu erfasst, {counts.get('unhashed', 0)} ohne Prüfsumme")
+    return 1 if counts.get("changed") or counts.get("missing") else 0
+
+
+def command_watch(args) -> int:
+    """
+    Watches inbox directories and archives every completed file with one set of settings
+    """
+    import signal
+    import threading
+    from core.folder_watcher import FolderWatcher
+    from core.processing_engine import ProcessingListener
+
+    class ConsoleListener(ProcessingListener):
+        def on_finished(self, job_id, destination_path) -> None:
+            print(destination_path, flush=True)
+
+        def on_failed(self, job_id, error) -> None:
+            print(error, file=sys.stderr, flush=True)
+
+    file_processor = build_file_processor(args)
+    file_processor.recover()
+    preset = (args.specialization, args.exam_part, args.file_type, args.year, args.period)
+    watcher = FolderWatcher(args.inboxes, preset, file_processor, ConsoleListener(), settle_time=args.settle_time,
+                            poll_interval=args.poll_interval, use_inotify=False if args.poll else None,
+                            max_workers=args.workers)
+    signal.signal(signal.SIGTERM, lambda *_: watcher.stop())
+    stopped = threading.Event()
+    threading.Thread(target=flush_metrics_periodically, args=(file_processor.metrics, stopped), daemon=True).start()
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        watcher.stop()
+    stopped.set()
+    file_processor.close()
+    file_processor.metrics.close()
+    if file_processor.upload_backend:
+        file_processor.upload_backend.close()
+    if file_processor.search_index:
+        file_processor.search_index.close()
+    return 0
+
+
+def flush_metrics_periodically(metrics, stopped, interval: float = 10.0) -> None:
+    """
+    Exports the metrics of a long running command every interval seconds until stopped is set
+    """
+    while not stopped.wait(interval):
+        metrics.flush()
+
+
+def command_recover(args) -> int:
+    """
+    Finishes or undoes the batches that were interrupted by a crash
+    """
+    file_processor = build_file_processor(args)
+    moved = file_processor.recover(roll_back=args.roll_back)
+    file_processor.close()
+    file_processor.metrics.close()
+    if file_processor.upload_backend:
+        file_processor.upload_backend.close()
+    if file_processor.search_index:
+        file_processor.search_index.close()
+    print(f"{moved} Dateien {'zurückverschoben' if args.roll_back else 'nachverschoben'}")
+    return 0
+
+
+def command_migrate(args) -> int:
+    """
+    Moves an archive to a new directory layout, finishes an interrupted migration first
+    """
+    from core.archive_migration import ArchiveMigration
+    from core.archive_catalog import ArchiveCatalog
+    from core.dedup_index import DedupIndex
+    from core.search_index import SearchIndex
+
+    def describe(step) -> str:
+        if step.kind == "rename":
+            return f"Ordner umbenennen: {step.source} -> {step.target}"
+        action = "verschieben" if step.same_device else "kopieren"
+        return f"{step.files} Dateien {action}: {step.source} -> {step.target}"
+
+    def report(index, step) -> None:
+        print(f"[{index + 1}/{total}] {describe(step)}", flush=True)
+
+    routing = build_routing(args) if args.to_layout is None or args.from_layout is None else None
+    catalog, dedup_index, search_index = (None, None, None) if args.dry_run else (ArchiveCatalog(), DedupIndex(), SearchIndex())
+    migration = ArchiveMigration(catalog, dedup_index, search_index, verify=args.verify)
+    try:
+        if migration.pending():
+            if args.dry_run:
+                print("Ein unterbrochener Umbau wird beim nächsten Aufruf ohne --dry-run zuerst abgeschlossen")
+            else:
+                print("Unterbrochener Umbau wird abgeschlossen")
+                migration.resume(lambda index, step: print(f"[{index + 1}] {describe(step)}", flush=True))
+        try:
+            plan = migration.plan(args.archive_dir, args.to_layout, args.rename, args.from_layout,
+                                  args.target, routing)
+        except ValueError as error:
+            print(f"Umbau nicht möglich: {error}", file=sys.stderr)
+            return 1
+        total = len(plan.steps)
+        if args.dry_run:
+            for step in plan.steps:
+                print(describe(step))
+        print(f"{plan.directory_renames} Ordner umbenennen, {plan.file_renames} Dateien einzeln umbenennen, "
+              f"{plan.files_to_copy} Dateien kopieren ({plan.bytes_to_copy / 1024 / 1024:.1f} MiB), "
+              f"{plan.unchanged} Ordner unverändert")
+        if not args.dry_run and plan.steps:
+            migration.execute(plan, report)
+            print("Umbau abgeschlossen")
+    finally:
+        for store in (catalog, dedup_index, search_index):
+            if store is not None:
+                store.close()
+    return 0
+
+
+def command_pack(args) -> int:
+    """
+    Bundles a slice of the archive into one compressed container with a sidecar index
+    """
+    from core.archive_pack import ArchivePacker, INDEX_SUFFIX, walk_slice
+
+    container_format = args.format or ("tar.zst" if args.output.endswith((".tar.zst", ".tzst")) else "zip")
+    output = os.path.abspath(args.output)
+    exclude = (output, output + ".part", output + INDEX_SUFFIX, output + INDEX_SUFFIX + ".part")
+    settings = settings_from_args(args)
+    if any(value is not None for value in settings.values()):
+        # The catalog knows the settings of every file, whatever directory layout the routing rules produced
+        from core.archive_catalog import ArchiveCatalog
+
+        catalog = ArchiveCatalog()
+        root = os.path.abspath(args.archive_dir)
+        entries = catalog.query(args.specialization, args.exam_part, args.year, args.period, args.file_type)
+        catalog.close()
+        files = [(entry.path, os.path.relpath(entry.path, root).replace(os.sep, "/")) for entry in sorted(
+            entries, key=lambda entry: entry.path) if entry.path.startswith(root + os.sep) and entry.path not in exclude]
+    else:
+        files = walk_slice(args.archive_dir, exclude)
+    try:
+        packer = ArchivePacker(container_format, args.workers, args.level)
+    except ValueError as error:
+        print(f"Packen nicht möglich: {error}", file=sys.stderr)
+        return 1
+    result = packer.pack(files, args.output)
+    for path, error in result.skipped:
+        print(f"ÜBERSPRUNGEN {path}: {error}", file=sys.stderr)
+    print(f"{result.members} Dateien gepackt, {result.stored} Inhalte gespeichert, "
+          f"{result.bytes_in / 1024 / 1024:.1f} MiB -> {result.bytes_out / 1024 / 1024:.1f} MiB, "
+          f"{len(result.skipped)} übersprungen")
+    return 1 if result.skipped else 0
+
+
+def command_unpack(args) -> int:
+    """
+    Extracts single members or all members of a container written by pack
+    """
+    from core.archive_pack import PackReader
+
+    reader = PackReader(args.container)
+    try:
+        names = args.members or reader.names()
+        for name in names:
+            destination = os.path.abspath(os.path.join(args.output_dir, *name.split("/")))
+            if not destination.startswith(os.path.abspath(args.output_dir) + os.sep):
+                print(f"Ungültiger Name im Container: {name}", file=sys.stderr)
+                return 1
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            try:
+                reader.extract(name, destination)
+            except KeyError:
+                print(f"Nicht im Container: {name}", file=sys.stderr)
+                return 1
+        print(f"{len(names)} Dateien entpackt")
+    finally:
+        reader.close()
+    return 0
+
+
+def parse_rename(value: str) -> tuple[str, dict]:
+    """
+    Parses FELD:ALT=NEU of --rename
+
+    :return: (setting, {old value: new value})
+    """
+    from core.archive_migration import LAYOUT_FIELDS
+
+    setting, _, mapping = value.partition(":")
+    old, separator, new = mapping.partition("=")
+    if setting not in LAYOUT_FIELDS or not old or not separator or not new:
+        raise argparse.ArgumentTypeError(
+            f"Ungültige Umbenennung {value}, erwartet FELD:ALT=NEU mit FELD aus {', '.join(LAYOUT_FIELDS)}"
+        )
+    return setting, {old: new}
+
+
+class MergeRenames(argparse.Action):
+    """
+    Collects repeated --rename options into setting -> {old value: new value}
+    """
+    def __call__(self, parser, namespace, values, option_string=None) -> None:
+        renames = getattr(namespace, self.dest) or {}
+        setting, mapping = values
+        renames.setdefault(setting, {}).update(mapping)
+        setattr(namespace, self.dest, renames)
+
+
+def add_settings_arguments(parser, required: bool) -> None:
+    """
+    Adds the five settings as options
+    """
+    parser.add_argument("--specialization", "-s", choices=Config.get_specializations(), required=required, help="Fachrichtung")
+    parser.add_argument("--exam-part", "-e", choices=Config.get_exam_parts(), required=required, help="Prüfteil")
+    parser.add_argument("--file-type", "-t", choices=Config.get_file_types(), required=required, help="Dateityp")
+    parser.add_argument("--year", "-y", required=required, help="Jahr")
+    parser.add_argument("--period", "-p", choices=Config.get_periods(), required=required, help="Abschlusszeitraum")
+
+
+def add_processing_arguments(parser) -> None:
+    """
+    Adds the options shared by all commands that archive files
+    """
+    parser.add_argument("--archive-dir", "-a", help="Zielordner des Archivs (Standard: Ordner der jeweiligen Datei)")
+    parser.add_argument("--routing", default=None,
+                        help="Regeldatei (JSON oder TOML) für Zielordner und Dateinamen (Standard: routing.json im Datenordner)")
+    parser.add_argument("--workers", "-w", type=int, default=None, help="Anzahl paralleler Verarbeitungen")
+    parser.add_argument("--no-dedup", action="store_true", help="Duplikate nicht erkennen")
+    parser.add_argument("--no-catalog", action="store_true", help="Katalog nicht aktualisieren")
+    parser.add_argument("--no-index", action="store_true", help="Volltextindex nicht aktualisieren")
+    add_verify_argument(parser)
+    parser.add_argument("--io-limit", action="append", type=parse_io_limit, metavar="PFAD=ANZAHL[:MiB/s]",
+                        help="Gleichzeitige Kopien und Bandbreite für das Laufwerk von PFAD begrenzen (mehrfach möglich)")
+    parser.add_argument("--no-io-scheduler", action="store_true",
+                        help="Kopien nicht je Laufwerk begrenzen und Umbenennungen nicht vorziehen")
+    parser.add_argument("--metrics", choices=("none", "log", "jsonl", "prometheus"), default="none",
+                        help="Zeiten je Verarbeitungsschritt und Zähler ausgeben")
+    parser.add_argument("--metrics-file", help="Ausgabedatei für --metrics jsonl bzw. prometheus")
+    add_upload_argument(parser)
+
+
+def add_verify_argument(parser) -> None:
+    """
+    Adds the option enabling the verification of copied files
+    """
+    parser.add_argument("--verify", action="store_true",
+                        help="Kopien vor dem Löschen der Quelle per Prüfsumme vergleichen und Prüfsummen im Katalog speichern")
+
+
+def add_upload_argument(parser) -> None:
+    """
+    Adds the option selecting the central archive the files are pushed to
+    """
+    parser.add_argument("--upload", metavar="ZIEL",
+                        help="Archivierte Dateien zusätzlich hochladen: Ordner, http(s)://… (WebDAV) oder s3://bucket/präfix?endpoint=…")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Creates the argument parser with all commands
+    """
+    parser = argparse.ArgumentParser(prog="pruefungsdateien", description="Prüfungsdateien ohne Oberfläche verarbeiten")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    process_parser = commands.add_parser("process", help="Dateien und Ordner mit einer Einstellung verarbeiten")
+    process_parser.add_argument("paths", nargs="+", help="Dateien oder Ordner")
+    add_settings_arguments(process_parser, required=False)
+    add_processing_arguments(process_parser)
+    process_parser.add_argument("--classify", action="store_true",
+                                help="Einstellungen je Datei erkennen, angegebene Einstellungen dienen als Ersatz")
+    process_parser.set_defaults(handler=command_process)
+
+    classify_parser = commands.add_parser("classify", help="Erkannte Einstellungen von Dateien anzeigen")
+    classify_parser.add_argument("paths", nargs="+", help="Dateien oder Ordner")
+    classify_parser.add_argument("--threshold", type=float, default=None, help="Mindestsicherheit je Feld (0 bis 1)")
+    classify_parser.set_defaults(handler=command_classify)
+
+    manifest_parser = commands.add_parser("manifest", help="Dateien aus einer CSV- oder JSONL-Liste verarbeiten")
+    manifest_parser.add_argument("manifest", help="Manifest mit den Spalten " + ", ".join(MANIFEST_FIELDS))
+    add_processing_arguments(manifest_parser)
+    manifest_parser.set_defaults(handler=command_manifest)
+
+    catalog_parser = commands.add_parser("catalog", help="Archivkatalog importieren oder abfragen")
+    catalog_commands = catalog_parser.add_subparsers(dest="catalog_command", required=True)
+    import_parser = catalog_commands.add_parser("import", help="Bestehendes Archiv in den Katalog übernehmen")
+    import_parser.add_argument("archive_dir", help="Wurzelordner des Archivs")
+    import_parser.add_argument("--workers", "-w", type=int, default=None, help="Anzahl paralleler Verzeichnisdurchläufe")
+    import_parser.add_argument("--routing", default=None,
+                               help="Regeldatei, mit der das Archiv angelegt wurde (Standard: routing.json im Datenordner)")
+    query_parser = catalog_commands.add_parser("query", help="Archivierte Dateien suchen")
+    add_settings_arguments(query_parser, required=False)
+    query_parser.add_argument("--limit", type=int, default=None, help="Maximale Anzahl Treffer")
+    catalog_parser.set_defaults(handler=command_catalog)
+
+    search_parser = commands.add_parser("search", help="Archivierte Dateien nach ihrem Inhalt durchsuchen")
+    search_parser.add_argument("query", nargs="+", help="Suchbegriffe, alle müssen vorkommen; Wort* sucht nach Wortanfängen")
+    add_settings_arguments(search_parser, required=False)
+    search_parser.add_argument("--limit", type=int, default=20, help="Maximale Anzahl Treffer (Standard: 20)")
+    search_parser.set_defaults(handler=command_search)
+
+    reindex_parser = commands.add_parser("reindex", help="Volltextindex mit dem Katalog abgleichen")
+    reindex_parser.add_argument("--workers", "-w", type=int, default=None, help="Anzahl paralleler Textextraktionen")
+    reindex_parser.add_argument("--prune", action="store_true", help="Nicht mehr katalogisierte Dateien aus dem Index entfernen")
+    reindex_parser.set_defaults(handler=command_reindex)
+
+    verify_parser = commands.add_parser("verify-archive", help="Archivierte Dateien mit den gespeicherten Prüfsummen vergleichen")
+    add_settings_arguments(verify_parser, required=False)
+    verify_parser.add_argument("--workers", "-w", type=int, default=None, help="Anzahl paralleler Prüfprozesse")
+    verify_parser.add_argument("--record", action="store_true", help="Fehlende Prüfsummen berechnen und speichern")
+    verify_parser.set_defaults(handler=command_verify_archive)
+
+    watch_parser = commands.add_parser("watch", help="Eingangsordner überwachen und neue Dateien verarbeiten")
+    watch_parser.add_argument("inboxes", nargs="+", help="Zu überwachende Ordner")
+    add_settings_arguments(watch_parser, required=True)
+    add_processing_arguments(watch_parser)
+    watch_parser.add_argument("--settle-time", type=float, default=None, help="Sekunden, die eine Datei unverändert sein muss")
+    watch_parser.add_argument("--poll-interval", type=float, default=None, help="Sekunden zwischen zwei Prüfungen")
+    watch_parser.add_argument("--poll", action="store_true", help="Abfragen statt inotify verwenden")
+    watch_parser.set_defaults(handler=command_watch)
+
+    recover_parser = commands.add_parser("recover", help="Unterbrochene Stapel abschließen oder rückgängig machen")
+    recover_parser.add_argument("--roll-back", action="store_true", help="Bereits verschobene Dateien zurückverschieben")
+    add_processing_arguments(recover_parser)
+    recover_parser.set_defaults(handler=command_recover)
+
+    migrate_parser = commands.add_parser("migrate", help="Archiv in eine neue Ordnerstruktur umbauen")
+    migrate_parser.add_argument("archive_dir", help="Wurzelordner des Archivs")
+    migrate_parser.add_argument("--to-layout", default=None,
+                                help="Neue Ordnerstruktur, z. B. {year}/{specialization}/{exam_part}-{period} "
+                                     "(Standard: Ordnerstruktur der Regeldatei)")
+    migrate_parser.add_argument("--from-layout", default=None,
+                                help="Bisherige Ordnerstruktur, eine Einstellung je Ebene "
+                                     "(Standard: Ordnerstrukturen der Regeldatei)")
+    migrate_parser.add_argument("--routing", default=None,
+                                help="Regeldatei für fehlende Ordnerstrukturen (Standard: routing.json im Datenordner)")
+    migrate_parser.add_argument("--rename", type=parse_rename, action=MergeRenames, metavar="FELD:ALT=NEU",
+                                help="Wert einer Einstellung umbenennen, z. B. specialization:FIAE=AE (mehrfach möglich)")
+    migrate_parser.add_argument("--target", default=None, help="Neuer Wurzelordner (Standard: archive_dir)")
+    migrate_parser.add_argument("--dry-run", action="store_true",
+                                help="Nur den Plan und den geschätzten Aufwand anzeigen, nichts verschieben")
+    add_verify_argument(migrate_parser)
+    migrate_parser.set_defaults(handler=command_migrate)
+
+    pack_parser = commands.add_parser("pack", help="Teil des Archivs in einen komprimierten Container bündeln")
+    pack_parser.add_argument("archive_dir", help="Wurzelordner des Archivs oder ein Teilordner")
+    pack_parser.add_argument("output", help="Container, .zip oder .tar.zst")
+    add_settings_arguments(pack_parser, required=False)
+    pack_parser.add_argument("--format", choices=("zip", "tar.zst"), default=None,
+                             help="Containerformat (Standard: nach der Endung von output)")
+    pack_parser.add_argument("--workers", "-w", type=int, default=None, help="Anzahl paralleler Komprimierungen")
+    pack_parser.add_argument("--level", type=int, default=None, help="Kompressionsstufe")
+    pack_parser.set_defaults(handler=command_pack)
+
+    unpack_parser = commands.add_parser("unpack", help="Dateien aus einem Container entpacken")
+    unpack_parser.add_argument("container", help="Mit pack erstellter Container")
+    unpack_parser.add_argument("members", nargs="*", help="Zu entpackende Dateien (Standard: alle)")
+    unpack_parser.add_argument("--output-dir", "-o", default=".", help="Zielordner (Standard: aktueller Ordner)")
+    unpack_parser.set_defaults(handler=command_unpack)
+
+    return parser
+
+
+def main(argv: list[str] = None) -> int:
+    """
+    Run the command line interface
+
+    Returns:
+        int: The exit status of the command
+    """
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
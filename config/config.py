@@ -1,5 +1,7 @@
 # config/config.py
 
+import os
+
 class Config:
     @staticmethod
     def get_specializations() -> list[str]:
@@ -16,7 +18,110 @@ class Config:
     @staticmethod
     def get_file_types() -> list[str]:
         return ["Löser", "Aufgabenblatt", "Belegsatz"]
-    
+
+    @staticmethod
+    def get_max_workers() -> int:
+        return 4
+
+    @staticmethod
+    def get_index_workers() -> int:
+        # Text extraction is CPU bound, one process per core
+        return os.cpu_count() or 1
+
+    @staticmethod
+    def get_queue_size() -> int:
+        return 256
+
+    @staticmethod
+    def get_batch_size() -> int:
+        return 64
+
+    @staticmethod
+    def get_transfer_chunk_size() -> int:
+        return 8 * 1024 * 1024
+
+    @staticmethod
+    def get_fsync_policy() -> str:
+        return "none"
+
+    @staticmethod
+    def get_device_limits() -> dict:
+        # Kind of device -> (concurrent copies, bytes per second or None for no cap)
+        return {
+            "rotational": (1, None),
+            "removable": (1, None),
+            "ssd": (4, None),
+            "network": (8, None),
+            "memory": (8, None),
+            "unknown": (2, None),
+        }
+
+    @staticmethod
+    def get_rename_workers() -> int:
+        return 2
+
+    @staticmethod
+    def get_verify_transfers() -> bool:
+        return False
+
+    @staticmethod
+    def get_hash_workers() -> int:
+        # Hashing is CPU bound once the data is cached, one process per core
+        return os.cpu_count() or 1
+
+    @staticmethod
+    def get_watch_settle_time() -> float:
+        return 2.0
+
+    @staticmethod
+    def get_watch_poll_interval() -> float:
+        return 1.0
+
+    @staticmethod
+    def get_classification_threshold() -> float:
+        return 0.5
+
+    @staticmethod
+    def get_upload_chunk_size() -> int:
+        return 8 * 1024 * 1024
+
+    @staticmethod
+    def get_upload_workers() -> int:
+        return 4
+
+    @staticmethod
+    def get_upload_max_in_flight() -> int:
+        return 64 * 1024 * 1024
+
+    @staticmethod
+    def get_pack_workers() -> int:
+        # Compression is CPU bound, one thread per core
+        return os.cpu_count() or 1
+
+    @staticmethod
+    def get_pack_max_in_flight() -> int:
+        return 64 * 1024 * 1024
+
+    @staticmethod
+    def get_db_timeout() -> float:
+        # Seconds a database write waits while another process on this machine is writing
+        return 30.0
+
+    @staticmethod
+    def get_routing_rules_path() -> str:
+        # JSON or TOML (by extension), the built-in layout is used while the file does not exist
+        return os.path.join(Config.get_data_dir(), "routing.json")
+
+    @staticmethod
+    def get_routing_reload_interval() -> float:
+        # Seconds between two checks of the rules file for changes
+        return 2.0
+
+    @staticmethod
+    def get_data_dir() -> str:
+        base = os.environ.get("APPDATA") or os.path.expanduser("~")
+        return os.path.join(base, ".pruefungsdateien")
+
     @staticmethod
     def get_version() -> str:
         return "2.1"
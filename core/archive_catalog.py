@@ -0,0 +1,239 @@
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from config.config import Config
+
+_IMPORT_CHUNK_SIZE = 5000
+_COLUMNS = "path, specialization, exam_part, year, period, file_type, size, archived_at"
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    """
+    An archived file together with the settings it was archived under
+    """
+    path: str
+    specialization: str
+    exam_part: str
+    year: str
+    period: str
+    file_type: str
+    size: int
+    archived_at: float
+    # BLAKE2b digest recorded when the file was archived with verification, None if unknown
+    content_hash: bytes = None
+
+
+class ArchiveCatalog:
+    """
+    Persistent catalog of the archived files, indexed on the five settings
+    """
+    def __init__(self, db_path: str = None) -> None:
+        """
+        Opens or creates the catalog
+
+        :param db_path: SQLite database file, catalog.sqlite in Config.get_data_dir() if omitted
+        """
+        if db_path is None:
+            os.makedirs(Config.get_data_dir(), exist_ok=True)
+            db_path = os.path.join(Config.get_data_dir(), "catalog.sqlite")
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, timeout=Config.get_db_timeout(), check_same_thread=False,
+                                           isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " path TEXT PRIMARY KEY, specialization TEXT NOT NULL, exam_part TEXT NOT NULL, year TEXT NOT NULL,"
+            " period TEXT NOT NULL, file_type TEXT NOT NULL, size INTEGER NOT NULL, archived_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS entries_settings ON entries (specialization, exam_part, year, period, file_type);"
+            "CREATE INDEX IF NOT EXISTS entries_year ON entries (year, period);"
+            "CREATE INDEX IF NOT EXISTS entries_file_type ON entries (file_type, year);"
+        )
+        columns = [row[1] for row in self._connection.execute("PRAGMA table_info(entries)")]
+        if "content_hash" not in columns:
+            # Catalogs created before verification was added
+            self._connection.execute("ALTER TABLE entries ADD COLUMN content_hash BLOB")
+
+    def add(self, path: str, specialization: str, exam_part: str, year: str, period: str, file_type: str,
+            content_hash: bytes = None) -> None:
+        """
+        Records an archived file
+
+        :param path: Path of the archived file
+        :param content_hash: BLAKE2b digest of the file if it is known, used by verify-archive
+        """
+        path = os.path.abspath(path)
+        entry = (path, specialization, exam_part, year, period, file_type, os.path.getsize(path), time.time(),
+                 content_hash)
+        with self._transaction():
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO entries ({_COLUMNS}, content_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", entry
+            )
+
+    def set_hashes(self, hashes: list[tuple[str, bytes]]) -> None:
+        """
+        Records the content hashes of catalogued files
+
+        :param hashes: (path, BLAKE2b digest) pairs
+        """
+        with self._transaction():
+            self._connection.executemany("UPDATE entries SET content_hash = ? WHERE path = ?",
+                                         [(content_hash, path) for path, content_hash in hashes])
+
+    def relocate(self, moves: list[tuple[str, str, dict]]) -> None:
+        """
+        Updates the paths and settings of moved files, e.g. after the archive has been reorganized
+
+        :param moves: (old path, new path, settings) per moved file or directory. For a directory all files below
+                      it are updated. settings maps specialization, exam_part, year and period to their new values
+        """
+        with self._transaction():
+            for old_path, new_path, settings in moves:
+                old_path, new_path = os.path.abspath(old_path), os.path.abspath(new_path)
+                assignments = "".join(f", {column} = ?" for column in settings)
+                self._connection.execute(
+                    f"UPDATE OR REPLACE entries SET path = ? || substr(path, ?){assignments}"
+                    " WHERE path = ? OR (path > ? AND path < ?)",
+                    (new_path, len(old_path) + 1, *settings.values(), old_path, old_path + os.sep,
+                     old_path + chr(ord(os.sep) + 1))
+                )
+
+    def remove(self, path: str) -> None:
+        """
+        Removes an archived file from the catalog
+        """
+        with self._transaction():
+            self._connection.execute("DELETE FROM entries WHERE path = ?", (os.path.abspath(path),))
+
+    def query(self, specialization: str = None, exam_part: str = None, year: str = None, period: str = None,
+              file_type: str = None, limit: int = None) -> list[CatalogEntry]:
+        """
+        Returns the archived files matching all given settings, omitted settings match everything
+
+        :return: Matching entries ordered by path
+        """
+        filters = {
+            "specialization": specialization, "exam_part": exam_part, "year": year,
+            "period": period, "file_type": file_type,
+        }
+        conditions = [f"{column} = ?" for column, value in filters.items() if value is not None]
+        parameters = [value for value in filters.values() if value is not None]
+        sql = f"SELECT {_COLUMNS}, content_hash FROM entries"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY path"
+        if limit is not None:
+            sql += " LIMIT ?"
+            parameters.append(limit)
+        with self._lock:
+            rows = self._connection.execute(sql, parameters).fetchall()
+        return [CatalogEntry(*row) for row in rows]
+
+    def count(self) -> int:
+        """
+        :return: Number of catalogued files
+        """
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def import_tree(self, archive_root: str, max_workers: int = None, routing=None) -> int:
+        """
+        Catalogs all files of an existing archive tree
+        The settings of every file are read from its path with the routing rules the tree was archived with,
+        <specialization>/<exam_part>/<year>/<period>/<file_type>_<timestamp>.ext without a rules file. Files
+        whose path no template of the rules produces are skipped. The top-level directories are walked in parallel
+
+        :param archive_root: Root directory of the archive
+        :param max_workers: Number of walker threads, Config.get_max_workers() if omitted
+        :param routing: RoutingRules of the archive, RoutingRules() if omitted
+        :return: Number of imported files
+        """
+        if routing is None:
+            from core.routing_rules import RoutingRules
+            routing = RoutingRules()
+        archive_root = os.path.abspath(archive_root)
+        subtrees = [entry.path for entry in _scandir_dirs(archive_root)]
+        imported = 0
+        with ThreadPoolExecutor(max_workers=max_workers or Config.get_max_workers()) as executor:
+            for rows in executor.map(lambda subtree: _walk_subtree(archive_root, subtree, routing), subtrees):
+                # A stored hash is kept as long as the size matches, verify-archive checks the rest
+                for start in range(0, len(rows), _IMPORT_CHUNK_SIZE):
+                    with self._transaction():
+                        self._connection.executemany(
+                            f"INSERT INTO entries ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                            " ON CONFLICT (path) DO UPDATE SET specialization = excluded.specialization,"
+                            " exam_part = excluded.exam_part, year = excluded.year, period = excluded.period,"
+                            " file_type = excluded.file_type, size = excluded.size, archived_at = excluded.archived_at,"
+                            " content_hash = CASE WHEN size = excluded.size THEN content_hash END",
+                            rows[start:start + _IMPORT_CHUNK_SIZE]
+                        )
+                imported += len(rows)
+        return imported
+
+    def close(self) -> None:
+        """
+        Closes the database connection
+        """
+        with self._lock:
+            self._connection.close()
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Runs the enclosed statements in one transaction while holding the lock
+        """
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+
+def _scandir_dirs(path: str) -> list:
+    """
+    :return: The non-hidden subdirectories of path
+    """
+    try:
+        with os.scandir(path) as entries:
+            return [entry for entry in entries if not entry.name.startswith(".") and entry.is_dir(follow_symlinks=False)]
+    except OSError:
+        return []
+
+
+def _walk_subtree(archive_root: str, directory: str, routing) -> list[tuple]:
+    """
+    Collects the catalog rows of the files below one top-level directory of the archive
+    """
+    rows = []
+    pending = [directory]
+    while pending:
+        current = pending.pop()
+        relative = current[len(archive_root) + 1:]
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.name.startswith("."):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                        continue
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    settings = routing.parse(os.path.join(relative, entry.name))
+                    if settings is None:
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                    rows.append((entry.path, settings["specialization"], settings["exam_part"], settings["year"],
+                                 settings["period"], settings["file_type"], stat.st_size, stat.st_mtime))
+        except OSError:
+            continue
+    return rows
@@ -0,0 +1,501 @@
+import json
+import os
+import re
+from dataclasses import dataclass, asdict
+
+from config.config import Config
+from core.dedup_index import hash_file
+from core.file_transfer import FileTransfer
+from core.name_allocator import NameAllocator
+
+# Settings that make up the directory layout of the archive
+LAYOUT_FIELDS = ("specialization", "exam_part", "file_type", "year", "period")
+DEFAULT_LAYOUT = "{specialization}/{exam_part}/{year}/{period}"
+_FIELD = re.compile(r"\{(\w+)\}")
+
+
+@dataclass
+class MigrationStep:
+    """
+    One step of a migration
+    A "rename" step moves a whole directory with a single rename, a "merge" step moves the files of one
+    leaf directory one by one into a directory that already exists or is on another filesystem
+    """
+    kind: str
+    source: str
+    target: str
+    # [old leaf directory, new leaf directory, settings] of the leaf directories moved by the step
+    leaves: list
+    # Files and bytes of a merge step
+    files: int = 0
+    bytes: int = 0
+    # False if the files of a merge step are copied to another filesystem
+    same_device: bool = True
+
+
+@dataclass
+class MigrationPlan:
+    """
+    The steps that move an archive from one directory layout to another
+    """
+    archive_root: str
+    target_root: str
+    steps: list
+    # Leaf directories that stay where they are
+    unchanged: int
+
+    @property
+    def directory_renames(self) -> int:
+        return sum(1 for step in self.steps if step.kind == "rename")
+
+    @property
+    def file_renames(self) -> int:
+        return sum(step.files for step in self.steps if step.kind == "merge" and step.same_device)
+
+    @property
+    def files_to_copy(self) -> int:
+        return sum(step.files for step in self.steps if step.kind == "merge" and not step.same_device)
+
+    @property
+    def bytes_to_copy(self) -> int:
+        return sum(step.bytes for step in self.steps if step.kind == "merge" and not step.same_device)
+
+
+class ArchiveMigration:
+    """
+    Moves an archive to a new directory layout, e.g. after a specialization was renamed or the levels were reordered
+    The plan moves the highest directories whose whole content keeps its relative layout with one rename each,
+    so renaming a specialization is a single rename regardless of the number of files. Only leaf directories
+    that are merged into an existing directory or moved to another filesystem are moved file by file.
+    The plan and every file move are written to a journal first, an interrupted migration is finished by resume
+    """
+    def __init__(self, catalog=None, dedup_index=None, search_index=None, file_transfer: FileTransfer = None,
+                 verify: bool = False, journal_path: str = None) -> None:
+        """
+        Initializes the migration
+
+        :param catalog: Optional ArchiveCatalog whose paths and settings are updated
+        :param dedup_index: Optional DedupIndex whose paths are updated
+        :param search_index: Optional SearchIndex whose paths and settings are updated
+        :param file_transfer: Moves the files of merge steps, a default FileTransfer if omitted
+        :param verify: Compare copies to another filesystem with their source before it is deleted
+        :param journal_path: Journal file, migration.jsonl in Config.get_data_dir() if omitted
+        """
+        self.catalog = catalog
+        self.dedup_index = dedup_index
+        self.search_index = search_index
+        self.file_transfer = file_transfer or FileTransfer()
+        self.verify = verify
+        if journal_path is None:
+            os.makedirs(Config.get_data_dir(), exist_ok=True)
+            journal_path = os.path.join(Config.get_data_dir(), "migration.jsonl")
+        self.journal_path = journal_path
+        self._name_allocator = NameAllocator()
+        self._journal = None
+
+    def plan(self, archive_root: str, to_layout: str = None, renames: dict = None, from_layout: str = None,
+             target_root: str = None, routing=None) -> MigrationPlan:
+        """
+        Plans a migration without changing anything
+
+        :param archive_root: Root directory of the archive
+        :param to_layout: New layout, directory levels separated by "/" with the settings in braces, e.g.
+                          "{year}/{specialization}/{exam_part}-{period}". Every setting may only occur once.
+                          If omitted every leaf directory gets the path the routing rules give its settings
+        :param renames: Setting -> {old value: new value}, e.g. {"specialization": {"FIAE": "AE"}}
+        :param from_layout: Current layout, the path templates of the routing rules if omitted. Directories that
+                            do not match it are left alone
+        :param target_root: Root directory of the migrated archive, archive_root if omitted
+        :param routing: RoutingRules used for an omitted layout, the rules in the data directory if omitted
+        :return: The plan
+        :raises ValueError: If a layout is invalid or the new layout overlaps the old one in a way that cannot
+                            be migrated in place
+        """
+        archive_root = os.path.abspath(archive_root)
+        target_root = os.path.abspath(target_root or archive_root)
+        if routing is None and (to_layout is None or from_layout is None):
+            from core.routing_rules import RoutingRules
+
+            routing = RoutingRules()
+        # (layout, settings fixed by the rule) of each layout the archive may contain, the first match wins
+        from_layouts = [(from_layout, {})] if from_layout is not None else routing.path_layouts()
+        from_patterns = [([_level_pattern(level) for level in parse_layout(layout)], fixed)
+                         for layout, fixed in from_layouts]
+        to_levels = parse_layout(to_layout) if to_layout is not None else None
+        if to_levels is not None:
+            known = {name for patterns, fixed in from_patterns
+                     for name in [*fixed, *(name for pattern in patterns for name in pattern.groupindex)]}
+            _check_fields(to_levels, known)
+        renames = renames or {}
+
+        leaves = []
+        found = set()
+        for patterns, fixed in from_patterns:
+            for names, values in _walk_leaves(archive_root, patterns):
+                if names in found or any(values.get(name, value) != value for name, value in fixed.items()):
+                    continue
+                if len(from_patterns) > 1 and not _list_files(os.path.join(archive_root, *names)):
+                    # Only a parent directory of a longer layout
+                    continue
+                found.add(names)
+                values = {**fixed, **values}
+                settings = {name: renames.get(name, {}).get(value, value) for name, value in values.items()}
+                levels = to_levels or parse_layout(routing.path_layout(settings))
+                _check_fields(levels, settings, os.path.join(*names))
+                new_levels = [level.format(**settings) for level in levels]
+                for level in new_levels:
+                    if level in ("", ".", "..") or "/" in level or os.sep in level:
+                        raise ValueError(f"Invalid directory name {level!r} for {os.path.join(*names)}")
+                leaves.append((names, os.path.join(archive_root, *names), os.path.join(target_root, *new_levels),
+                               settings))
+        leaves.sort(key=lambda leaf: leaf[0])
+
+        plan = MigrationPlan(archive_root, target_root, [], 0)
+        renamed = []
+        merges = []
+        self._plan_node(plan, archive_root, leaves, 0, renamed, merges)
+        plan.steps.extend(merges)
+        _check_overlaps(plan.steps)
+        return plan
+
+    def execute(self, plan: MigrationPlan, progress=None) -> None:
+        """
+        Runs a planned migration
+        The plan is made durable in the journal before anything is moved
+
+        :param plan: Plan returned by plan
+        :param progress: Optional callable receiving (step index, MigrationStep) before each step
+        :raises RuntimeError: If an interrupted migration has not been resumed yet
+        """
+        if self.pending():
+            raise RuntimeError(f"An interrupted migration has to be resumed first: {self.journal_path}")
+        with open(self.journal_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"type": "plan", "plan": asdict(plan)}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._run(plan, set(), {}, progress)
+
+    def pending(self) -> bool:
+        """
+        :return: True if an interrupted migration waits to be resumed
+        """
+        return os.path.exists(self.journal_path)
+
+    def resume(self, progress=None):
+        """
+        Finishes an interrupted migration, steps that were completed are skipped and the files of a merge step
+        that were already claimed are moved onto their recorded names
+
+        :param progress: Optional callable receiving (step index, MigrationStep) before each step
+        :return: The plan of the finished migration, None if there was none
+        """
+        plan = None
+        done = set()
+        claims = {}
+        try:
+            with open(self.journal_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # The last record was only partly written before the interruption
+                        continue
+                    if record["type"] == "plan":
+                        data = record["plan"]
+                        data["steps"] = [MigrationStep(**step) for step in data["steps"]]
+                        plan = MigrationPlan(**data)
+                    elif record["type"] == "file":
+                        claims.setdefault(record["step"], {})[record["source"]] = record["target"]
+                    elif record["type"] == "done":
+                        done.add(record["step"])
+        except FileNotFoundError:
+            return None
+        if plan is None:
+            os.unlink(self.journal_path)
+            return None
+        self._run(plan, done, claims, progress)
+        return plan
+
+    def _plan_node(self, plan: MigrationPlan, node: str, leaves: list, depth: int, renamed: list,
+                   merges: list) -> None:
+        """
+        Plans the leaves below one directory of the current layout, the whole directory is renamed if possible
+
+        :param node: Directory depth levels below the archive root
+        :param leaves: (directory names, old leaf, new leaf, settings) of the leaf directories below node
+        :param renamed: Targets of the planned rename steps
+        :param merges: Collects the merge steps, they run after all renames
+        """
+        if depth > 0:
+            targets = {_strip_suffix(new_leaf, names[depth:]) for names, _, new_leaf, _ in leaves}
+            target = targets.pop() if len(targets) == 1 else None
+            if target is not None:
+                if target == node:
+                    plan.unchanged += len(leaves)
+                    return
+                if self._can_rename(node, target, renamed):
+                    renamed.append(target)
+                    plan.steps.append(MigrationStep(
+                        "rename", node, target, [[old_leaf, new_leaf, settings] for _, old_leaf, new_leaf, settings in leaves]
+                    ))
+                    return
+        children = {}
+        for leaf in leaves:
+            names, old_leaf, new_leaf, settings = leaf
+            if len(names) > depth:
+                children.setdefault(names[depth], []).append(leaf)
+            elif new_leaf == old_leaf:
+                # A leaf of a shorter layout whose parent also holds leaves of a longer one
+                plan.unchanged += 1
+            else:
+                files = _list_files(old_leaf)
+                merges.append(MigrationStep(
+                    "merge", old_leaf, new_leaf, [[old_leaf, new_leaf, settings]], len(files),
+                    sum(size for _, size in files), _same_device(old_leaf, new_leaf)
+                ))
+        for name in sorted(children):
+            self._plan_node(plan, os.path.join(node, name), children[name], depth + 1, renamed, merges)
+
+    @staticmethod
+    def _can_rename(source: str, target: str, renamed: list) -> bool:
+        """
+        :return: True if source can be moved to target with one rename
+        """
+        if os.path.lexists(target) or _contains(source, target):
+            return False
+        if any(_contains(other, target) or _contains(target, other) for other in renamed):
+            return False
+        return _same_device(source, target)
+
+    def _run(self, plan: MigrationPlan, done: set, claims: dict, progress) -> None:
+        """
+        Runs the steps that are not done yet and removes the directories that were emptied
+        """
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        try:
+            for index, step in enumerate(plan.steps):
+                if index in done:
+                    continue
+                if progress:
+                    progress(index, step)
+                if step.kind == "rename" and self._rename(step.source, step.target):
+                    moves = [tuple(leaf) for leaf in step.leaves]
+                else:
+                    # Also the fallback of a rename whose target was created in the meantime
+                    step_claims = claims.setdefault(index, {})
+                    for old_leaf, new_leaf, _ in step.leaves:
+                        self._merge(index, old_leaf, new_leaf, step_claims)
+                    settings = {old_leaf: leaf_settings for old_leaf, _, leaf_settings in step.leaves}
+                    moves = [(source, target, settings[os.path.dirname(source)])
+                             for source, target in step_claims.items()]
+                self.file_transfer.flush()
+                for store in (self.catalog, self.dedup_index, self.search_index):
+                    if store is not None:
+                        store.relocate(moves)
+                self._log({"type": "done", "step": index}, sync=True)
+        finally:
+            self._journal.close()
+            self._journal = None
+        for step in plan.steps:
+            for old_leaf, _, _ in step.leaves:
+                _remove_empty_parents(old_leaf, plan.archive_root)
+        os.unlink(self.journal_path)
+
+    @staticmethod
+    def _rename(source: str, target: str) -> bool:
+        """
+        Renames a directory of a rename step
+
+        :return: False if the target exists next to the source, its files have to be merged instead
+        """
+        if not os.path.exists(source):
+            # Renamed before the interruption
+            return True
+        if os.path.lexists(target):
+            return False
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.rename(source, target)
+        return True
+
+    def _merge(self, index: int, old_leaf: str, new_leaf: str, claims: dict) -> None:
+        """
+        Moves the files of a leaf directory one by one, names that are taken in the new directory get a sequence
+        number like files archived at the same time
+
+        :param claims: Source -> claimed name of the files of the step, new claims are added
+        """
+        if not os.path.isdir(old_leaf):
+            return
+        os.makedirs(new_leaf, exist_ok=True)
+        for source, _ in _list_files(old_leaf):
+            target = claims.get(source)
+            if target is None or not os.path.lexists(target):
+                stem, extension = os.path.splitext(os.path.basename(source))
+                target = self._name_allocator.allocate(new_leaf, stem, extension)
+                # Recorded before the name is claimed, so a resumed migration finds the claim
+                self._log({"type": "file", "step": index, "source": source, "target": target})
+                claimed = self._name_allocator.claim(target, source)
+                if claimed != target:
+                    target = claimed
+                    self._log({"type": "file", "step": index, "source": source, "target": target})
+                claims[source] = target
+            expected_hash = None
+            if self.verify and not _same_device(source, new_leaf):
+                expected_hash = hash_file(source)
+            self.file_transfer.move(source, target, expected_hash=expected_hash)
+
+    def _log(self, record: dict, sync: bool = False) -> None:
+        """
+        Appends a record to the journal
+        """
+        self._journal.write(json.dumps(record) + "\n")
+        self._journal.flush()
+        if sync:
+            os.fsync(self._journal.fileno())
+
+
+def parse_layout(layout: str) -> list[str]:
+    """
+    Splits a layout into its directory levels
+
+    :return: One format string per level
+    :raises ValueError: If the layout is empty, uses an unknown setting or a setting twice
+    """
+    levels = [level for level in layout.replace("\\", "/").split("/") if level]
+    if not levels:
+        raise ValueError("The layout has no directory levels")
+    names = [name for level in levels for name in _FIELD.findall(level)]
+    unknown = set(names) - set(LAYOUT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown settings in layout: {', '.join(sorted(unknown))}")
+    if len(names) != len(set(names)):
+        raise ValueError(f"A setting occurs more than once in layout: {layout}")
+    for level in levels:
+        try:
+            level.format(**{name: "" for name in LAYOUT_FIELDS})
+        except (IndexError, KeyError, ValueError):
+            raise ValueError(f"Invalid directory level in layout: {level}") from None
+    return levels
+
+
+def _check_fields(levels: list[str], known, directory: str = None) -> None:
+    """
+    :param known: Settings available for the new layout
+    :param directory: Leaf directory the settings belong to, for the error message
+    :raises ValueError: If the levels use a setting that is not known
+    """
+    missing = {name for level in levels for name in _FIELD.findall(level)} - set(known)
+    if missing:
+        where = f" of {directory}" if directory else ""
+        raise ValueError(f"Settings not in the current layout{where}: {', '.join(sorted(missing))}")
+
+
+def _level_pattern(level: str) -> re.Pattern:
+    """
+    :return: Regular expression matching the directory names of a layout level, one named group per setting
+    """
+    parts = _FIELD.split(level)
+    # split alternates literal text and setting names
+    return re.compile("".join(re.escape(part) if index % 2 == 0 else f"(?P<{part}>.+?)"
+                              for index, part in enumerate(parts)))
+
+
+def _walk_leaves(archive_root: str, patterns: list) -> list[tuple[tuple, dict]]:
+    """
+    :return: (directory names, settings) of the leaf directories of a layout, in the order of their paths
+    """
+    paths = [((), {})]
+    for pattern in patterns:
+        children = []
+        for names, values in paths:
+            for entry in _scandir_dirs(os.path.join(archive_root, *names)):
+                match = pattern.fullmatch(entry.name)
+                if match:
+                    children.append((names + (entry.name,), {**values, **match.groupdict()}))
+        paths = children
+    return sorted(paths, key=lambda path: path[0])
+
+
+def _scandir_dirs(path: str) -> list:
+    """
+    :return: The non-hidden subdirectories of path
+    """
+    try:
+        with os.scandir(path) as entries:
+            return [entry for entry in entries if not entry.name.startswith(".") and entry.is_dir(follow_symlinks=False)]
+    except OSError:
+        return []
+
+
+def _list_files(directory: str) -> list[tuple[str, int]]:
+    """
+    :return: (path, size) of the non-hidden files in directory, hidden files are partial copies
+    """
+    try:
+        with os.scandir(directory) as entries:
+            return sorted((entry.path, entry.stat(follow_symlinks=False).st_size) for entry in entries
+                          if not entry.name.startswith(".") and entry.is_file(follow_symlinks=False))
+    except OSError:
+        return []
+
+
+def _strip_suffix(path: str, suffix: tuple):
+    """
+    :return: path without the trailing directory names suffix, None if it does not end with them
+    """
+    if not suffix:
+        return path
+    tail = os.sep + os.path.join(*suffix)
+    return path[:-len(tail)] if path.endswith(tail) else None
+
+
+def _contains(directory: str, path: str) -> bool:
+    """
+    :return: True if path is directory or lies below it
+    """
+    return path == directory or path.startswith(directory + os.sep)
+
+
+def _same_device(source: str, target: str) -> bool:
+    """
+    :return: True if source can be renamed to target, target and its parents do not have to exist yet
+    """
+    while not os.path.exists(target):
+        parent = os.path.dirname(target)
+        if parent == target:
+            return False
+        target = parent
+    return os.stat(source).st_dev == os.stat(target).st_dev
+
+
+def _check_overlaps(steps: list) -> None:
+    """
+    :raises ValueError: If a step moves files into a directory that another step moves away
+    """
+    sources = {step.source: step for step in steps}
+    for step in steps:
+        path = step.target
+        while True:
+            other = sources.get(path)
+            if other is not None and other is not step:
+                raise ValueError(f"{step.target} lies in {other.source}, which is moved itself. "
+                                 "Migrate into another target directory instead")
+            parent = os.path.dirname(path)
+            if parent == path:
+                break
+            path = parent
+
+
+def _remove_empty_parents(directory: str, archive_root: str) -> None:
+    """
+    Removes directory and its parents up to archive_root as long as they are empty
+    """
+    while _contains(archive_root, directory) and directory != archive_root:
+        try:
+            os.rmdir(directory)
+        except FileNotFoundError:
+            # Renamed away as a whole
+            pass
+        except OSError:
+            return
+        directory = os.path.dirname(directory)
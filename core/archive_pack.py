@@ -0,0 +1,640 @@
+import hashlib
+import json
+import os
+import shutil
+import struct
+import tarfile
+import tempfile
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from config.config import Config
+
+FORMATS = ("zip", "tar.zst")
+INDEX_SUFFIX = ".index.jsonl"
+# Last member of a zip container with duplicates, one {"name": duplicate, "link": stored copy} per line. Zip has no
+# links, so without it only the sidecar index would know the duplicates
+LINKS_NAME = ".links.jsonl"
+_DEFAULT_LEVELS = {"zip": 6, "tar.zst": 3}
+
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+_ZIP64_END = struct.Struct("<IQHHIIQQQQ")
+_ZIP64_LOCATOR = struct.Struct("<IIQI")
+_END = struct.Struct("<IHHHHIIH")
+_ZIP64_LIMIT = 0xFFFFFFFF
+# Names are UTF-8, the files are regular files with mode 644 created on Unix
+_ZIP_FLAGS = 0x0800
+_ZIP_MADE_BY = (3 << 8) | 45
+_ZIP_ATTRIBUTES = 0o100644 << 16
+_STORED = 0
+_DEFLATED = 8
+
+_compressors = threading.local()
+
+
+@dataclass
+class PackResult:
+    """
+    Summary of a written container
+    """
+    # Packed files including duplicates
+    members: int = 0
+    # Distinct contents stored in the container
+    stored: int = 0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    # (path, error message) of the files that could not be packed
+    skipped: list = field(default_factory=list)
+
+
+@dataclass
+class _Chunk:
+    """
+    A piece of a file compressed by one task
+    """
+    member: "_Member"
+    offset: int
+    length: int
+    last: bool
+
+
+class _Member:
+    """
+    Bookkeeping of the file currently being written
+    """
+    __slots__ = ("path", "name", "size", "mtime", "tar_header", "start", "data_offset", "compressed", "crc",
+                 "digests", "method", "failed")
+
+    def __init__(self, path: str, name: str, size: int, mtime: float) -> None:
+        self.path = path
+        self.name = name
+        self.size = size
+        self.mtime = mtime
+        self.tar_header = b""
+        self.start = None
+        self.data_offset = None
+        self.compressed = 0
+        self.crc = 0
+        self.digests = []
+        self.method = _DEFLATED
+        self.failed = False
+
+
+class ArchivePacker:
+    """
+    Bundles archived files into one zip or tar.zst container with a sidecar index for random access
+    Files are split into chunks that are read and compressed in parallel by a thread pool (zlib and zstandard
+    release the GIL), the chunks are written in order. Only a bounded number of bytes is in flight, so memory
+    does not grow with the size of the files or the slice. Content that occurs more than once is stored once:
+    a duplicate is recognized when its last chunk is done, its data is cut off the container again and it is
+    recorded as a link to the first copy, a hard link entry in tar.zst and an alias in the index and in the trailing
+    LINKS_NAME member for zip.
+    Every chunk is compressed on its own (raw deflate blocks ending at a byte boundary, respectively one zstd
+    frame), so a member can be decompressed without reading anything before it. tar.zst needs the optional
+    zstandard package
+    """
+    def __init__(self, container_format: str = "zip", max_workers: int = None, level: int = None,
+                 chunk_size: int = None, max_in_flight: int = None) -> None:
+        """
+        Initializes the packer
+
+        :param container_format: "zip" or "tar.zst"
+        :param max_workers: Number of compression threads, Config.get_pack_workers() if omitted
+        :param level: Compression level, 6 for zip and 3 for tar.zst if omitted
+        :param chunk_size: Bytes compressed per task, Config.get_transfer_chunk_size() if omitted
+        :param max_in_flight: Bytes read but not written yet, Config.get_pack_max_in_flight() if omitted
+        :raises ValueError: If the format is unknown or tar.zst is requested without zstandard
+        """
+        if container_format not in FORMATS:
+            raise ValueError(f"Unknown container format {container_format}, expected one of {', '.join(FORMATS)}")
+        if container_format == "tar.zst":
+            _zstandard()
+        self.container_format = container_format
+        self.max_workers = max_workers or Config.get_pack_workers()
+        self.level = _DEFAULT_LEVELS[container_format] if level is None else level
+        self.chunk_size = chunk_size or Config.get_transfer_chunk_size()
+        self.max_in_flight = max(max_in_flight or Config.get_pack_max_in_flight(), self.chunk_size)
+
+    def pack(self, files, output_path: str) -> PackResult:
+        """
+        Writes a container, the container and its index replace existing files only once they are complete
+
+        :param files: Iterable of (path, member name), member names use "/" as separator
+        :param output_path: Container file, the index is written next to it with INDEX_SUFFIX appended
+        :return: Summary of the container
+        """
+        result = PackResult()
+        part_path = output_path + ".part"
+        index_path = output_path + INDEX_SUFFIX
+        index_part_path = index_path + ".part"
+        with open(part_path, "wb") as out, open(index_part_path, "w", encoding="utf-8") as index, \
+                tempfile.TemporaryFile() as central, ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            writer = _ZipWriter(out, central) if self.container_format == "zip" else _TarWriter(out, self.level)
+            index.write(json.dumps({"format": self.container_format, "chunk_size": self.chunk_size}) + "\n")
+            # Digest of the content -> (name, location in the container) of its first copy
+            stored = {}
+            pending = deque()
+            in_flight = 0
+            chunks = self._chunks(files, result)
+            exhausted = False
+            while True:
+                while not exhausted and (not pending or (in_flight < self.max_in_flight
+                                                         and len(pending) < self.max_workers * 16)):
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        exhausted = True
+                        break
+                    pending.append((chunk, executor.submit(_compress_chunk, chunk.member.path, chunk.offset,
+                                                          chunk.length, chunk.last, self.container_format, self.level,
+                                                          chunk.member.tar_header if chunk.offset == 0 else b"",
+                                                          chunk.member.size)))
+                    in_flight += chunk.length
+                if not pending:
+                    break
+                chunk, future = pending.popleft()
+                in_flight -= chunk.length
+                member = chunk.member
+                if member.failed:
+                    continue
+                try:
+                    digest, crc, method, data = future.result()
+                except OSError as error:
+                    member.failed = True
+                    writer.discard(member)
+                    result.skipped.append((member.path, str(error)))
+                    continue
+                member.digests.append(digest)
+                member.crc = crc if chunk.offset == 0 else _crc32_combine(member.crc, crc, chunk.length)
+                single = chunk.offset == 0 and chunk.last
+                if single:
+                    content_digest = _content_digest(member)
+                    if content_digest in stored:
+                        self._link(writer, index, member, content_digest, stored[content_digest], result)
+                        continue
+                writer.write_chunk(member, chunk.offset == 0, chunk.last, single, method, data)
+                if not chunk.last:
+                    continue
+                content_digest = _content_digest(member)
+                if content_digest in stored:
+                    writer.discard(member)
+                    self._link(writer, index, member, content_digest, stored[content_digest], result)
+                    continue
+                writer.finish(member)
+                location = writer.location(member)
+                stored[content_digest] = (member.name, location)
+                index.write(json.dumps({"name": member.name, **writer.record(location, member.size),
+                                        "hash": content_digest.hex()}) + "\n")
+                result.members += 1
+                result.stored += 1
+                result.bytes_in += member.size
+            writer.close()
+            result.bytes_out = out.tell()
+            out.flush()
+            os.fsync(out.fileno())
+            index.flush()
+            os.fsync(index.fileno())
+        os.replace(part_path, output_path)
+        os.replace(index_part_path, index_path)
+        return result
+
+    def _chunks(self, files, result: PackResult):
+        """
+        :return: Generator of the chunks of all files, files that cannot be read are skipped
+        """
+        for path, name in files:
+            try:
+                stat = os.stat(path)
+            except OSError as error:
+                result.skipped.append((path, str(error)))
+                continue
+            member = _Member(path, name, stat.st_size, stat.st_mtime)
+            if self.container_format == "tar.zst":
+                member.tar_header = _tar_header(name, stat.st_size, stat.st_mtime)
+            offset = 0
+            while True:
+                length = min(self.chunk_size, member.size - offset)
+                last = offset + length >= member.size
+                yield _Chunk(member, offset, length, last)
+                if last:
+                    break
+                offset += length
+
+    @staticmethod
+    def _link(writer, index, member: _Member, content_digest: bytes, original: tuple, result: PackResult) -> None:
+        """
+        Records a duplicate as a link to the first copy of its content
+
+        :param original: (name, location) of the first copy
+        """
+        name, location = original
+        writer.link(member, name)
+        index.write(json.dumps({"name": member.name, **writer.record(location, member.size),
+                                "hash": content_digest.hex(), "link": name}) + "\n")
+        result.members += 1
+        result.bytes_in += member.size
+
+
+class PackReader:
+    """
+    Random access to single members of a container written by ArchivePacker, through its sidecar index
+    """
+    def __init__(self, container_path: str, index_path: str = None) -> None:
+        """
+        Opens a container and reads its index
+
+        :param index_path: Index file, the container path with INDEX_SUFFIX appended if omitted
+        """
+        self._members = {}
+        with open(index_path or container_path + INDEX_SUFFIX, encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            for line in f:
+                record = json.loads(line)
+                self._members[record["name"]] = record
+        self.container_format = header["format"]
+        self.chunk_size = header["chunk_size"]
+        if self.container_format == "tar.zst":
+            _zstandard()
+        self._file = open(container_path, "rb")
+        self._lock = threading.Lock()
+
+    def names(self) -> list[str]:
+        """
+        :return: The member names in container order
+        """
+        return list(self._members)
+
+    def read(self, name: str) -> bytes:
+        """
+        :return: The content of a member
+        :raises KeyError: If the container has no such member
+        """
+        return b"".join(self._stream(name))
+
+    def extract(self, name: str, destination_path: str) -> str:
+        """
+        Writes a member to a file without holding it in memory
+
+        :return: The destination path
+        :raises KeyError: If the container has no such member
+        """
+        with open(destination_path, "wb") as f:
+            for data in self._stream(name):
+                f.write(data)
+        return destination_path
+
+    def close(self) -> None:
+        self._file.close()
+
+    def _stream(self, name: str):
+        """
+        :return: Generator of the decompressed content of a member in pieces of at most chunk_size bytes
+        """
+        record = self._members[name]
+        if self.container_format == "zip":
+            yield from self._stream_zip(record)
+            return
+        # The frames decompress to the tar header, the content and the padding to a full block
+        skip = record["header"]
+        remaining = record["size"]
+        for data in self._stream_zstd(record):
+            if skip:
+                consumed = min(skip, len(data))
+                data = data[consumed:]
+                skip -= consumed
+            data = data[:remaining]
+            remaining -= len(data)
+            if data:
+                yield data
+            if not remaining:
+                return
+
+    def _stream_zip(self, record: dict):
+        decompressor = zlib.decompressobj(-15) if record["method"] == _DEFLATED else None
+        for data in self._raw(record):
+            if decompressor is None:
+                yield data
+                continue
+            while data:
+                output = decompressor.decompress(data, self.chunk_size)
+                data = decompressor.unconsumed_tail
+                if output:
+                    yield output
+
+    def _stream_zstd(self, record: dict):
+        zstandard = _zstandard()
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        for data in self._raw(record):
+            while data:
+                output = decompressor.decompress(data)
+                if output:
+                    yield output
+                if not decompressor.eof:
+                    break
+                # Every chunk is a frame of its own, the next frame needs a new decompressor
+                data = decompressor.unused_data
+                decompressor = zstandard.ZstdDecompressor().decompressobj()
+
+    def _raw(self, record: dict):
+        """
+        :return: Generator of the stored bytes of a member
+        """
+        offset, remaining = record["offset"], record["length"]
+        while remaining:
+            with self._lock:
+                self._file.seek(offset)
+                data = self._file.read(min(self.chunk_size, remaining))
+            if not data:
+                raise EOFError(f"Container ends inside {record['name']}")
+            offset += len(data)
+            remaining -= len(data)
+            yield data
+
+
+def walk_slice(directory: str, exclude: tuple = ()):
+    """
+    Lists the archived files below a directory in a stable order without collecting them first
+
+    :param exclude: Paths to leave out, e.g. a container written into the directory itself
+    :return: Generator of (path, member name relative to directory)
+    """
+    directory = os.path.abspath(directory)
+    excluded = {os.path.abspath(path) for path in exclude}
+    for current, dirs, names in os.walk(directory):
+        dirs[:] = sorted(name for name in dirs if not name.startswith("."))
+        for name in sorted(names):
+            path = os.path.join(current, name)
+            # Hidden files are partial copies of moves in progress
+            if not name.startswith(".") and path not in excluded and os.path.isfile(path):
+                yield path, os.path.relpath(path, directory).replace(os.sep, "/")
+
+
+class _ZipWriter:
+    """
+    Writes zip members, with zip64 extensions where sizes, offsets or the number of entries require them
+    """
+    def __init__(self, out, central) -> None:
+        self.out = out
+        self.central = central
+        self.entries = 0
+        # Lines of the LINKS_NAME member, collected on disk until the container is closed
+        self.links = tempfile.TemporaryFile()
+
+    def write_chunk(self, member: _Member, first: bool, last: bool, single: bool, method: int, data: bytes) -> None:
+        if first:
+            member.start = self.out.tell()
+            member.method = method
+            name = member.name.encode("utf-8")
+            date, dos_time = _dos_time(member.mtime)
+            if single:
+                # Everything is known already, the header is final
+                self.out.write(_LOCAL_HEADER.pack(0x04034B50, 20, _ZIP_FLAGS, method, dos_time, date, member.crc,
+                                                  len(data), member.size, len(name), 0) + name)
+            elif member.size + (member.size >> 10) + 1024 < _ZIP64_LIMIT:
+                # Sizes and CRC are filled in by finish, deflate cannot grow the file beyond the 32 bit fields
+                self.out.write(_LOCAL_HEADER.pack(0x04034B50, 20, _ZIP_FLAGS, method, dos_time, date, 0, 0, 0,
+                                                  len(name), 0) + name)
+            else:
+                self.out.write(_LOCAL_HEADER.pack(0x04034B50, 45, _ZIP_FLAGS, method, dos_time, date, 0,
+                                                  _ZIP64_LIMIT, _ZIP64_LIMIT, len(name), 20) + name
+                               + struct.pack("<HHQQ", 1, 16, 0, 0))
+            member.data_offset = self.out.tell()
+        self.out.write(data)
+        member.compressed += len(data)
+
+    def finish(self, member: _Member) -> None:
+        name = member.name.encode("utf-8")
+        zip64_header = member.data_offset - member.start > _LOCAL_HEADER.size + len(name)
+        if len(member.digests) > 1:
+            # Fill in the header of a file written in several chunks
+            end = self.out.tell()
+            self.out.seek(member.start + 14)
+            if zip64_header:
+                self.out.write(struct.pack("<I", member.crc))
+                self.out.seek(member.start + _LOCAL_HEADER.size + len(name) + 4)
+                self.out.write(struct.pack("<QQ", member.size, member.compressed))
+            else:
+                self.out.write(struct.pack("<III", member.crc, member.compressed, member.size))
+            self.out.seek(end)
+        date, dos_time = _dos_time(member.mtime)
+        extra = b""
+        if member.size >= _ZIP64_LIMIT or member.compressed >= _ZIP64_LIMIT or member.start >= _ZIP64_LIMIT:
+            values = [member.size, member.compressed, member.start]
+            extra = struct.pack("<HH", 1, 8 * len(values)) + struct.pack(f"<{len(values)}Q", *values)
+        self.central.write(_CENTRAL_HEADER.pack(
+            0x02014B50, _ZIP_MADE_BY, 45 if extra or zip64_header else 20, _ZIP_FLAGS, member.method, dos_time, date, member.crc,
+            _ZIP64_LIMIT if extra else member.compressed, _ZIP64_LIMIT if extra else member.size, len(name), len(extra),
+            0, 0, 0, _ZIP_ATTRIBUTES, _ZIP64_LIMIT if extra else member.start
+        ) + name + extra)
+        self.entries += 1
+
+    def location(self, member: _Member) -> tuple:
+        return member.data_offset, member.compressed, member.method
+
+    def record(self, location: tuple, size: int) -> dict:
+        offset, length, method = location
+        return {"offset": offset, "length": length, "size": size, "method": method}
+
+    def discard(self, member: _Member) -> None:
+        if member.start is not None:
+            self.out.seek(member.start)
+            self.out.truncate()
+
+    def link(self, member: _Member, original: str) -> None:
+        self.links.write((json.dumps({"name": member.name, "link": original}) + "\n").encode("utf-8"))
+
+    def close(self) -> None:
+        if self.links.tell():
+            self._write_links()
+        self.links.close()
+        offset = self.out.tell()
+        self.central.seek(0)
+        shutil.copyfileobj(self.central, self.out)
+        size = self.out.tell() - offset
+        if self.entries >= 0xFFFF or offset >= _ZIP64_LIMIT or size >= _ZIP64_LIMIT:
+            zip64_offset = self.out.tell()
+            self.out.write(_ZIP64_END.pack(0x06064B50, 44, _ZIP_MADE_BY, 45, 0, 0, self.entries, self.entries,
+                                           size, offset))
+            self.out.write(_ZIP64_LOCATOR.pack(0x07064B50, 0, zip64_offset, 1))
+            self.out.write(_END.pack(0x06054B50, 0, 0, 0xFFFF, 0xFFFF, _ZIP64_LIMIT, _ZIP64_LIMIT, 0))
+        else:
+            self.out.write(_END.pack(0x06054B50, 0, 0, self.entries, self.entries, size, offset, 0))
+
+
+    def _write_links(self) -> None:
+        """
+        Appends the collected links as a stored member
+        """
+        size = self.links.tell()
+        member = _Member(LINKS_NAME, LINKS_NAME, size, time.time())
+        self.links.seek(0)
+        while data := self.links.read(1024 * 1024):
+            member.crc = zlib.crc32(data, member.crc)
+        member.method = _STORED
+        member.compressed = size
+        member.start = self.out.tell()
+        name = LINKS_NAME.encode("utf-8")
+        date, dos_time = _dos_time(member.mtime)
+        self.out.write(_LOCAL_HEADER.pack(0x04034B50, 20, _ZIP_FLAGS, _STORED, dos_time, date, member.crc, size, size,
+                                          len(name), 0) + name)
+        member.data_offset = self.out.tell()
+        self.links.seek(0)
+        shutil.copyfileobj(self.links, self.out)
+        self.finish(member)
+
+
+class _TarWriter:
+    """
+    Writes tar members as zstd frames, the concatenated frames decompress to a regular tar stream
+    """
+    def __init__(self, out, level: int) -> None:
+        self.out = out
+        self.compressor = _zstandard().ZstdCompressor(level=level, write_checksum=True)
+
+    def write_chunk(self, member: _Member, first: bool, last: bool, single: bool, method: int, data: bytes) -> None:
+        if first:
+            member.start = member.data_offset = self.out.tell()
+        self.out.write(data)
+        member.compressed += len(data)
+
+    def finish(self, member: _Member) -> None:
+        pass
+
+    def location(self, member: _Member) -> tuple:
+        return member.start, member.compressed, len(member.tar_header)
+
+    def record(self, location: tuple, size: int) -> dict:
+        offset, length, header = location
+        return {"offset": offset, "length": length, "size": size, "header": header}
+
+    def discard(self, member: _Member) -> None:
+        if member.start is not None:
+            self.out.seek(member.start)
+            self.out.truncate()
+
+    def link(self, member: _Member, original: str) -> None:
+        info = tarfile.TarInfo(member.name)
+        info.type = tarfile.LNKTYPE
+        info.linkname = original
+        info.mtime = int(member.mtime)
+        info.mode = 0o644
+        self.out.write(self.compressor.compress(info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")))
+
+    def close(self) -> None:
+        self.out.write(self.compressor.compress(b"\0" * (2 * tarfile.BLOCKSIZE)))
+
+
+def _compress_chunk(path: str, offset: int, length: int, last: bool, container_format: str, level: int,
+                    prefix: bytes, size: int) -> tuple[bytes, int, int, bytes]:
+    """
+    Reads and compresses one chunk, runs in the thread pool
+
+    :param prefix: Tar header written in front of the first chunk
+    :param size: Size of the whole file, the last chunk of a tar member is padded to a full block
+    :return: (digest, CRC-32 and size of the chunk, zip method, compressed data)
+    :raises OSError: If the file cannot be read or changed its size
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(length)
+        if len(data) != length or (last and f.read(1)):
+            raise OSError(f"{path} changed while packing")
+    digest = hashlib.blake2b(data, digest_size=32).digest()
+    crc = zlib.crc32(data)
+    if container_format == "tar.zst":
+        padding = b"\0" * (-size % tarfile.BLOCKSIZE) if last else b""
+        compressor = getattr(_compressors, "zstd", None)
+        if compressor is None or _compressors.level != level:
+            compressor = _compressors.zstd = _zstandard().ZstdCompressor(level=level, write_checksum=True)
+            _compressors.level = level
+        return digest, crc, _DEFLATED, compressor.compress(prefix + data + padding)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    # A sync flush ends the chunk at a byte boundary without ending the stream, so the chunks can be concatenated
+    compressed = compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+    if offset == 0 and last and len(compressed) >= len(data):
+        # Already compressed content, e.g. most PDFs, is stored as is
+        return digest, crc, _STORED, data
+    return digest, crc, _DEFLATED, compressed
+
+
+def _content_digest(member: _Member) -> bytes:
+    """
+    :return: Digest of a file's content from the digests of its chunks
+    """
+    return hashlib.blake2b(b"".join(member.digests), digest_size=32,
+                           person=member.size.to_bytes(16, "little")).digest()
+
+
+def _tar_header(name: str, size: int, mtime: float) -> bytes:
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(mtime)
+    info.mode = 0o644
+    return info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+
+
+def _dos_time(mtime: float) -> tuple[int, int]:
+    """
+    :return: (date, time) in the MS-DOS format of zip headers
+    """
+    value = time.localtime(mtime)
+    if value.tm_year < 1980:
+        return (1 << 5) | 1, 0
+    date = ((value.tm_year - 1980) << 9) | (value.tm_mon << 5) | value.tm_mday
+    return date, (value.tm_hour << 11) | (value.tm_min << 5) | (value.tm_sec // 2)
+
+
+def _crc32_combine(crc1: int, crc2: int, length2: int) -> int:
+    """
+    :return: CRC-32 of two concatenated pieces from their CRCs and the length of the second, as zlib's crc32_combine
+    """
+    if length2 == 0:
+        return crc1
+    odd = [0xEDB88320] + [1 << n for n in range(31)]
+    even = _gf2_matrix_square(odd)
+    odd = _gf2_matrix_square(even)
+    while True:
+        even = _gf2_matrix_square(odd)
+        if length2 & 1:
+            crc1 = _gf2_matrix_times(even, crc1)
+        length2 >>= 1
+        if not length2:
+            break
+        odd = _gf2_matrix_square(even)
+        if length2 & 1:
+            crc1 = _gf2_matrix_times(odd, crc1)
+        length2 >>= 1
+        if not length2:
+            break
+    return crc1 ^ crc2
+
+
+def _gf2_matrix_times(matrix: list[int], vector: int) -> int:
+    result = 0
+    index = 0
+    while vector:
+        if vector & 1:
+            result ^= matrix[index]
+        vector >>= 1
+        index += 1
+    return result
+
+
+def _gf2_matrix_square(matrix: list[int]) -> list[int]:
+    return [_gf2_matrix_times(matrix, row) for row in matrix]
+
+
+def _zstandard():
+    """
+    :return: The zstandard module
+    :raises ValueError: If the optional zstandard package is not installed
+    """
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("tar.zst containers need the zstandard package") from None
+    return zstandard
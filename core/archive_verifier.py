@@ -0,0 +1,80 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+from config.config import Config
+from core.archive_catalog import ArchiveCatalog, CatalogEntry
+from core.dedup_index import hash_file
+
+# Newly computed hashes are stored in one transaction once this many have been collected
+_RECORD_CHUNK_SIZE = 1000
+
+
+@dataclass(frozen=True)
+class VerificationResult:
+    """
+    Outcome of checking one catalogued file
+    Status is ok, changed (content differs from the stored hash), missing, recorded (no hash was stored,
+    it has been computed and stored now) or unhashed (no hash stored, the file was not read)
+    """
+    path: str
+    status: str
+
+
+class ArchiveVerifier:
+    """
+    Checks the archived files against the hashes stored in the catalog
+    The files are hashed in a process pool and read past the page cache, so the check sees what is on the disk
+    """
+    def __init__(self, catalog: ArchiveCatalog, max_workers: int = None) -> None:
+        """
+        :param catalog: Catalog with the archived files and their hashes
+        :param max_workers: Number of hashing processes, Config.get_hash_workers() if omitted
+        """
+        self.catalog = catalog
+        self.max_workers = max_workers or Config.get_hash_workers()
+
+    def verify(self, entries: list[CatalogEntry] = None, record: bool = False):
+        """
+        Checks the files, results are yielded in the order of the entries
+
+        :param entries: Files to check, all catalogued files if omitted
+        :param record: Hash files without stored hash and store the hash, otherwise they are reported as unhashed
+        :return: Iterator of VerificationResult
+        """
+        if entries is None:
+            entries = self.catalog.query()
+        to_hash = [entry for entry in entries if entry.content_hash is not None or record]
+        chunksize = max(1, min(64, len(to_hash) // (self.max_workers * 4)))
+        recorded = []
+        with ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            hashes = iter(executor.map(_hash_or_none, [entry.path for entry in to_hash], chunksize=chunksize))
+            for entry in entries:
+                if entry.content_hash is None and not record:
+                    yield VerificationResult(entry.path, "unhashed")
+                    continue
+                content_hash = next(hashes)
+                if content_hash is None:
+                    yield VerificationResult(entry.path, "missing")
+                elif entry.content_hash is None:
+                    recorded.append((entry.path, content_hash))
+                    if len(recorded) >= _RECORD_CHUNK_SIZE:
+                        self.catalog.set_hashes(recorded)
+                        recorded = []
+                    yield VerificationResult(entry.path, "recorded")
+                elif content_hash != entry.content_hash:
+                    yield VerificationResult(entry.path, "changed")
+                else:
+                    yield VerificationResult(entry.path, "ok")
+        if recorded:
+            self.catalog.set_hashes(recorded)
+
+
+def _hash_or_none(path: str):
+    """
+    :return: The BLAKE2b digest of a file read from the disk, None if the file does not exist
+    """
+    try:
+        return hash_file(path, drop_cache=True)
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,257 @@
+import glob
+import json
+import os
+import threading
+import uuid
+from dataclasses import dataclass
+
+from config.config import Config
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+@dataclass
+class JournalBatch:
+    """
+    A batch read back from the journal that has not been ended
+    """
+    batch_id: str
+    # [source, destination, [specialization, exam_part, file_type, year, period], created_dirs]
+    moves: list
+    done: set
+
+
+class BatchJournal:
+    """
+    Append-only write-ahead journal for batches of moves
+    The plan of a batch is made durable before the first file is moved. Completed moves are buffered
+    and written together with the end record, so a batch costs two fsyncs regardless of its size.
+    Every process writes its own journal file and holds a lock on it while it runs. The journals of
+    processes that ended without closing their journal are taken over by the next process, which
+    reports their interrupted batches as its own
+    """
+    def __init__(self, journal_path: str = None) -> None:
+        """
+        Opens or creates the journal
+
+        :param journal_path: Journal file, a new file in journals/ in Config.get_data_dir() if omitted.
+                             An explicit file is used as is and is not shared with other processes
+        """
+        self._owned = journal_path is None
+        orphans = []
+        if journal_path is None:
+            journal_dir = os.path.join(Config.get_data_dir(), "journals")
+            os.makedirs(journal_dir, exist_ok=True)
+            journal_path = os.path.join(journal_dir, f"journal-{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl")
+            self._file = open(journal_path, "a", encoding="utf-8")
+            _try_lock(self._file)
+            # journal.jsonl is the single journal shared by all processes in earlier versions
+            candidates = glob.glob(os.path.join(journal_dir, "journal-*.jsonl"))
+            candidates.append(os.path.join(Config.get_data_dir(), "journal.jsonl"))
+            for candidate in sorted(candidates):
+                if candidate != journal_path:
+                    orphan = _lock_orphan(candidate)
+                    if orphan:
+                        orphans.append(orphan)
+        else:
+            self._file = open(journal_path, "a", encoding="utf-8")
+        self.journal_path = journal_path
+        self._lock = threading.Lock()
+        self._open_batches = set()
+        self._buffer = []
+        self._incomplete = _read_incomplete_batches(journal_path)
+        if self._file.tell() and not _ends_with_newline(journal_path):
+            # Terminate a torn record so the next record starts on its own line
+            self._file.write("\n")
+        if orphans:
+            # The batches are durable in this journal before the orphaned journals are deleted
+            for path, _ in orphans:
+                for batch in _read_incomplete_batches(path).values():
+                    self._incomplete[batch.batch_id] = batch
+                    self._buffer.append({"type": "plan", "batch": batch.batch_id, "moves": batch.moves})
+                    self._buffer.extend({"type": "done", "batch": batch.batch_id, "move": move}
+                                        for move in sorted(batch.done))
+            self._flush(sync=True)
+            for path, f in orphans:
+                _delete_locked(path, f)
+
+    def begin(self, moves: list) -> str:
+        """
+        Persists the plan of a batch
+
+        :param moves: [source, destination, settings, created_dirs] per planned move
+        :return: Id of the batch
+        """
+        batch_id = uuid.uuid4().hex
+        with self._lock:
+            self._open_batches.add(batch_id)
+            self._buffer.append({"type": "plan", "batch": batch_id, "moves": moves})
+            self._flush(sync=True)
+        return batch_id
+
+    def redirect(self, batch_id: str, move_index: int, destination: str) -> None:
+        """
+        Persists a new destination of a planned move, before the move is executed
+        """
+        with self._lock:
+            self._buffer.append({"type": "destination", "batch": batch_id, "move": move_index, "path": destination})
+            self._flush(sync=True)
+
+    def mark_done(self, batch_id: str, move_index: int) -> None:
+        """
+        Records that a planned move has been executed, the record is written with the next flush
+        """
+        with self._lock:
+            self._buffer.append({"type": "done", "batch": batch_id, "move": move_index})
+
+    def end(self, batch_id: str) -> None:
+        """
+        Marks a batch as completed
+        The journal is truncated once no batch is open anymore
+        """
+        with self._lock:
+            self._open_batches.discard(batch_id)
+            self._incomplete.pop(batch_id, None)
+            if self._open_batches or self._incomplete:
+                self._buffer.append({"type": "end", "batch": batch_id})
+                self._flush(sync=True)
+            else:
+                self._buffer.clear()
+                self._file.truncate(0)
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+    def incomplete_batches(self) -> list[JournalBatch]:
+        """
+        Returns the batches of earlier runs that were planned but never ended, e.g. because the process crashed
+        They stay in the journal until they are ended after recovery
+
+        :return: The incomplete batches in journal order
+        """
+        with self._lock:
+            return list(self._incomplete.values())
+
+    def close(self) -> None:
+        """
+        Writes the buffered records and closes the journal, an empty journal file of this process is deleted
+        """
+        with self._lock:
+            if self._file.closed:
+                return
+            self._flush(sync=True)
+            if self._owned and os.fstat(self._file.fileno()).st_size == 0:
+                _delete_locked(self.journal_path, self._file)
+            else:
+                self._file.close()
+
+    def _flush(self, sync: bool) -> None:
+        """
+        Appends the buffered records, the caller holds the lock
+        """
+        if self._buffer:
+            self._file.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in self._buffer))
+            self._buffer.clear()
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+
+
+def _read_incomplete_batches(journal_path: str) -> dict:
+    """
+    Reads the batches of a journal file that have a plan but no end record
+
+    :return: Batch id -> JournalBatch in journal order
+    """
+    batches = {}
+    try:
+        f = open(journal_path, encoding="utf-8")
+    except FileNotFoundError:
+        return batches
+    with f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A torn write at the end of the journal
+                continue
+            batch_id = record.get("batch")
+            if record.get("type") == "plan":
+                batches[batch_id] = JournalBatch(batch_id, record["moves"], set())
+            elif record.get("type") == "done" and batch_id in batches:
+                batches[batch_id].done.add(record["move"])
+            elif record.get("type") == "destination" and batch_id in batches:
+                batches[batch_id].moves[record["move"]][1] = record["path"]
+            elif record.get("type") == "end":
+                batches.pop(batch_id, None)
+    return batches
+
+
+def _ends_with_newline(path: str) -> bool:
+    """
+    :return: True if the last byte of the file is a newline
+    """
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def _try_lock(f) -> bool:
+    """
+    Takes an exclusive advisory lock on an open file without waiting
+    The lock is released by the operating system when the file is closed or the process ends
+
+    :return: True if the lock was taken
+    """
+    fd = f.fileno()
+    try:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            # Locks the first byte, writes in append mode are not affected
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _lock_orphan(path: str):
+    """
+    Locks the journal of a process that is no longer running
+
+    :return: (path, locked file) or None if the journal is in use or was taken over by another process
+    """
+    try:
+        f = open(path, "a", encoding="utf-8")
+    except OSError:
+        return None
+    try:
+        # The file may have been taken over and deleted between open and lock
+        if _try_lock(f) and os.path.samestat(os.fstat(f.fileno()), os.stat(path)):
+            return path, f
+    except OSError:
+        pass
+    f.close()
+    return None
+
+
+def _delete_locked(path: str, f) -> None:
+    """
+    Deletes a locked journal file, the lock is held until it is gone where the platform allows it
+    """
+    try:
+        os.unlink(path)
+    except PermissionError:
+        # Windows does not delete open files
+        f.close()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    except OSError:
+        pass
+    f.close()
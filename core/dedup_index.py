@@ -0,0 +1,220 @@
+import hashlib
+import os
+import sqlite3
+import threading
+
+from config.config import Config
+
+_HASH_BLOCK_SIZE = 1024 * 1024
+_LOCK_STRIPES = 64
+
+
+class DuplicateFileError(Exception):
+    """
+    Raised when a file with the same content has already been archived
+    """
+    def __init__(self, file_path: str, existing_path: str) -> None:
+        super().__init__(f"File {file_path} is a duplicate of {existing_path}")
+        self.file_path = file_path
+        self.existing_path = existing_path
+
+
+def hash_file(file_path: str, drop_cache: bool = False) -> bytes:
+    """
+    Streams a file through BLAKE2b
+
+    :param file_path: File to hash
+    :param drop_cache: Evict the file from the page cache first where the platform supports it, so the
+                       bytes are read back from the disk or the file server instead of memory
+    :return: The digest
+    """
+    digest = hashlib.blake2b()
+    buffer = bytearray(_HASH_BLOCK_SIZE)
+    view = memoryview(buffer)
+    with open(file_path, "rb", buffering=0) as f:
+        if drop_cache and hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            digest.update(view[:read])
+    return digest.digest()
+
+
+class DedupIndex:
+    """
+    Persistent index of the archived files by size and content hash
+    Files are only hashed when another archived file has the same size, hashes of archived files are
+    computed lazily the first time a file of the same size arrives. Afterwards a new file is only compared with
+    the archived files of the same size and hash
+    """
+    def __init__(self, db_path: str = None) -> None:
+        """
+        Opens or creates the index
+
+        :param db_path: SQLite database file, dedup.sqlite in Config.get_data_dir() if omitted
+        """
+        if db_path is None:
+            os.makedirs(Config.get_data_dir(), exist_ok=True)
+            db_path = os.path.join(Config.get_data_dir(), "dedup.sqlite")
+        self._db_lock = threading.Lock()
+        self._size_locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+        # Destination path -> source path of claimed files that have not been moved yet
+        self._pending = {}
+
+        self._connection = sqlite3.connect(db_path, timeout=Config.get_db_timeout(), check_same_thread=False,
+                                           isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, size INTEGER NOT NULL, hash BLOB)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS files_size_hash ON files (size, hash)")
+
+    def claim(self, file_path: str, destination_path: str) -> None:
+        """
+        Registers file_path under its future destination_path unless its content is already archived
+        Must be followed by commit or release once the file has been moved
+
+        :param file_path: File that is about to be archived
+        :param destination_path: Path the file will be moved to
+        :raises DuplicateFileError: If a file with the same content is already archived
+        """
+        destination_path = os.path.abspath(destination_path)
+        size = os.path.getsize(file_path)
+        with self._size_locks[size % _LOCK_STRIPES]:
+            content_hash = None
+            checked = set()
+            while True:
+                with self._db_lock:
+                    # Writing right away keeps other processes from claiming a file of the same size in between
+                    self._connection.execute("BEGIN IMMEDIATE")
+                    try:
+                        if content_hash is None:
+                            # Only hashed once another file of the same size is archived
+                            candidates = self._connection.execute(
+                                "SELECT path, hash FROM files WHERE size = ? LIMIT 1", (size,)
+                            ).fetchall()
+                        else:
+                            # Through the (size, hash) index, files archived before their hash was needed included
+                            candidates = [candidate for candidate in self._connection.execute(
+                                "SELECT path, hash FROM files WHERE size = ? AND hash = ?"
+                                " UNION ALL SELECT path, hash FROM files WHERE size = ? AND hash IS NULL",
+                                (size, content_hash, size)
+                            ) if candidate[0] not in checked]
+                        if not candidates:
+                            self._pending[destination_path] = file_path
+                            self._connection.execute(
+                                "INSERT OR REPLACE INTO files (path, size, hash) VALUES (?, ?, ?)",
+                                (destination_path, size, content_hash)
+                            )
+                    except BaseException:
+                        self._pending.pop(destination_path, None)
+                        self._connection.execute("ROLLBACK")
+                        raise
+                    self._connection.execute("ROLLBACK" if candidates else "COMMIT")
+                if not candidates:
+                    return
+
+                # Candidates are hashed without holding the database, then checked for new claims again
+                if content_hash is None:
+                    content_hash = hash_file(file_path)
+                    continue
+                for path, candidate_hash in candidates:
+                    if candidate_hash is None:
+                        candidate_hash = self._hash_archived(path, size)
+                    if candidate_hash == content_hash:
+                        raise DuplicateFileError(file_path, path)
+                    checked.add(path)
+
+    def commit(self, destination_path: str) -> None:
+        """
+        Marks a claimed file as moved
+        """
+        with self._db_lock:
+            self._pending.pop(os.path.abspath(destination_path), None)
+
+    def release(self, destination_path: str) -> None:
+        """
+        Drops a claim whose move failed
+        """
+        destination_path = os.path.abspath(destination_path)
+        with self._db_lock:
+            self._pending.pop(destination_path, None)
+            self._connection.execute("DELETE FROM files WHERE path = ?", (destination_path,))
+
+    def add(self, path: str, content_hash: bytes = None) -> None:
+        """
+        Adds an already archived file
+
+        :param path: Path of the archived file
+        :param content_hash: Its BLAKE2b digest if known
+        """
+        path = os.path.abspath(path)
+        size = os.path.getsize(path)
+        with self._db_lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO files (path, size, hash) VALUES (?, ?, ?)", (path, size, content_hash)
+            )
+
+    def relocate(self, moves: list[tuple[str, str, dict]]) -> None:
+        """
+        Updates the paths of moved files, see ArchiveCatalog.relocate
+
+        :param moves: (old path, new path, settings) per moved file or directory, settings are ignored
+        """
+        with self._db_lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                for old_path, new_path, _ in moves:
+                    old_path, new_path = os.path.abspath(old_path), os.path.abspath(new_path)
+                    self._connection.execute(
+                        "UPDATE OR REPLACE files SET path = ? || substr(path, ?) WHERE path = ? OR (path > ? AND path < ?)",
+                        (new_path, len(old_path) + 1, old_path, old_path + os.sep, old_path + chr(ord(os.sep) + 1))
+                    )
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def remove(self, path: str) -> None:
+        """
+        Removes an archived file from the index
+        """
+        with self._db_lock:
+            self._connection.execute("DELETE FROM files WHERE path = ?", (os.path.abspath(path),))
+
+    def close(self) -> None:
+        """
+        Closes the database connection
+        """
+        with self._db_lock:
+            self._connection.close()
+
+    def _hash_archived(self, path: str, size: int):
+        """
+        Hashes an archived file and stores the hash, stale entries are removed
+
+        :return: The digest or None if the file no longer exists
+        """
+        with self._db_lock:
+            readable_path = path if path not in self._pending else self._pending[path]
+        try:
+            content_hash = hash_file(readable_path)
+        except FileNotFoundError:
+            try:
+                # A pending file may have been moved in the meantime
+                content_hash = hash_file(path)
+            except FileNotFoundError:
+                self.remove(path)
+                return None
+        if readable_path == path and os.path.getsize(path) != size:
+            # Claimed by another process and still being moved, only its placeholder or part of it is there
+            return None
+        with self._db_lock:
+            self._connection.execute(
+                "UPDATE files SET hash = ? WHERE path = ? AND size = ?", (content_hash, path, size)
+            )
+        return content_hash
@@ -0,0 +1,52 @@
+import os
+from typing import Iterable, Iterator
+
+
+def scan_paths(paths: Iterable[str], skip_dir_names: Iterable[str] = None, routing=None,
+               skip_dirs: Iterable[str] = ()) -> Iterator[str]:
+    """
+    Lazily yields all files of the given paths
+    Files are yielded as they are, directories are walked recursively with os.scandir so the first
+    files are available before the whole tree has been listed. Hidden entries are skipped
+
+    :param paths: Files and directories to scan
+    :param skip_dir_names: Names of directories that are not entered, defaults to the names of the top-level
+        directories the routing rules create, so already archived files are not picked up again
+    :param routing: RoutingRules whose top-level directories are skipped, RoutingRules() if omitted
+    :param skip_dirs: Directories that are not entered, e.g. the archive root
+    :return: Iterator over the file paths
+    """
+    if skip_dir_names is None:
+        if routing is None:
+            from core.routing_rules import RoutingRules
+            routing = RoutingRules()
+        is_skipped = routing.is_top_level_directory
+    else:
+        is_skipped = frozenset(skip_dir_names).__contains__
+    skip_dirs = {os.path.realpath(directory) for directory in skip_dirs}
+
+    for path in paths:
+        if not os.path.isdir(path):
+            if os.path.isfile(path):
+                yield path
+            continue
+
+        pending_dirs = [path]
+        while pending_dirs:
+            directory = pending_dirs.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.name.startswith("."):
+                            continue
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if not is_skipped(entry.name) and (
+                                        not skip_dirs or os.path.realpath(entry.path) not in skip_dirs):
+                                    pending_dirs.append(entry.path)
+                            elif entry.is_file():
+                                yield entry.path
+                        except OSError:
+                            continue
+            except OSError:
+                continue
@@ -0,0 +1,205 @@
+import os
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from config.config import Config
+from core.file_processor import FileJob
+from core.text_extraction import extract_text
+
+FIELDS = ("specialization", "exam_part", "file_type", "year", "period")
+
+# Additional spellings per Config value, the values themselves are always recognized
+_ALIASES = {
+    "Anwendungsentwicklung": ["FIAE", "Anwendungsentwickler"],
+    "Systemintegration": ["FISI", "Systemintegrator"],
+    "Digitale Vernetzung": ["FIDV"],
+    "Daten- und Prozessanalyse": ["FIDP", "Datenanalyse", "Prozessanalyse"],
+    "WISO": ["Wirtschafts- und Sozialkunde"],
+    "AP1": ["Teil 1", "GA1"],
+    "AP2": ["Teil 2", "GA2"],
+    "Sommer": ["SoSe", "Frühjahr", "Frühling"],
+    "Winter": ["WiSe", "Herbst"],
+    "Löser": ["Lösung", "Lösungen", "Musterlösung", "Lösungshinweise"],
+    "Aufgabenblatt": ["Aufgabe", "Aufgaben", "Aufgabensatz"],
+    "Belegsatz": ["Belege", "Anlagen"],
+}
+# Short period and year codes like S23, W2022 or Wi22
+_PERIOD_YEAR_CODES = {"Sommer": "S|So", "Winter": "W|Wi"}
+_UMLAUTS = {"ä": "(?:ä|ae|a)", "ö": "(?:ö|oe|o)", "ü": "(?:ü|ue|u)", "ß": "(?:ß|ss)"}
+_LETTER = "A-Za-zÄÖÜäöüß"
+_SOURCE_WEIGHTS = {"filename": 1.0, "text": 0.6}
+_FOLDER_WEIGHTS = (0.8, 0.7, 0.6, 0.5)
+_TEXT_LIMIT = 4000
+
+
+@dataclass
+class Classification:
+    """
+    Inferred settings of a file with a confidence between 0 and 1 per field
+    """
+    values: dict = field(default_factory=dict)
+    confidence: dict = field(default_factory=dict)
+
+    def resolve(self, fallback: dict = None, threshold: float = None) -> dict:
+        """
+        Combines the inferred values with fallback values
+        A field uses its inferred value only if its confidence reaches the threshold
+
+        :param fallback: Values used for uncertain fields, e.g. the settings chosen in the UI
+        :param threshold: Minimum confidence, Config.get_classification_threshold() if omitted
+        :return: The five settings, fields without a confident value or fallback are None
+        """
+        fallback = fallback or {}
+        threshold = Config.get_classification_threshold() if threshold is None else threshold
+        return {
+            name: self.values.get(name) if self.confidence.get(name, 0.0) >= threshold else fallback.get(name)
+            for name in FIELDS
+        }
+
+
+class ClassificationError(ValueError):
+    """
+    Raised when a setting can neither be inferred nor taken from the fallback values
+    """
+
+
+class FileClassifier:
+    """
+    Infers the five settings of a file from its name, its parent folders and the text of its first page
+    The patterns are derived from the lists in Config and compiled once, the document text is only
+    read when name and folders are not conclusive
+    """
+    def __init__(self, threshold: float = None) -> None:
+        """
+        Compiles the pattern tables
+
+        :param threshold: Minimum confidence, Config.get_classification_threshold() if omitted
+        """
+        self.threshold = Config.get_classification_threshold() if threshold is None else threshold
+        self._patterns = {
+            "specialization": _compile_table(Config.get_specializations()),
+            "exam_part": _compile_table(Config.get_exam_parts()),
+            "file_type": _compile_table(Config.get_file_types()),
+            "period": _compile_table(Config.get_periods()),
+        }
+        self._year_pattern = re.compile(r"(?<!\d)((?:19|20)\d{2})(?!\d)")
+        periods = [period for period in Config.get_periods() if period in _PERIOD_YEAR_CODES]
+        self._period_year_pattern = re.compile(
+            "|".join(
+                f"(?P<p{index}>(?<![{_LETTER}])(?:{_PERIOD_YEAR_CODES[period]})[\\s_\\-]?(?:20)?(\\d{{2}})(?!\\d))"
+                for index, period in enumerate(periods)
+            ) or "(?!)",
+            re.IGNORECASE
+        )
+        self._period_year_values = {f"p{index}": period for index, period in enumerate(periods)}
+        current_year = datetime.now().year
+        self._years = range(current_year - 30, current_year + 2)
+
+    def classify(self, file_path: str) -> Classification:
+        """
+        Infers the settings of a file
+
+        :param file_path: File to classify
+        :return: Values and confidences of the five fields
+        """
+        scores = {name: {} for name in FIELDS}
+        stem = os.path.splitext(os.path.basename(file_path))[0]
+        self._score(stem, _SOURCE_WEIGHTS["filename"], scores)
+
+        directory = os.path.dirname(os.path.abspath(file_path))
+        for weight in _FOLDER_WEIGHTS:
+            directory, folder_name = os.path.split(directory)
+            if not folder_name:
+                break
+            self._score(folder_name, weight, scores)
+
+        classification = _classification(scores)
+        if any(classification.confidence[name] < self.threshold for name in FIELDS):
+            text = extract_text(file_path, max_pages=1)[:_TEXT_LIMIT]
+            if text:
+                self._score(text, _SOURCE_WEIGHTS["text"], scores)
+                classification = _classification(scores)
+        return classification
+
+    def classify_job(self, file_path: str, fallback: dict = None) -> FileJob:
+        """
+        Creates the job for a file from its inferred settings, uncertain fields are taken from fallback
+
+        :param file_path: File to classify
+        :param fallback: Values used for uncertain fields, e.g. the settings chosen in the UI
+        :raises ClassificationError: If a field is uncertain and has no fallback value
+        """
+        settings = self.classify(file_path).resolve(fallback, self.threshold)
+        missing = [name for name, value in settings.items() if not value]
+        if missing:
+            raise ClassificationError(f"Could not classify {', '.join(missing)} of {file_path}")
+        return FileJob(file_path, **settings)
+
+    def _score(self, text: str, weight: float, scores: dict) -> None:
+        """
+        Adds the evidence found in one source, conflicting values of a source share its weight
+        """
+        found = {name: set() for name in FIELDS}
+        for name, (pattern, values) in self._patterns.items():
+            for match in pattern.finditer(text):
+                found[name].add(values[match.lastgroup])
+        for match in self._period_year_pattern.finditer(text):
+            found["period"].add(self._period_year_values[match.lastgroup])
+            found["year"].add(str(2000 + int(match.group(match.lastindex + 1))))
+        for match in self._year_pattern.finditer(text):
+            if int(match.group(1)) in self._years:
+                found["year"].add(match.group(1))
+
+        for name, values in found.items():
+            for value in values:
+                scores[name][value] = scores[name].get(value, 0.0) + weight / len(values)
+
+
+def _compile_table(values: list[str]):
+    """
+    Compiles one alternation with a named group per value of a Config list
+
+    :return: The pattern and a mapping from group name to value
+    """
+    alternatives = []
+    groups = {}
+    for index, value in enumerate(values):
+        spellings = sorted({value, *_ALIASES.get(value, [])}, key=len, reverse=True)
+        alternatives.append(f"(?P<v{index}>{'|'.join(_spelling_pattern(spelling) for spelling in spellings)})")
+        groups[f"v{index}"] = value
+    pattern = f"(?<![{_LETTER}])(?:{'|'.join(alternatives)})(?![{_LETTER}])"
+    return re.compile(pattern, re.IGNORECASE), groups
+
+
+def _spelling_pattern(spelling: str) -> str:
+    """
+    Turns a spelling into a pattern that accepts transcribed umlauts and any separator between words and digits
+    """
+    parts = []
+    for char in spelling:
+        if char.lower() in _UMLAUTS:
+            parts.append(_UMLAUTS[char.lower()])
+        elif char in " -_":
+            parts.append(r"[\s_\-]*")
+        else:
+            parts.append(re.escape(char))
+    pattern = "".join(parts)
+    # AP1 also matches AP 1 and AP-1
+    return re.sub(r"([A-Za-z])(\d)", r"\1[\\s_\\-]?\2", pattern)
+
+
+def _classification(scores: dict) -> Classification:
+    """
+    Picks the best value per field, the confidence is its share of the evidence, capped by the evidence itself
+    """
+    classification = Classification()
+    for name, candidates in scores.items():
+        if not candidates:
+            classification.values[name] = None
+            classification.confidence[name] = 0.0
+            continue
+        value, score = max(candidates.items(), key=lambda item: item[1])
+        classification.values[name] = value
+        classification.confidence[name] = round(score / sum(candidates.values()) * min(1.0, score), 3)
+    return classification
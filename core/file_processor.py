@@ -1,18 +1,126 @@
+import logging
 import os
-import shutil
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
 from datetime import datetime
+from typing import TYPE_CHECKING
+
+from core.file_transfer import FileTransfer
+from core.dedup_index import DedupIndex, DuplicateFileError, hash_file
+from core.archive_catalog import ArchiveCatalog
+from core.batch_journal import BatchJournal
+from core.name_allocator import NameAllocator
+from core.metrics import Metrics, NullMetrics
+from config.config import Config
+
+if TYPE_CHECKING:
+    # Only needed by the optional features, importing them would slow down every start
+    from core.upload_backend import UploadBackend
+    from core.search_index import SearchIndex
+    from core.io_scheduler import IoScheduler
+    from core.routing_rules import RoutingRules
+
+_logger = logging.getLogger("pruefungsdateien.processor")
+
+
+@dataclass(frozen=True)
+class FileJob:
+    """
+    A single file together with the five settings it is archived under
+    """
+    file_path: str
+    specialization: str
+    exam_part: str
+    file_type: str
+    year: str
+    period: str
+
+
+class BatchListener:
+    """
+    Receives the per-file events of FileProcessor.process_batch
+    Files are identified by their index in the batch, all methods do nothing by default
+    """
+    def on_started(self, index: int) -> None:
+        pass
+
+    def on_progress(self, index: int, bytes_done: int, bytes_total: int) -> None:
+        pass
+
+    def on_finished(self, index: int, destination_path: str) -> None:
+        pass
+
+    def on_failed(self, index: int, error: Exception) -> None:
+        pass
+
+
+class _ProgressListener(BatchListener):
+    """
+    Forwards the progress of a single file batch to a progress callback
+    """
+    def __init__(self, progress_callback) -> None:
+        self.progress_callback = progress_callback
+
+    def on_progress(self, index: int, bytes_done: int, bytes_total: int) -> None:
+        if self.progress_callback:
+            self.progress_callback(bytes_done, bytes_total)
+
 
 class FileProcessor:
     """
-    FileProcessor that processes the file synchronously
+    Archives files under the directory and name the routing rules give their settings
+    Files are processed in batches on the calling thread, the processing engine runs batches on its worker
+    threads. A batch is planned and written to the journal before the first move, so recover can finish or undo
+    it after a crash. Each name is claimed on disk and checked against the dedup index right before the move,
+    afterwards the file is recorded in the catalog and search index and optionally uploaded
     """
-    def process_file(self, file_path, specializations, exam_parts, file_types, year, period) -> str:
+    def __init__(self, archive_root: str = None, file_transfer: FileTransfer = None, dedup_index: DedupIndex = None,
+                 catalog: ArchiveCatalog = None, journal: BatchJournal = None, metrics: Metrics = None,
+                 upload_backend: "UploadBackend" = None, search_index: "SearchIndex" = None, verify: bool = False,
+                 io_scheduler: "IoScheduler" = None, routing: "RoutingRules" = None) -> None:
         """
-        Processes the specified file in four steps:
+        Initializes the processor
+
+        :param archive_root: Directory the archive structure is created in, defaults to the directory of each file
+        :param file_transfer: Transfer layer used to move the files, a new FileTransfer if omitted
+        :param dedup_index: Optional index used to reject files whose content is already archived
+        :param catalog: Optional catalog that records every archived file
+        :param journal: Optional write-ahead journal that makes batches recoverable after a crash
+        :param metrics: Optional metrics receiving the stage timings and counters, nothing is measured if omitted
+        :param upload_backend: Optional central archive every archived file is pushed to
+        :param search_index: Optional full-text index every archived file is queued for
+        :param verify: Hash every source before it is moved, copies to another filesystem are compared with the
+                       hash before the source is deleted and the hash is stored in the catalog
+        :param io_scheduler: Optional scheduler applying per-device concurrency limits and bandwidth caps to the moves
+        :param routing: Rules deciding the directory and name of every file, RoutingRules() if omitted
+        """
+        self.archive_root = archive_root
+        self.file_transfer = file_transfer or FileTransfer()
+        self.dedup_index = dedup_index
+        self.catalog = catalog
+        self.journal = journal
+        self.name_allocator = NameAllocator()
+        self.metrics = metrics or NullMetrics()
+        self.upload_backend = upload_backend
+        self.search_index = search_index
+        self.verify = verify
+        self.io_scheduler = io_scheduler
+        if routing is None:
+            from core.routing_rules import RoutingRules
+            routing = RoutingRules()
+        self.routing = routing
+        # Started on the first batch with more than one file to verify
+        self._hash_executor = None
+
+    def process_file(self, file_path, specializations, exam_parts, file_types, year, period, progress_callback=None) -> str:
+        """
+        Processes the specified file in five steps:
             1. Check if the file exists
-            2. Generate a new filename based on the current date
-            3. Create the destination directory structure if needed
-            4. Move and rename the file
+            2. Generate a new unique filename based on the current date
+            3. Reject the file if its content is already archived (only with a dedup index)
+            4. Create the destination directory structure if needed
+            5. Move and rename the file
 
         :param file_path: Path of the file to process
         :param specializations: Selected specialization
@@ -20,27 +128,406 @@ class FileProcessor:
         :param file_types: Selected file type
         :param year: Selected year
         :param period: Selected period
+        :param progress_callback: Optional callable receiving (bytes_done, bytes_total)
         :return: New path of the processed file
+        :raises DuplicateFileError: If the dedup index knows a file with the same content
+        """
+        job = FileJob(file_path, specializations, exam_parts, file_types, year, period)
+        result = self.process_batch([job], _ProgressListener(progress_callback))[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def process_job(self, job: FileJob, progress_callback=None) -> str:
+        """
+        Processes a FileJob, see process_file
+
+        :param job: The job to process
+        :param progress_callback: Optional callable receiving (bytes_done, bytes_total)
+        :return: New path of the processed file
+        """
+        return self.process_file(job.file_path, job.specialization, job.exam_part, job.file_type,
+                                 job.year, job.period, progress_callback=progress_callback)
+
+    def process_batch(self, jobs: list[FileJob], listener: BatchListener = None) -> list:
+        """
+        Processes several files as one batch
+        Steps 1 and 2 of process_file run for all files first. The resulting plan is written to the
+        journal before the first file is moved, so an interrupted batch can be recovered. Right before
+        its move each name is claimed on disk and the file is checked against the dedup index
+
+        :param jobs: The jobs of the batch
+        :param listener: Optional listener receiving the per-file events
+        :return: New path or raised exception per job
+        """
+        listener = listener or BatchListener()
+        results = [None] * len(jobs)
+
+        metrics = self.metrics
+        planned = []
+        for index, job in enumerate(jobs):
+            start = time.perf_counter()
+            try:
+                planned.append((index, job, *self._plan(job), time.perf_counter() - start))
+            except Exception as error:
+                metrics.increment("files_skipped" if isinstance(error, DuplicateFileError) else "files_failed")
+                results[index] = error
+                listener.on_failed(index, error)
+        if not planned:
+            return results
+
+        batch_id = None
+        if self.journal:
+            with metrics.timer("journal"):
+                batch_id = self.journal.begin([
+                    [os.path.abspath(job.file_path), os.path.abspath(destination_path), _settings(job),
+                     [os.path.abspath(directory) for directory in created_dirs]]
+                    for _, job, destination_path, created_dirs, _, _ in planned
+                ])
+
+        # The sources are hashed in parallel while the earlier files of the batch are moved
+        hashes = self._hash_sources([job.file_path for _, job, *_ in planned]) if self.verify else None
+
+        for move_index, (index, job, destination_path, _, size, plan_seconds) in enumerate(planned):
+            start = time.perf_counter()
+            claimed = dedup_claimed = moved = False
+            try:
+                listener.on_started(index)
+                with metrics.timer("claim"):
+                    # Other processes may archive into the same directory, the name is claimed on disk first
+                    claimed_path = self.name_allocator.claim(destination_path, job.file_path)
+                    claimed = True
+                    if claimed_path != destination_path:
+                        destination_path = claimed_path
+                        if self.journal:
+                            self.journal.redirect(batch_id, move_index, destination_path)
+                if self.dedup_index:
+                    with metrics.timer("dedup"):
+                        self.dedup_index.claim(job.file_path, destination_path)
+                    dedup_claimed = True
+                content_hash = None
+                if hashes:
+                    with metrics.timer("hash"):
+                        content_hash = hashes[move_index].result()
+                self._execute(job, destination_path, lambda done, total, index=index: listener.on_progress(index, done, total),
+                              content_hash)
+                moved = True
+                with metrics.timer("register"):
+                    self._register(job, destination_path, content_hash)
+            except Exception as error:
+                if claimed and not moved:
+                    moved = _is_moved(job.file_path, destination_path, size)
+                if dedup_claimed:
+                    if moved:
+                        # The file is archived even though registering it failed, its claim stays valid
+                        self.dedup_index.commit(destination_path)
+                    else:
+                        self.dedup_index.release(destination_path)
+                if not claimed:
+                    self.name_allocator.release(destination_path)
+                elif not moved:
+                    # The source is still there, the destination is the claimed name or an unverified copy
+                    _remove_claim(destination_path)
+                metrics.increment("files_skipped" if isinstance(error, DuplicateFileError) else "files_failed")
+                results[index] = error
+                listener.on_failed(index, error)
+                continue
+            if self.journal:
+                self.journal.mark_done(batch_id, move_index)
+            if self.upload_backend:
+                try:
+                    with metrics.timer("upload"):
+                        self.upload_backend.upload(destination_path, self._archive_key(job, destination_path),
+                                                   lambda done, total, index=index: listener.on_progress(index, done, total))
+                except Exception as error:
+                    # The file stays archived locally, the upload is resumed by recover
+                    metrics.increment("uploads_failed")
+                    results[index] = error
+                    listener.on_failed(index, error)
+                    continue
+            metrics.observe("file", plan_seconds + time.perf_counter() - start)
+            metrics.increment("files_processed")
+            metrics.increment("bytes_moved", size)
+            results[index] = destination_path
+            listener.on_finished(index, destination_path)
+
+        for future in hashes or []:
+            # Hashes of files that were cancelled before their move
+            future.cancel()
+        if self.journal:
+            self.journal.end(batch_id)
+        return results
+
+    def close(self) -> None:
+        """
+        Stops the hashing processes of the verify mode and closes the journal
+        """
+        if self._hash_executor is not None:
+            self._hash_executor.shutdown(wait=True, cancel_futures=True)
+            self._hash_executor = None
+        if self.journal:
+            self.journal.close()
+
+    def recover(self, roll_back: bool = False) -> int:
+        """
+        Finishes the batches the journal reports as interrupted
+        Moves whose source still exists are executed (roll forward), or moved files are put back to
+        their source and created directories are removed (roll back). Afterwards interrupted uploads
+        to the upload backend are resumed
+
+        :param roll_back: Undo the interrupted batches instead of completing them
+        :return: Number of files that were moved during recovery
+        """
+        moved = 0
+        for batch in self.journal.incomplete_batches() if self.journal else []:
+            for source, destination, settings, created_dirs in batch.moves:
+                source_exists = os.path.exists(source)
+                destination_exists = os.path.exists(destination)
+                if source_exists and destination_exists and _is_claim(source, destination):
+                    # Interrupted before the move replaced the placeholder, the name is still ours
+                    _remove_claim(destination)
+                    destination_exists = False
+                if roll_back:
+                    if destination_exists and not source_exists:
+                        self.file_transfer.move(destination, source)
+                        moved += 1
+                    elif destination_exists and _holds_copy(source, destination):
+                        # The name was claimed with a link or the copy finished, but the source was not deleted yet
+                        os.unlink(destination)
+                    elif destination_exists:
+                        # The name was taken by another writer before it was claimed
+                        continue
+                    self._forget(destination)
+                    _remove_empty_dirs(created_dirs)
+                else:
+                    content_hash = hash_file(source) if self.verify and source_exists else None
+                    if source_exists and destination_exists and _holds_copy(source, destination):
+                        os.unlink(source)
+                    elif source_exists:
+                        # The name was not claimed yet, or another writer has taken it in the meantime
+                        destination = self.name_allocator.claim(destination, source)
+                        if self.dedup_index:
+                            try:
+                                self.dedup_index.claim(source, destination)
+                            except DuplicateFileError:
+                                _remove_claim(destination)
+                                continue
+                        self.file_transfer.move(source, destination, expected_hash=content_hash)
+                        moved += 1
+                    if os.path.exists(destination):
+                        self._register(FileJob(source, *settings), destination, content_hash)
+                        if self.upload_backend:
+                            key = self._archive_key(FileJob(source, *settings), destination)
+                            try:
+                                self.upload_backend.upload(destination, key)
+                            except Exception as error:
+                                # The file is archived locally, a resumable upload is retried on the next recover
+                                _logger.warning("Upload of %s to %s failed: %s", destination, key, error)
+                                self.metrics.increment("uploads_failed")
+            self.journal.end(batch.batch_id)
+        self.flush()
+        if self.upload_backend:
+            self.upload_backend.resume_pending(lambda key, error: self.metrics.increment("uploads_failed"))
+        return moved
+
+    def flush(self) -> None:
+        """
+        Flushes the files moved since the last flush to stable storage, see FileTransfer.flush,
+        and writes the texts the search index has extracted so far
+        """
+        self.file_transfer.flush()
+        if self.search_index:
+            self.search_index.flush()
+
+    def _plan(self, job: FileJob) -> tuple[str, list[str], int]:
+        """
+        Checks the file and generates its destination
+
+        :return: Destination path, the directories that have to be created for it (deepest first) and the file size
+        """
+        metrics = self.metrics
+        with metrics.timer("check"):
+            try:
+                size = os.stat(job.file_path).st_size
+            except FileNotFoundError:
+                raise FileNotFoundError(f"File not found: {job.file_path}") from None
+
+        with metrics.timer("name"):
+            original_filename = os.path.basename(job.file_path)
+            file_extension = os.path.splitext(original_filename)[1].lower()
+            date = datetime.now().strftime("%Y%m%d%H%M%S")
+            base_destination = self._base_destination(job)
+            destination_path = self.name_allocator.allocate(base_destination, self.routing.file_stem(job, date),
+                                                            file_extension)
+
+        created_dirs = []
+        directory = base_destination
+        while directory and not os.path.isdir(directory):
+            created_dirs.append(directory)
+            directory = os.path.dirname(directory)
+        return destination_path, created_dirs, size
+
+    def _execute(self, job: FileJob, destination_path: str, progress_callback, content_hash: bytes = None) -> None:
+        """
+        Creates the destination directory and moves the file
+        With content_hash a copy to another filesystem is verified before the source is deleted
+        """
+        metrics = self.metrics
+        with metrics.timer("makedirs"):
+            os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+        if self.io_scheduler:
+            with self.io_scheduler.transfer(job.file_path, os.path.dirname(destination_path)) as throttle:
+                with metrics.timer("move"):
+                    self.file_transfer.move(job.file_path, destination_path, progress_callback,
+                                            expected_hash=content_hash, throttle=throttle)
+        else:
+            with metrics.timer("move"):
+                self.file_transfer.move(job.file_path, destination_path, progress_callback, expected_hash=content_hash)
+
+    def device_key(self, job: FileJob):
+        """
+        Groups jobs that compete for the same devices, see IoScheduler.device_key
+
+        :return: (source device, destination device), None without io_scheduler or if the source is gone
+        """
+        if not self.io_scheduler:
+            return None
+        try:
+            return self.io_scheduler.device_key(job.file_path, self._base_destination(job))
+        except OSError:
+            return None
+
+    def _base_destination(self, job: FileJob) -> str:
+        """
+        :return: Directory a job is archived in
         """
-        print(f"Started processing file: {file_path}")
+        original_directory = self.archive_root or os.path.dirname(job.file_path)
+        return os.path.join(original_directory, self.routing.directory(job))
 
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"File not found: {file_path}")
+    def _archive_key(self, job: FileJob, destination_path: str) -> str:
+        """
+        :return: Key of an archived file for the upload backend, see archive_key
+        """
+        return archive_key(destination_path, len(self.routing.directory(job).split(os.sep)))
 
-        print("Generating filename...")
-        original_filename = os.path.basename(file_path)
-        file_extension = os.path.splitext(original_filename)[1].lower()
-        date = datetime.now().strftime("%Y%m%d%H%M%S")
-        new_filename = f"{file_types}_{date}{file_extension}"
+    def _hash_sources(self, paths: list[str]) -> list[Future]:
+        """
+        Hashes the given files in the hash process pool, a single file is hashed right away
 
-        print("Creating destination directory...")
-        original_directory = os.path.dirname(file_path)
-        base_destination = os.path.join(original_directory, specializations, exam_parts, year, period)
-        os.makedirs(base_destination, exist_ok=True)
+        :return: Future of the digest per file
+        """
+        if len(paths) == 1:
+            future = Future()
+            try:
+                future.set_result(hash_file(paths[0]))
+            except Exception as error:
+                future.set_exception(error)
+            return [future]
+        if self._hash_executor is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
 
-        print("Moving and renaming the file...")
-        destination_path = os.path.join(base_destination, new_filename)
-        shutil.move(file_path, destination_path)
-        print(f"File renamed and moved to: {destination_path}")
+            # Forking a process that runs threads with open database connections is unsafe
+            self._hash_executor = ProcessPoolExecutor(max_workers=Config.get_hash_workers(),
+                                                      mp_context=multiprocessing.get_context("spawn"))
+        return [self._hash_executor.submit(hash_file, path) for path in paths]
+
+    def _register(self, job: FileJob, destination_path: str, content_hash: bytes = None) -> None:
+        """
+        Records a moved file in the dedup index and the catalog and queues it for the search index
+        """
+        if self.dedup_index:
+            self.dedup_index.commit(destination_path)
+        if self.catalog:
+            self.catalog.add(destination_path, job.specialization, job.exam_part, job.year, job.period, job.file_type,
+                             content_hash)
+        if self.search_index:
+            self.search_index.submit(destination_path, job.specialization, job.exam_part, job.year, job.period,
+                                     job.file_type)
 
-        return destination_path
\ No newline at end of file
+    def _forget(self, destination_path: str) -> None:
+        """
+        Removes a file that was moved back from the dedup index, the catalog and the search index
+        """
+        if self.dedup_index:
+            self.dedup_index.release(destination_path)
+        if self.catalog:
+            self.catalog.remove(destination_path)
+        if self.search_index:
+            self.search_index.remove(destination_path)
+
+
+def archive_key(destination_path: str, levels: int = 4) -> str:
+    """
+    :param levels: Number of directories between the archive root and the file, see RoutingRules.directory
+    :return: Key of an archived file for the upload backends, its path below the archive root,
+             <specialization>/<exam part>/<year>/<period>/<name> with the default routing rules
+    """
+    parts = os.path.normpath(destination_path).split(os.sep)
+    return "/".join(parts[-(levels + 1):])
+
+
+def _settings(job: FileJob) -> list[str]:
+    """
+    :return: The five settings of a job in FileJob order
+    """
+    return [job.specialization, job.exam_part, job.file_type, job.year, job.period]
+
+
+def _holds_copy(source: str, destination: str) -> bool:
+    """
+    :return: True if destination is a hard link to source or has the same content
+    """
+    source_stat = os.stat(source)
+    destination_stat = os.stat(destination)
+    if os.path.samestat(source_stat, destination_stat):
+        return True
+    return source_stat.st_size == destination_stat.st_size and hash_file(source) == hash_file(destination, drop_cache=True)
+
+
+def _is_claim(source: str, destination: str) -> bool:
+    """
+    :return: True if destination is shorter than source, i.e. the placeholder that claimed the name or an unfinished
+             copy, and not a file of its own
+    """
+    try:
+        return os.path.getsize(destination) < os.path.getsize(source)
+    except OSError:
+        return False
+
+
+def _is_moved(source: str, destination: str, size: int) -> bool:
+    """
+    Decides after a failure whether the move onto a claimed name already took place, the destination must then be
+    kept. If the source vanished for another reason, e.g. because another process archived it, a link claiming the
+    name is kept as well, a second copy is cheaper than losing the only one. Only a placeholder is removed
+
+    :param size: Size of the source when it was planned
+    """
+    if os.path.exists(source):
+        return False
+    try:
+        return os.path.getsize(destination) == size
+    except OSError:
+        return False
+
+
+def _remove_claim(path: str) -> None:
+    """
+    Removes the link or placeholder file that claimed a destination name
+    """
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def _remove_empty_dirs(directories: list[str]) -> None:
+    """
+    Removes the given directories, deepest first, as long as they are empty
+    """
+    for directory in directories:
+        try:
+            os.rmdir(directory)
+        except OSError:
+            pass
@@ -0,0 +1,303 @@
+import errno
+import hashlib
+import json
+import os
+import shutil
+import threading
+from enum import Enum
+
+from config.config import Config
+from core.dedup_index import hash_file
+
+# Errors that mean a zero-copy system call is not usable for the given pair of files
+_UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF, errno.ENOTSUP}
+_O_BINARY = getattr(os, "O_BINARY", 0)
+
+
+class FsyncPolicy(Enum):
+    """
+    When moved files are flushed to stable storage
+    """
+    NONE = "none"
+    PER_FILE = "per_file"
+    PER_BATCH = "per_batch"
+
+
+class TransferVerificationError(OSError):
+    """
+    Raised when the copied file does not match the hash of its source, the source is kept
+    """
+    def __init__(self, source: str, destination: str) -> None:
+        super().__init__(errno.EIO, f"Copy of {source} to {destination} does not match the source")
+        self.source = source
+        self.destination = destination
+
+
+class FileTransfer:
+    """
+    Moves files into the archive
+    Moves within one filesystem are plain renames. Moves to another filesystem copy the data with
+    zero-copy system calls into a hidden partial file next to the destination, which is resumed
+    if the same source is moved again after an interruption
+    """
+    def __init__(self, chunk_size: int = None, fsync_policy: FsyncPolicy = None) -> None:
+        """
+        Initializes the transfer layer
+
+        :param chunk_size: Bytes copied per system call, Config.get_transfer_chunk_size() if omitted
+        :param fsync_policy: Durability policy, Config.get_fsync_policy() if omitted
+        """
+        self.chunk_size = chunk_size or Config.get_transfer_chunk_size()
+        self.fsync_policy = fsync_policy or FsyncPolicy(Config.get_fsync_policy())
+        self._lock = threading.Lock()
+        self._unsynced_files = set()
+        self._unsynced_dirs = set()
+
+    @staticmethod
+    def is_same_device(source: str, destination_dir: str) -> bool:
+        """
+        :return: True if a file can be renamed from source into destination_dir
+        """
+        return os.stat(source).st_dev == os.stat(destination_dir).st_dev
+
+    def move(self, source: str, destination: str, progress_callback=None, expected_hash: bytes = None,
+             throttle=None) -> str:
+        """
+        Moves source to destination
+
+        :param source: File to move
+        :param destination: New path of the file, its directory must exist. An existing file is replaced,
+                            a hard link to source is kept and only source is removed
+        :param progress_callback: Optional callable receiving (bytes_done, bytes_total)
+        :param expected_hash: BLAKE2b digest of the source (see hash_file). A copy to another filesystem is read
+                              back and compared with it before the source is deleted
+        :param throttle: Optional callable receiving the size of every copied chunk, may block to limit bandwidth
+        :return: The destination path
+        :raises TransferVerificationError: If the copy does not match, nothing is moved
+        """
+        destination_dir = os.path.dirname(destination) or "."
+        source_stat = os.stat(source)
+        if source_stat.st_dev == os.stat(destination_dir).st_dev:
+            try:
+                if _is_link_of(source_stat, destination):
+                    # The name was claimed with a hard link to the source, only the source has to go
+                    os.unlink(source)
+                else:
+                    # An existing destination is the placeholder that claimed the name, it is replaced atomically
+                    os.replace(source, destination)
+            except OSError as error:
+                if error.errno != errno.EXDEV:
+                    raise
+            else:
+                # The file is moved, neither a cancellation in the final progress report nor a failed directory
+                # sync may let the caller take it for an unmoved file and remove the destination
+                if progress_callback:
+                    try:
+                        progress_callback(source_stat.st_size, source_stat.st_size)
+                    except Exception:
+                        pass
+                try:
+                    self._after_move(None, destination_dir)
+                except OSError:
+                    # Synced again with the next flush
+                    with self._lock:
+                        self._unsynced_dirs.add(destination_dir)
+                return destination
+
+        self._copy_resumable(source, destination, progress_callback, expected_hash, throttle)
+        os.unlink(source)
+        return destination
+
+    def copy(self, source: str, destination: str, progress_callback=None) -> str:
+        """
+        Copies source to destination through a resumable partial file, the source is kept
+
+        :param source: File to copy
+        :param destination: Path of the copy, its directory must exist
+        :param progress_callback: Optional callable receiving (bytes_done, bytes_total)
+        :return: The destination path
+        """
+        self._copy_resumable(source, destination, progress_callback)
+        return destination
+
+    def flush(self) -> None:
+        """
+        Flushes all files moved since the last flush to stable storage
+        Only has an effect with FsyncPolicy.PER_BATCH or after a directory sync of PER_FILE failed
+        """
+        with self._lock:
+            files, self._unsynced_files = self._unsynced_files, set()
+            dirs, self._unsynced_dirs = self._unsynced_dirs, set()
+        for path in files:
+            try:
+                fd = os.open(path, os.O_RDONLY | _O_BINARY)
+            except OSError:
+                continue
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        for path in dirs:
+            _fsync_dir(path)
+
+    def _after_move(self, file_path, directory: str) -> None:
+        """
+        Applies the fsync policy to a completed move
+        The file itself has already been synced for PER_FILE
+        """
+        if self.fsync_policy == FsyncPolicy.PER_FILE:
+            _fsync_dir(directory)
+        elif self.fsync_policy == FsyncPolicy.PER_BATCH:
+            with self._lock:
+                if file_path:
+                    self._unsynced_files.add(file_path)
+                self._unsynced_dirs.add(directory)
+
+    def _copy_resumable(self, source: str, destination: str, progress_callback, expected_hash: bytes = None,
+                        throttle=None) -> None:
+        """
+        Copies source to destination through a partial file that survives interruptions
+        With expected_hash the partial file is flushed, read back and compared before it replaces destination
+        """
+        destination_dir = os.path.dirname(destination) or "."
+        source_stat = os.stat(source)
+        part_path, meta_path = _partial_paths(source, destination_dir)
+        source_identity = {"size": source_stat.st_size, "mtime_ns": source_stat.st_mtime_ns}
+
+        offset = 0
+        if os.path.exists(part_path) and _read_json(meta_path) == source_identity:
+            # The tail of the partial file may not have reached the disk, copy the last chunk again
+            offset = max(0, min(os.path.getsize(part_path), source_stat.st_size) - self.chunk_size)
+        else:
+            with open(meta_path, "w") as f:
+                json.dump(source_identity, f)
+
+        source_fd = os.open(source, os.O_RDONLY | _O_BINARY)
+        try:
+            part_fd = os.open(part_path, os.O_WRONLY | os.O_CREAT | _O_BINARY, 0o644)
+            try:
+                os.ftruncate(part_fd, offset)
+                self._copy_range(source_fd, part_fd, offset, source_stat.st_size, progress_callback, throttle)
+                if self.fsync_policy == FsyncPolicy.PER_FILE or expected_hash is not None:
+                    os.fsync(part_fd)
+            finally:
+                os.close(part_fd)
+        finally:
+            os.close(source_fd)
+
+        if expected_hash is not None and hash_file(part_path, drop_cache=True) != expected_hash:
+            # Start over on the next attempt, the partial file cannot be trusted
+            os.unlink(part_path)
+            os.unlink(meta_path)
+            raise TransferVerificationError(source, destination)
+        shutil.copystat(source, part_path)
+        os.replace(part_path, destination)
+        os.unlink(meta_path)
+        self._after_move(destination, destination_dir)
+
+    def _copy_range(self, source_fd: int, destination_fd: int, offset: int, size: int, progress_callback,
+                    throttle=None) -> None:
+        """
+        Copies source_fd[offset:size] to the same offset of destination_fd
+        Uses copy_file_range, then sendfile and finally read/write, whichever the platform supports
+        """
+        use_copy_file_range = hasattr(os, "copy_file_range")
+        use_sendfile = hasattr(os, "sendfile") and os.name == "posix"
+
+        if progress_callback:
+            progress_callback(offset, size)
+        while offset < size:
+            count = min(self.chunk_size, size - offset)
+            copied = 0
+            if use_copy_file_range:
+                try:
+                    copied = os.copy_file_range(source_fd, destination_fd, count, offset, offset)
+                except OSError as error:
+                    if error.errno not in _UNSUPPORTED_ERRNOS:
+                        raise
+                    use_copy_file_range = False
+                    continue
+                if copied == 0:
+                    # Some filesystems report 0 instead of an error, continue with the next method
+                    use_copy_file_range = False
+                    continue
+            elif use_sendfile:
+                try:
+                    os.lseek(destination_fd, offset, os.SEEK_SET)
+                    copied = os.sendfile(destination_fd, source_fd, offset, count)
+                except OSError as error:
+                    if error.errno not in _UNSUPPORTED_ERRNOS:
+                        raise
+                    use_sendfile = False
+                    continue
+                if copied == 0:
+                    use_sendfile = False
+                    continue
+            else:
+                data = _read_at(source_fd, count, offset)
+                os.lseek(destination_fd, offset, os.SEEK_SET)
+                copied = os.write(destination_fd, data)
+
+            if copied == 0:
+                raise OSError(errno.EIO, f"Source file shrank while copying, expected {size} bytes")
+            offset += copied
+            if throttle:
+                throttle(copied)
+            if progress_callback:
+                progress_callback(offset, size)
+
+
+def _partial_paths(source: str, destination_dir: str) -> tuple[str, str]:
+    """
+    :return: Paths of the partial file and its metadata for a source moved into destination_dir
+    """
+    key = hashlib.blake2b(os.path.abspath(source).encode("utf-8"), digest_size=8).hexdigest()
+    part_path = os.path.join(destination_dir, f".{key}.part")
+    return part_path, part_path + ".json"
+
+
+def _is_link_of(source_stat: os.stat_result, path: str) -> bool:
+    """
+    :return: True if path is a hard link to the file source_stat belongs to
+    """
+    try:
+        return os.path.samestat(source_stat, os.stat(path))
+    except FileNotFoundError:
+        return False
+
+
+def _read_json(path: str):
+    """
+    :return: Decoded content of a JSON file or None if it is missing or broken
+    """
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _read_at(fd: int, count: int, offset: int) -> bytes:
+    """
+    Reads up to count bytes at offset, also on platforms without os.pread
+    """
+    if hasattr(os, "pread"):
+        return os.pread(fd, count, offset)
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, count)
+
+
+def _fsync_dir(path: str) -> None:
+    """
+    Flushes a directory entry to stable storage where the platform supports it
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,257 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+from config.config import Config
+from core.file_processor import FileJob, FileProcessor
+from core.processing_engine import ProcessingEngine, ProcessingListener
+
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_Q_OVERFLOW = 0x00004000
+_IN_ISDIR = 0x40000000
+_EVENT_HEADER = struct.Struct("iIII")
+# Seconds a closed file has to stay closed, writers that open a file several times close it in between
+_CLOSE_WRITE_DEBOUNCE = 0.5
+
+
+class _InotifySource:
+    """
+    Reports files that were closed after writing or moved into the inboxes (Linux only)
+    """
+    def __init__(self, inboxes: list[str]) -> None:
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._directories = {}
+        for inbox in inboxes:
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(inbox), _IN_CLOSE_WRITE | _IN_MOVED_TO)
+            if wd < 0:
+                os.close(self._fd)
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {inbox}")
+            self._directories[wd] = inbox
+
+    def wait(self, timeout: float):
+        """
+        Waits for events
+
+        :return: (path, closed) of the reported files, closed is True after a close-write event and False if the
+                 file was moved in. None if the inboxes have to be rescanned
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self._fd, 256 * 1024)
+        except BlockingIOError:
+            return []
+        paths = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + name_length].rstrip(b"\0")
+            offset += name_length
+            if mask & _IN_Q_OVERFLOW:
+                return None
+            if mask & _IN_ISDIR or wd not in self._directories or not name:
+                continue
+            paths.append((os.path.join(self._directories[wd], os.fsdecode(name)), bool(mask & _IN_CLOSE_WRITE)))
+        return paths
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class FolderWatcher:
+    """
+    Watches inbox directories and archives new files with a fixed preset of the five settings
+    A file counts as complete shortly after its last close-write event (inotify) or once its size and modification
+    time have been stable for settle_time seconds (polling and files moved into an inbox). Completed files are collected and handed to the
+    processing engine together, so a large dump results in a few batches instead of one pass per file
+    """
+    def __init__(self, inboxes: list[str], preset: tuple, file_processor: FileProcessor, listener: ProcessingListener = None,
+                 settle_time: float = None, poll_interval: float = None, use_inotify: bool = None,
+                 max_workers: int = None) -> None:
+        """
+        Initializes the watcher
+
+        :param inboxes: Directories to watch, files directly inside them are processed
+        :param preset: (specialization, exam_part, file_type, year, period) used for all files
+        :param file_processor: Processor the files are archived with
+        :param listener: Optional listener that receives the processing events
+        :param settle_time: Seconds a file has to stay unchanged, Config.get_watch_settle_time() if omitted
+        :param poll_interval: Seconds between two scans, Config.get_watch_poll_interval() if omitted
+        :param use_inotify: Force or disable inotify, used automatically on Linux if omitted
+        :param max_workers: Number of worker threads, Config.get_max_workers() if omitted
+        """
+        self.inboxes = [os.path.abspath(inbox) for inbox in inboxes]
+        self.preset = tuple(preset)
+        self.listener = listener or ProcessingListener()
+        self.settle_time = Config.get_watch_settle_time() if settle_time is None else settle_time
+        self.poll_interval = poll_interval or Config.get_watch_poll_interval()
+        if use_inotify is None:
+            use_inotify = sys.platform.startswith("linux")
+        self.use_inotify = use_inotify
+
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        # Path -> (signature, time of the last change) of files that are not complete yet
+        self._pending = {}
+        # Job id -> path of the files handed to the engine
+        self._in_flight = {}
+        self._in_flight_paths = set()
+        # Path -> signature of files that failed, they are retried once they change and dropped once they are gone
+        self._failed = {}
+        self.engine = ProcessingEngine(file_processor, _WatcherListener(self), max_workers=max_workers)
+
+    def run(self) -> None:
+        """
+        Watches the inboxes until stop is called, files in flight are finished before returning
+        """
+        source = None
+        if self.use_inotify:
+            try:
+                source = _InotifySource(self.inboxes)
+            except (OSError, AttributeError):
+                source = None
+        try:
+            self._scan()
+            while not self._stop_event.is_set():
+                if source is None:
+                    self._stop_event.wait(self.poll_interval)
+                    self._scan()
+                else:
+                    debounce = min(self.settle_time, _CLOSE_WRITE_DEBOUNCE)
+                    paths = source.wait(min(self.poll_interval, self.settle_time or self.poll_interval,
+                                            debounce or self.poll_interval))
+                    if paths is None:
+                        self._scan()
+                    elif not paths:
+                        self._prune_failed()
+                    else:
+                        now = time.monotonic()
+                        with self._lock:
+                            for path, closed in paths:
+                                if not os.path.basename(path).startswith("."):
+                                    # A closed file is complete unless it is opened again right away, a file that
+                                    # was moved in may still be open elsewhere. Files in flight stay pending until
+                                    # their job is done, they were written again while being archived
+                                    self._pending[path] = (None, now - self.settle_time + debounce if closed else now)
+                                    self._failed.pop(path, None)
+                self._dispatch_ready()
+        finally:
+            if source is not None:
+                source.close()
+            self.engine.shutdown(wait=True)
+
+    def stop(self) -> None:
+        """
+        Makes run return after the current iteration
+        """
+        self._stop_event.set()
+
+    def _scan(self) -> None:
+        """
+        Lists the inboxes and updates the signatures of the pending files
+        """
+        now = time.monotonic()
+        seen = set()
+        for inbox in self.inboxes:
+            try:
+                with os.scandir(inbox) as entries:
+                    for entry in entries:
+                        if entry.name.startswith(".") or not entry.is_file(follow_symlinks=False):
+                            continue
+                        try:
+                            stat = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        seen.add(entry.path)
+                        signature = (stat.st_size, stat.st_mtime_ns)
+                        with self._lock:
+                            if entry.path in self._in_flight_paths or self._failed.get(entry.path) == signature:
+                                continue
+                            previous = self._pending.get(entry.path)
+                            if previous is None or previous[0] != signature:
+                                self._pending[entry.path] = (signature, now)
+            except OSError:
+                continue
+        with self._lock:
+            for path in [path for path in self._pending if path not in seen]:
+                del self._pending[path]
+            for path in [path for path in self._failed if path not in seen]:
+                del self._failed[path]
+
+    def _prune_failed(self) -> None:
+        """
+        Forgets failed files that were removed from the inboxes, inotify does not report removals
+        """
+        with self._lock:
+            failed = list(self._failed)
+        gone = [path for path in failed if not os.path.lexists(path)]
+        with self._lock:
+            for path in gone:
+                self._failed.pop(path, None)
+
+    def _dispatch_ready(self) -> None:
+        """
+        Hands all files whose settle time has passed to the engine in one go
+        """
+        now = time.monotonic()
+        with self._lock:
+            ready = [path for path, (_, changed) in self._pending.items()
+                     if now - changed >= self.settle_time and path not in self._in_flight_paths]
+            for path in ready:
+                del self._pending[path]
+        ready = [path for path in ready if os.path.isfile(path)]
+        if ready:
+            self.engine.submit_many([FileJob(path, *self.preset) for path in ready])
+
+
+class _WatcherListener(ProcessingListener):
+    """
+    Tracks the files of the watcher that are in flight and forwards all events
+    """
+    def __init__(self, watcher: FolderWatcher) -> None:
+        self.watcher = watcher
+
+    def on_queued(self, job_id, job) -> None:
+        with self.watcher._lock:
+            self.watcher._in_flight[job_id] = job.file_path
+            self.watcher._in_flight_paths.add(job.file_path)
+        self.watcher.listener.on_queued(job_id, job)
+
+    def on_started(self, job_id, job) -> None:
+        self.watcher.listener.on_started(job_id, job)
+
+    def on_progress(self, job_id, bytes_done, bytes_total) -> None:
+        self.watcher.listener.on_progress(job_id, bytes_done, bytes_total)
+
+    def on_finished(self, job_id, destination_path) -> None:
+        with self.watcher._lock:
+            path = self.watcher._in_flight.pop(job_id, None)
+            self.watcher._in_flight_paths.discard(path)
+            self.watcher._failed.pop(path, None)
+        self.watcher.listener.on_finished(job_id, destination_path)
+
+    def on_failed(self, job_id, error) -> None:
+        with self.watcher._lock:
+            path = self.watcher._in_flight.pop(job_id, None)
+            self.watcher._in_flight_paths.discard(path)
+            if path is not None:
+                try:
+                    stat = os.stat(path)
+                    self.watcher._failed[path] = (stat.st_size, stat.st_mtime_ns)
+                except OSError:
+                    pass
+        self.watcher.listener.on_failed(job_id, error)
+
+    def on_feed_failed(self, error) -> None:
+        self.watcher.listener.on_feed_failed(error)
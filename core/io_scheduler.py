@@ -0,0 +1,232 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from config.config import Config
+from core.metrics import Metrics, NullMetrics
+
+# File system types whose data lives on another machine
+_NETWORK_FILESYSTEMS = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "9p", "fuse.sshfs", "afs", "ceph", "glusterfs"}
+_MEMORY_FILESYSTEMS = {"tmpfs", "ramfs"}
+# Bound of the cache mapping destination directories to devices
+_MAX_CACHED_DIRECTORIES = 4096
+
+
+class _TokenBucket:
+    """
+    Limits the bandwidth of a device, bursts of up to one second are allowed
+    Consumers go into debt and sleep it off, so large chunks are throttled as precisely as small ones
+    """
+    def __init__(self, bytes_per_second: int) -> None:
+        self.rate = bytes_per_second
+        self._lock = threading.Lock()
+        self._tokens = float(bytes_per_second)
+        self._updated = time.monotonic()
+
+    def consume(self, amount: int) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate) - amount
+            self._updated = now
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class _Device:
+    """
+    Concurrency slots, bandwidth cap and queue statistics of one device
+    """
+    def __init__(self, name: str, device_class: str, concurrency: int, bytes_per_second: int = None) -> None:
+        self.name = name
+        self.device_class = device_class
+        self.concurrency = max(1, concurrency)
+        self.bucket = _TokenBucket(bytes_per_second) if bytes_per_second else None
+        self.condition = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+
+
+class IoScheduler:
+    """
+    Schedules the moves of the FileProcessor by device
+    Renames within one device only touch metadata and are never delayed. Copies take a slot on the source and
+    the destination device, the number of slots depends on the kind of device: one for spinning disks and
+    removable media, several for SSDs and network shares. Copies can additionally be capped in bandwidth.
+    The number of waiting and running copies per device is published as the gauges io_queue_depth and io_active
+    """
+    def __init__(self, metrics: Metrics = None, limits: dict = None) -> None:
+        """
+        :param metrics: Receives the per-device gauges and the io_wait stage
+        :param limits: Path -> (concurrency, bytes per second or None) overriding the limits of the device the
+                       path is on, the defaults per kind of device come from Config.get_device_limits()
+        """
+        self.metrics = metrics or NullMetrics()
+        self._lock = threading.Lock()
+        self._devices = {}
+        self._directory_devices = {}
+        self._overrides = {}
+        for path, limit in (limits or {}).items():
+            self._overrides[self.device_of(path)] = limit
+
+    def device_of(self, path: str) -> int:
+        """
+        :return: st_dev of path, or of its nearest existing parent if it does not exist yet
+        """
+        path = os.path.abspath(path)
+        while True:
+            try:
+                return os.stat(path).st_dev
+            except FileNotFoundError:
+                parent = os.path.dirname(path)
+                if parent == path:
+                    raise
+                path = parent
+
+    def device_key(self, source: str, destination_dir: str) -> tuple[int, int]:
+        """
+        Groups moves that compete for the same devices, destination directories are cached
+
+        :return: (source device, destination device)
+        """
+        with self._lock:
+            destination_device = self._directory_devices.get(destination_dir)
+        if destination_device is None:
+            destination_device = self.device_of(destination_dir)
+            with self._lock:
+                if len(self._directory_devices) >= _MAX_CACHED_DIRECTORIES:
+                    self._directory_devices.clear()
+                self._directory_devices[destination_dir] = destination_device
+        return os.stat(source).st_dev, destination_device
+
+    @staticmethod
+    def is_rename(device_key: tuple[int, int]) -> bool:
+        """
+        :return: True if moves with this device key are renames
+        """
+        return device_key[0] == device_key[1]
+
+    @contextmanager
+    def transfer(self, source: str, destination_dir: str):
+        """
+        Runs the enclosed move once the devices it needs are available
+
+        :return: None for renames, otherwise a callable that is called with the number of copied bytes
+                 and applies the bandwidth caps
+        """
+        key = self.device_key(source, destination_dir)
+        if self.is_rename(key):
+            yield None
+            return
+        # Always taken in the same order, so two copies in opposite directions cannot deadlock
+        devices = [self._device(device) for device in sorted(set(key))]
+        with self.metrics.timer("io_wait"):
+            for device in devices:
+                self._acquire(device)
+        try:
+            buckets = [device.bucket for device in devices if device.bucket]
+            if buckets:
+                def throttle(amount: int) -> None:
+                    for bucket in buckets:
+                        bucket.consume(amount)
+                yield throttle
+            else:
+                yield None
+        finally:
+            for device in reversed(devices):
+                self._release(device)
+
+    def queue_depths(self) -> dict[str, tuple[int, int]]:
+        """
+        :return: Device name -> (waiting copies, running copies)
+        """
+        with self._lock:
+            devices = list(self._devices.values())
+        return {device.name: (device.waiting, device.active) for device in devices}
+
+    def _device(self, device_id: int) -> _Device:
+        with self._lock:
+            device = self._devices.get(device_id)
+            if device is None:
+                device_class = device_class_of(device_id)
+                concurrency, bytes_per_second = self._overrides.get(device_id) or Config.get_device_limits()[device_class]
+                device = self._devices[device_id] = _Device(_device_name(device_id), device_class, concurrency,
+                                                            bytes_per_second)
+            return device
+
+    def _acquire(self, device: _Device) -> None:
+        with device.condition:
+            device.waiting += 1
+            self._publish(device)
+            device.condition.wait_for(lambda: device.active < device.concurrency)
+            device.waiting -= 1
+            device.active += 1
+            self._publish(device)
+
+    def _release(self, device: _Device) -> None:
+        with device.condition:
+            device.active -= 1
+            self._publish(device)
+            device.condition.notify()
+
+    def _publish(self, device: _Device) -> None:
+        self.metrics.set_gauge("io_queue_depth", device.waiting, device.name)
+        self.metrics.set_gauge("io_active", device.active, device.name)
+
+
+def device_class_of(device_id: int) -> str:
+    """
+    Determines the kind of a device from sysfs and the mount table, only on Linux
+
+    :return: rotational, removable, ssd, network, memory or unknown
+    """
+    if not hasattr(os, "major") or not os.path.isdir("/sys/dev/block"):
+        return "unknown"
+    major, minor = os.major(device_id), os.minor(device_id)
+    if major == 0:
+        # Anonymous devices are used by network and memory file systems, tell them apart by the mount table
+        filesystem = _filesystem_type(f"{major}:{minor}")
+        if filesystem in _NETWORK_FILESYSTEMS:
+            return "network"
+        if filesystem in _MEMORY_FILESYSTEMS:
+            return "memory"
+        return "unknown"
+    block = os.path.realpath(f"/sys/dev/block/{major}:{minor}")
+    # Partitions have no queue directory of their own, the attributes are on the disk
+    disk = block if os.path.isdir(os.path.join(block, "queue")) else os.path.dirname(block)
+    if _read_flag(os.path.join(disk, "removable")):
+        return "removable"
+    rotational = _read_flag(os.path.join(disk, "queue", "rotational"))
+    if rotational is None:
+        return "unknown"
+    return "rotational" if rotational else "ssd"
+
+
+def _filesystem_type(device_number: str):
+    """
+    :return: Type of the file system mounted from major:minor, None if it is not found
+    """
+    try:
+        with open("/proc/self/mountinfo", encoding="utf-8") as f:
+            for line in f:
+                fields = line.split(" - ", 1)
+                if len(fields) == 2 and fields[0].split()[2] == device_number:
+                    return fields[1].split()[0]
+    except OSError:
+        pass
+    return None
+
+
+def _read_flag(path: str):
+    try:
+        with open(path) as f:
+            return f.read().strip() == "1"
+    except OSError:
+        return None
+
+
+def _device_name(device_id: int) -> str:
+    if hasattr(os, "major"):
+        return f"{os.major(device_id)}:{os.minor(device_id)}"
+    return str(device_id)
@@ -0,0 +1,275 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# Upper bounds in seconds of the latency histogram buckets, the last bucket is unbounded
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_logger = logging.getLogger("pruefungsdateien.metrics")
+_NULL_TIMER = nullcontext()
+
+
+class MetricsSink:
+    """
+    Receives measurements and snapshots of Metrics, all methods do nothing by default
+    """
+    def record(self, stage: str, seconds: float) -> None:
+        """
+        Called for every timed stage, keep this cheap, it runs on the worker threads
+        """
+        pass
+
+    def export(self, snapshot: dict) -> None:
+        """
+        Called by Metrics.flush with the aggregated values
+        """
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class LoggingSink(MetricsSink):
+    """
+    Writes every stage timing at DEBUG and every snapshot at INFO level to the logging module
+    """
+    def __init__(self, logger: logging.Logger = None) -> None:
+        self.logger = logger or _logger
+
+    def record(self, stage: str, seconds: float) -> None:
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("%s took %.3f ms", stage, seconds * 1000)
+
+    def export(self, snapshot: dict) -> None:
+        self.logger.info("metrics %s", json.dumps(snapshot, sort_keys=True))
+
+
+class JsonLinesSink(MetricsSink):
+    """
+    Appends one JSON object per stage timing and per snapshot to a file
+    """
+    def __init__(self, file_path: str) -> None:
+        self._lock = threading.Lock()
+        self._file = open(file_path, "a", encoding="utf-8")
+
+    def record(self, stage: str, seconds: float) -> None:
+        line = json.dumps({"time": time.time(), "stage": stage, "seconds": seconds})
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def export(self, snapshot: dict) -> None:
+        line = json.dumps({"time": time.time(), "snapshot": snapshot})
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class PrometheusTextSink(MetricsSink):
+    """
+    Writes each snapshot in the Prometheus text exposition format, e.g. for the textfile collector of the
+    node exporter. The file is replaced atomically, so a scraper never reads a partial file
+    """
+    def __init__(self, file_path: str, prefix: str = "pruefungsdateien") -> None:
+        self.file_path = file_path
+        self.prefix = prefix
+
+    def export(self, snapshot: dict) -> None:
+        temporary_path = f"{self.file_path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            f.write(render_prometheus(snapshot, self.prefix))
+        os.replace(temporary_path, self.file_path)
+
+
+class _Histogram:
+    """
+    Count, sum and bucket counts of the latencies of one stage
+    """
+    __slots__ = ("count", "total", "buckets")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def quantile(self, fraction: float) -> float:
+        """
+        :return: Upper bound of the bucket containing the quantile, an estimate good enough for diagnostics
+        """
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else float("inf")
+        return float("inf")
+
+
+class Metrics:
+    """
+    Thread-safe per-stage timers, counters, gauges and latency histograms
+    Timings use the monotonic performance counter. The aggregated values are kept in memory, available
+    through snapshot and handed to the sink by flush
+    """
+    def __init__(self, sink: MetricsSink = None) -> None:
+        """
+        :param sink: Receives the measurements, nothing is exported if omitted
+        """
+        self.sink = sink or MetricsSink()
+        self._lock = threading.Lock()
+        self._counters = {}
+        # Gauge name -> label value -> current value
+        self._gauges = {}
+        self._histograms = {}
+        self._started = time.monotonic()
+
+    @contextmanager
+    def timer(self, stage: str):
+        """
+        Times the enclosed block as stage, failed blocks are timed as well
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """
+        Adds a latency to the histogram of stage
+        """
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = _Histogram()
+            histogram.observe(seconds)
+        self.sink.record(stage, seconds)
+
+    def increment(self, counter: str, amount: int = 1) -> None:
+        """
+        Adds amount to a counter, e.g. files_skipped or bytes_moved
+        """
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + amount
+
+    def set_gauge(self, gauge: str, value: float, device: str = "") -> None:
+        """
+        Sets the current value of a gauge, e.g. the queue depth of a device
+        """
+        with self._lock:
+            self._gauges.setdefault(gauge, {})[device] = value
+
+    def snapshot(self) -> dict:
+        """
+        :return: Counters, gauges per device and per-stage count, sum, p50, p99 and cumulative bucket counts
+        """
+        with self._lock:
+            stages = {}
+            for stage, histogram in self._histograms.items():
+                cumulative = []
+                seen = 0
+                for count in histogram.buckets:
+                    seen += count
+                    cumulative.append(seen)
+                stages[stage] = {
+                    "count": histogram.count,
+                    "sum": histogram.total,
+                    "p50": histogram.quantile(0.5),
+                    "p99": histogram.quantile(0.99),
+                    "buckets": cumulative,
+                }
+            return {
+                "uptime": time.monotonic() - self._started,
+                "counters": dict(self._counters),
+                "gauges": {gauge: dict(values) for gauge, values in self._gauges.items()},
+                "stages": stages,
+            }
+
+    def flush(self) -> None:
+        """
+        Hands a snapshot to the sink
+        """
+        self.sink.export(self.snapshot())
+
+    def close(self) -> None:
+        self.flush()
+        self.sink.close()
+
+
+class NullMetrics(Metrics):
+    """
+    Metrics that record nothing, used when instrumentation is disabled
+    """
+    def timer(self, stage: str):
+        return _NULL_TIMER
+
+    def observe(self, stage: str, seconds: float) -> None:
+        pass
+
+    def increment(self, counter: str, amount: int = 1) -> None:
+        pass
+
+    def set_gauge(self, gauge: str, value: float, device: str = "") -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+
+def render_prometheus(snapshot: dict, prefix: str = "pruefungsdateien") -> str:
+    """
+    Formats a snapshot in the Prometheus text exposition format
+    """
+    lines = []
+    for counter, value in sorted(snapshot["counters"].items()):
+        name = f"{prefix}_{counter}_total"
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {value}")
+    for gauge, values in sorted(snapshot.get("gauges", {}).items()):
+        name = f"{prefix}_{gauge}"
+        lines.append(f"# TYPE {name} gauge")
+        for device, value in sorted(values.items()):
+            lines.append(f'{name}{{device="{device}"}} {value}' if device else f"{name} {value}")
+    name = f"{prefix}_stage_duration_seconds"
+    lines.append(f"# TYPE {name} histogram")
+    for stage, values in sorted(snapshot["stages"].items()):
+        bounds = [str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"]
+        for bound, count in zip(bounds, values["buckets"]):
+            lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+        lines.append(f'{name}_sum{{stage="{stage}"}} {values["sum"]}')
+        lines.append(f'{name}_count{{stage="{stage}"}} {values["count"]}')
+    return "\n".join(lines) + "\n"
+
+
+def create_sink(kind: str, file_path: str = None) -> MetricsSink:
+    """
+    Creates a sink by name
+
+    :param kind: none, log, jsonl or prometheus
+    :param file_path: Output file of the jsonl and prometheus sinks
+    """
+    if kind in (None, "none"):
+        return MetricsSink()
+    if kind == "log":
+        return LoggingSink()
+    if kind in ("jsonl", "prometheus") and not file_path:
+        raise ValueError(f"The {kind} sink needs an output file")
+    if kind == "jsonl":
+        return JsonLinesSink(file_path)
+    if kind == "prometheus":
+        return PrometheusTextSink(file_path)
+    raise ValueError(f"Unknown metrics sink: {kind}")
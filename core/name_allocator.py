@@ -0,0 +1,141 @@
+import errno
+import os
+import threading
+
+_O_BINARY = getattr(os, "O_BINARY", 0)
+# Upper bound of names tried per claim, only reached if other writers take names just as fast
+_MAX_CLAIM_ATTEMPTS = 1000
+
+
+class _DirectoryState:
+    """
+    Names taken in one destination directory and the next sequence number per name stem
+    """
+    __slots__ = ("lock", "taken", "next_sequence", "stems")
+
+    def __init__(self, directory: str) -> None:
+        self.lock = threading.Lock()
+        self.next_sequence = {}
+        # Name -> (stem, extension) of allocated names that have not been claimed on disk yet
+        self.stems = {}
+        try:
+            with os.scandir(directory) as entries:
+                self.taken = {entry.name for entry in entries}
+        except OSError:
+            self.taken = set()
+
+
+class NameAllocator:
+    """
+    Hands out unique file names per destination directory
+    A name is <stem><extension>, e.g. Löser_20240101120000.pdf. If it is taken, a sequence number is
+    appended: Löser_20240101120000_2.pdf, Löser_20240101120000_3.pdf, ... Each directory is listed once,
+    afterwards all allocations are served from memory, so concurrent workers never get the same name.
+    Other processes and workstations writing into the same archive are not known to the cache, a name is
+    only safe from them once it has been claimed on disk with claim
+    """
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._directories = {}
+
+    def allocate(self, directory: str, stem: str, extension: str) -> str:
+        """
+        Reserves a unique file name in directory
+
+        :param directory: Destination directory, it does not have to exist yet
+        :param stem: Name without extension
+        :param extension: Extension including the dot
+        :return: Path of the reserved name
+        """
+        state = self._state(directory)
+        with state.lock:
+            name = stem + extension
+            if name in state.taken:
+                key = (stem, extension)
+                sequence = state.next_sequence.get(key, 2)
+                name = f"{stem}_{sequence}{extension}"
+                while name in state.taken:
+                    sequence += 1
+                    name = f"{stem}_{sequence}{extension}"
+                state.next_sequence[key] = sequence + 1
+            state.taken.add(name)
+            state.stems[name] = (stem, extension)
+        return os.path.join(directory, name)
+
+    def claim(self, path: str, source: str = None) -> str:
+        """
+        Claims an allocated name on disk, afterwards other processes and workstations cannot get it anymore
+        The name is claimed with a hard link to source, so the move only has to remove the source, or where that
+        is not possible with an empty placeholder file. Both are created atomically without replacing an existing
+        file, also on network shares, so no lock is needed. If another writer has taken the name in the meantime,
+        the next free name of the same stem is claimed instead. The caller moves the file onto the claimed name
+
+        :param path: Name returned by allocate, its directory is created if it does not exist yet
+        :param source: File that will be moved to the name
+        :return: Path of the claimed name
+        :raises FileNotFoundError: If source does not exist
+        """
+        directory, name = os.path.split(path)
+        state = self._state(directory)
+        with state.lock:
+            stem, extension = state.stems.pop(name, None) or os.path.splitext(name)
+        link = source is not None
+        for _ in range(_MAX_CLAIM_ATTEMPTS):
+            try:
+                if link:
+                    try:
+                        os.link(source, path)
+                        return path
+                    except (FileExistsError, FileNotFoundError):
+                        raise
+                    except OSError:
+                        # Another file system or one without hard links, fall back to a placeholder
+                        link = False
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | _O_BINARY, 0o644)
+            except FileExistsError:
+                # Taken by another writer
+                path = self.allocate(directory, stem, extension)
+                with state.lock:
+                    state.stems.pop(os.path.basename(path), None)
+                continue
+            except FileNotFoundError:
+                if link and not os.path.exists(source):
+                    raise FileNotFoundError(f"File not found: {source}") from None
+                # The directory does not exist yet or was removed by a concurrent clean-up of empty directories
+                os.makedirs(directory, exist_ok=True)
+                continue
+            os.close(fd)
+            return path
+        raise OSError(errno.EEXIST, f"No free name for {stem}{extension} in {directory}")
+
+    def release(self, path: str) -> None:
+        """
+        Returns an allocated name that will not be claimed, e.g. because the file is a duplicate
+        """
+        directory, name = os.path.split(path)
+        state = self._state(directory)
+        with state.lock:
+            if state.stems.pop(name, None) is not None:
+                state.taken.discard(name)
+
+    def forget(self, directory: str = None) -> None:
+        """
+        Drops the cached state of a directory, or of all directories, so it is listed again on next use
+        """
+        with self._lock:
+            if directory is None:
+                self._directories.clear()
+            else:
+                self._directories.pop(directory, None)
+
+    def _state(self, directory: str) -> _DirectoryState:
+        """
+        :return: The state of a directory, listed on first use
+        """
+        with self._lock:
+            state = self._directories.get(directory)
+        if state is None:
+            new_state = _DirectoryState(directory)
+            with self._lock:
+                state = self._directories.setdefault(directory, new_state)
+        return state
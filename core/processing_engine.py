@@ -0,0 +1,305 @@
+import threading
+from typing import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+
+from config.config import Config
+from core.file_processor import FileProcessor, FileJob, BatchListener
+
+
+class ProcessingCancelled(Exception):
+    """
+    Raised when a job is cancelled before or while it is processed
+    """
+
+
+class ProcessingListener:
+    """
+    Receives the lifecycle events of the processing engine
+    All methods are called from worker threads and do nothing by default
+    """
+    def on_queued(self, job_id: int, job: FileJob) -> None:
+        pass
+
+    def on_started(self, job_id: int, job: FileJob) -> None:
+        pass
+
+    def on_progress(self, job_id: int, bytes_done: int, bytes_total: int) -> None:
+        pass
+
+    def on_finished(self, job_id: int, destination_path: str) -> None:
+        pass
+
+    def on_failed(self, job_id: int, error: Exception) -> None:
+        pass
+
+    def on_feed_failed(self, error: Exception) -> None:
+        """
+        Called when the iterable of submit_many raised, its remaining jobs are not processed
+        """
+        pass
+
+
+class _QueuedJob:
+    """
+    A job waiting in or being processed by the engine
+    """
+    __slots__ = ("job_id", "job", "cancel_event", "queue_slot")
+
+    def __init__(self, job_id: int, job: FileJob, queue_slot) -> None:
+        self.job_id = job_id
+        self.job = job
+        self.cancel_event = threading.Event()
+        self.queue_slot = queue_slot
+
+
+class _BatchForwarder(BatchListener):
+    """
+    Translates the batch events of the FileProcessor into engine events and applies cancellation
+    """
+    def __init__(self, engine, queued_jobs: list[_QueuedJob]) -> None:
+        self.engine = engine
+        self.queued_jobs = queued_jobs
+
+    def on_started(self, index: int) -> None:
+        queued_job = self.queued_jobs[index]
+        if queued_job.cancel_event.is_set():
+            raise ProcessingCancelled(queued_job.job.file_path)
+        self.engine.listener.on_started(queued_job.job_id, queued_job.job)
+
+    def on_progress(self, index: int, bytes_done: int, bytes_total: int) -> None:
+        queued_job = self.queued_jobs[index]
+        if queued_job.cancel_event.is_set():
+            raise ProcessingCancelled(queued_job.job.file_path)
+        self.engine.listener.on_progress(queued_job.job_id, bytes_done, bytes_total)
+
+    def on_finished(self, index: int, destination_path: str) -> None:
+        self.engine._finish(self.queued_jobs[index], destination_path, None)
+
+    def on_failed(self, index: int, error: Exception) -> None:
+        self.engine._finish(self.queued_jobs[index], None, error)
+
+
+class ProcessingEngine:
+    """
+    Processes FileJobs asynchronously on a pool of worker threads
+    Jobs from submit_many are grouped into batches for FileProcessor.process_batch while all workers are busy.
+    With an IoScheduler on the processor, batches only contain jobs for the same pair of devices, and renames
+    within a device run on their own threads, so they never wait behind copies
+    """
+    def __init__(self, file_processor: FileProcessor = None, listener: ProcessingListener = None, max_workers: int = None,
+                 queue_size: int = None, batch_size: int = None) -> None:
+        """
+        Initializes the engine
+
+        :param file_processor: Processor used by the workers, a new FileProcessor if omitted
+        :param listener: Listener receiving the job events
+        :param max_workers: Number of worker threads, Config.get_max_workers() if omitted
+        :param queue_size: Maximum number of queued jobs from submit_many, Config.get_queue_size() if omitted
+        :param batch_size: Maximum number of jobs per batch, Config.get_batch_size() if omitted
+        """
+        self.file_processor = file_processor or FileProcessor()
+        self.listener = listener or ProcessingListener()
+        self.max_workers = max_workers or Config.get_max_workers()
+        self.queue_size = queue_size or Config.get_queue_size()
+        self.batch_size = min(batch_size or Config.get_batch_size(), self.queue_size)
+        self._queue_slots = threading.BoundedSemaphore(self.queue_size)
+        self._feed_cancel_events = set()
+
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="file-processor")
+        self._rename_executor = None
+        if self.file_processor.io_scheduler:
+            self._rename_executor = ThreadPoolExecutor(max_workers=Config.get_rename_workers(),
+                                                       thread_name_prefix="file-renamer")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._active_batches = 0
+        self._job_ids = count(1)
+
+    def submit(self, job: FileJob) -> int:
+        """
+        Queues a job for processing
+
+        :param job: The job to process
+        :return: Id identifying the job in the listener events
+        """
+        queued_job = self._queue(job, None)
+        self._submit_batch([queued_job], self.file_processor.device_key(job))
+        return queued_job.job_id
+
+    def submit_many(self, jobs: Iterable[FileJob]) -> threading.Thread:
+        """
+        Queues jobs from a (lazy) iterable on a feeder thread
+        The feeder never holds more than queue_size unfinished jobs, so memory stays flat for
+        arbitrarily large batches. Every job is announced through on_queued, an error raised by the
+        iterable ends the feed and is reported through on_feed_failed
+
+        :param jobs: Iterable of jobs, consumed on the feeder thread
+        :return: The feeder thread
+        """
+        cancel_event = threading.Event()
+        with self._lock:
+            self._feed_cancel_events.add(cancel_event)
+        feeder = threading.Thread(target=self._feed, args=(jobs, cancel_event), name="file-processor-feeder", daemon=True)
+        feeder.start()
+        return feeder
+
+    def cancel(self, job_id: int) -> bool:
+        """
+        Cancels a queued or running job
+        Running jobs stop at their next progress report
+
+        :param job_id: Id returned by submit
+        :return: True if the job was still pending or running
+        """
+        with self._lock:
+            queued_job = self._jobs.get(job_id)
+        if queued_job is None:
+            return False
+        queued_job.cancel_event.set()
+        return True
+
+    def cancel_all(self) -> None:
+        """
+        Cancels all queued and running jobs and stops the feeders of submit_many
+        """
+        with self._lock:
+            for feed_cancel_event in self._feed_cancel_events:
+                feed_cancel_event.set()
+            queued_jobs = list(self._jobs.values())
+        for queued_job in queued_jobs:
+            queued_job.cancel_event.set()
+
+    def pending_count(self) -> int:
+        """
+        :return: Number of jobs that are queued or running
+        """
+        with self._lock:
+            return len(self._jobs)
+
+    def shutdown(self, wait: bool = True, cancel_pending: bool = False) -> None:
+        """
+        Stops the worker threads
+
+        :param wait: Block until the running jobs are done
+        :param cancel_pending: Cancel all jobs that have not finished yet
+        """
+        if cancel_pending:
+            self.cancel_all()
+        self._executor.shutdown(wait=wait)
+        if self._rename_executor:
+            self._rename_executor.shutdown(wait=wait)
+
+    def _feed(self, jobs: Iterable[FileJob], cancel_event: threading.Event) -> None:
+        """
+        Submits the jobs of an iterable in batches while queue slots are available
+        A batch is handed over as soon as a worker is idle, so small drops are processed in parallel
+        and large ones in batches of batch_size. Jobs are collected in one batch per device key
+        """
+        batches = {}
+        try:
+            for job in jobs:
+                if not self._queue_slots.acquire(blocking=False):
+                    self._submit_batches(batches)
+                    self._queue_slots.acquire()
+                if cancel_event.is_set():
+                    self._queue_slots.release()
+                    return
+                device_key = self.file_processor.device_key(job)
+                batch = batches.setdefault(device_key, [])
+                batch.append(self._queue(job, self._queue_slots))
+                with self._lock:
+                    worker_idle = self._active_batches < self.max_workers
+                if worker_idle or len(batch) >= self.batch_size:
+                    self._submit_batch(batches.pop(device_key), device_key)
+        except Exception as error:
+            self.listener.on_feed_failed(error)
+        finally:
+            self._submit_batches(batches)
+            with self._lock:
+                self._feed_cancel_events.discard(cancel_event)
+
+    def _submit_batches(self, batches: dict) -> None:
+        """
+        Hands all collected batches to the workers, renames first, and empties batches
+        """
+        for device_key in sorted(batches, key=lambda key: not self._is_rename(key)):
+            self._submit_batch(batches[device_key], device_key)
+        batches.clear()
+
+    def _queue(self, job: FileJob, queue_slot) -> _QueuedJob:
+        """
+        Registers a job and announces it, the queue slot is released when the job is done
+        """
+        queued_job = _QueuedJob(next(self._job_ids), job, queue_slot)
+        with self._lock:
+            self._jobs[queued_job.job_id] = queued_job
+        self.listener.on_queued(queued_job.job_id, job)
+        return queued_job
+
+    def _is_rename(self, device_key) -> bool:
+        """
+        :return: True if the batch of a device key goes to the rename threads
+        """
+        if device_key is None or self._rename_executor is None:
+            return False
+        return self.file_processor.io_scheduler.is_rename(device_key)
+
+    def _submit_batch(self, queued_jobs: list[_QueuedJob], device_key=None) -> None:
+        """
+        Hands a batch to the worker threads, batches of renames to the rename threads
+        """
+        with self._lock:
+            self._active_batches += 1
+        executor = self._rename_executor if self._is_rename(device_key) else self._executor
+        try:
+            future = executor.submit(self._run, queued_jobs)
+        except RuntimeError:
+            # The executor has been shut down
+            with self._lock:
+                self._active_batches -= 1
+            for queued_job in queued_jobs:
+                self._finish(queued_job, None, ProcessingCancelled(queued_job.job.file_path))
+            return
+        future.add_done_callback(lambda f: self._on_batch_done(queued_jobs, f))
+
+    def _run(self, queued_jobs: list[_QueuedJob]) -> None:
+        """
+        Processes a batch on a worker thread, jobs cancelled while queued are skipped
+        """
+        active_jobs = []
+        for queued_job in queued_jobs:
+            if queued_job.cancel_event.is_set():
+                self._finish(queued_job, None, ProcessingCancelled(queued_job.job.file_path))
+            else:
+                active_jobs.append(queued_job)
+        if active_jobs:
+            self.file_processor.process_batch([queued_job.job for queued_job in active_jobs],
+                                              _BatchForwarder(self, active_jobs))
+
+    def _finish(self, queued_job: _QueuedJob, destination_path, error) -> None:
+        """
+        Forwards the result of a job to the listener and frees its queue slot
+        """
+        with self._lock:
+            if self._jobs.pop(queued_job.job_id, None) is None:
+                return
+        if queued_job.queue_slot is not None:
+            queued_job.queue_slot.release()
+        if error is not None:
+            self.listener.on_failed(queued_job.job_id, error)
+        else:
+            self.listener.on_finished(queued_job.job_id, destination_path)
+
+    def _on_batch_done(self, queued_jobs: list[_QueuedJob], future) -> None:
+        """
+        Reports the jobs of a batch that failed as a whole and flushes the processor once the engine is idle
+        """
+        error = future.exception()
+        for queued_job in queued_jobs:
+            self._finish(queued_job, None, error or ProcessingCancelled(queued_job.job.file_path))
+        with self._lock:
+            self._active_batches -= 1
+            idle = not self._jobs
+        if idle:
+            self.file_processor.flush()
@@ -0,0 +1,250 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from config.config import Config
+from core.file_processor import FileJob
+from core.processing_engine import ProcessingCancelled, ProcessingListener
+
+# Columns that can be filtered and sorted by, in FileJob order
+DIMENSIONS = ("specialization", "exam_part", "file_type", "year", "period")
+# Only indexed columns, so a page of a sorted history never needs a full sort, rows are in time order by id.
+# Combined with a filter on another column, an index over both is created the first time it is needed
+SORT_COLUMNS = ("id", "status") + DIMENSIONS
+# Buffered rows are written in one transaction once this many have been collected
+_FLUSH_THRESHOLD = 256
+
+
+@dataclass(frozen=True)
+class HistoryEntry:
+    """
+    Outcome of one processed file
+    """
+    id: int
+    finished_at: float
+    status: str
+    source: str
+    destination: str
+    specialization: str
+    exam_part: str
+    file_type: str
+    year: str
+    period: str
+    message: str
+
+
+class ProcessingHistory:
+    """
+    Persistent log of all processed files, written in batches and read in pages
+    Status is one of archived, failed or cancelled
+    """
+    def __init__(self, db_path: str = None) -> None:
+        """
+        Opens or creates the history
+
+        :param db_path: SQLite database file, history.sqlite in Config.get_data_dir() if omitted
+        """
+        if db_path is None:
+            os.makedirs(Config.get_data_dir(), exist_ok=True)
+            db_path = os.path.join(Config.get_data_dir(), "history.sqlite")
+        self._lock = threading.Lock()
+        self._buffer_lock = threading.Lock()
+        self._buffer = []
+        # Names of the filter and sort indexes that are known to exist
+        self._indexes = set()
+        self._connection = sqlite3.connect(db_path, timeout=Config.get_db_timeout(), check_same_thread=False,
+                                           isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(
+            "CREATE TABLE IF NOT EXISTS history ("
+            " id INTEGER PRIMARY KEY, finished_at REAL NOT NULL, status TEXT NOT NULL, source TEXT NOT NULL,"
+            " destination TEXT, specialization TEXT, exam_part TEXT, file_type TEXT, year TEXT, period TEXT,"
+            " message TEXT);"
+            + "".join(f"CREATE INDEX IF NOT EXISTS history_{column} ON history ({column}, id);" for column in DIMENSIONS)
+            + "CREATE INDEX IF NOT EXISTS history_status ON history (status, id);"
+        )
+
+    def add(self, job: FileJob, status: str, destination: str = None, message: str = "") -> None:
+        """
+        Buffers the outcome of a file, the buffer is written once it is full or on flush
+        """
+        row = (time.time(), status, job.file_path, destination, job.specialization, job.exam_part, job.file_type,
+               job.year, job.period, message)
+        with self._buffer_lock:
+            self._buffer.append(row)
+            full = len(self._buffer) >= _FLUSH_THRESHOLD
+        if full:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Writes the buffered rows in one transaction
+
+        :return: Number of rows written
+        """
+        with self._buffer_lock:
+            rows, self._buffer = self._buffer, []
+        if rows:
+            with self._transaction():
+                self._connection.executemany(
+                    "INSERT INTO history (finished_at, status, source, destination, specialization, exam_part,"
+                    " file_type, year, period, message) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+                )
+        return len(rows)
+
+    def count(self, filters: dict = None, until_id: int = None) -> int:
+        """
+        :param filters: Column -> value of the DIMENSIONS or status, all must match
+        :param until_id: Only count rows up to this id, see last_id
+        :return: Number of written rows matching the filters
+        """
+        where, parameters = _where(filters, until_id)
+        with self._lock:
+            return self._connection.execute(f"SELECT COUNT(*) FROM history{where}", parameters).fetchone()[0]
+
+    def page(self, offset: int, limit: int, filters: dict = None, order_by: str = "id",
+             descending: bool = False, until_id: int = None) -> list[HistoryEntry]:
+        """
+        Reads one page of rows, ties are ordered by id so pages never overlap
+
+        :param offset: Index of the first row
+        :param limit: Maximum number of rows
+        :param filters: Column -> value of the DIMENSIONS or status, all must match
+        :param order_by: One of SORT_COLUMNS
+        :param descending: Reverse the order
+        :param until_id: Only read rows up to this id, so the pages of a snapshot stay consistent while rows are added
+        """
+        if order_by not in SORT_COLUMNS:
+            raise ValueError(f"Cannot sort by {order_by}")
+        self._ensure_indexes(filters, order_by)
+        where, parameters = _where(filters, until_id)
+        direction = "DESC" if descending else "ASC"
+        order = f"{order_by} {direction}" if order_by == "id" else f"{order_by} {direction}, id {direction}"
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT * FROM history{where} ORDER BY {order} LIMIT ? OFFSET ?", [*parameters, limit, offset]
+            ).fetchall()
+        return [HistoryEntry(*row) for row in rows]
+
+    def last_id(self) -> int:
+        """
+        :return: Id of the newest written row, 0 if the history is empty
+        """
+        with self._lock:
+            return self._connection.execute("SELECT MAX(id) FROM history").fetchone()[0] or 0
+
+    def distinct(self, column: str) -> list[str]:
+        """
+        :return: The values of a dimension that occur in the history, sorted
+        """
+        if column not in DIMENSIONS and column != "status":
+            raise ValueError(f"Unknown column {column}")
+        with self._lock:
+            rows = self._connection.execute(f"SELECT DISTINCT {column} FROM history ORDER BY {column}").fetchall()
+        return [row[0] for row in rows if row[0] is not None]
+
+    def close(self) -> None:
+        """
+        Writes the buffered rows and closes the database connection
+        """
+        self.flush()
+        with self._lock:
+            self._connection.close()
+
+    def _ensure_indexes(self, filters: dict, order_by: str) -> None:
+        """
+        Creates the indexes that read the rows of a filter in the order of another column without sorting them
+        """
+        if order_by == "id":
+            return
+        for column in filters or {}:
+            name = f"history_{column}_{order_by}"
+            if column == order_by or filters[column] is None or name in self._indexes:
+                continue
+            try:
+                with self._lock:
+                    self._connection.execute(
+                        f"CREATE INDEX IF NOT EXISTS {name} ON history ({column}, {order_by}, id)"
+                    )
+            except sqlite3.OperationalError:
+                # Locked by another writer, the page is sorted without the index and it is tried again next time
+                continue
+            self._indexes.add(name)
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Runs the enclosed statements in one write transaction
+        """
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+
+class HistoryRecorder(ProcessingListener):
+    """
+    Records the outcome of every job in the history and forwards all events to another listener
+    """
+    def __init__(self, history: ProcessingHistory, listener: ProcessingListener = None) -> None:
+        self.history = history
+        self.listener = listener or ProcessingListener()
+        self._lock = threading.Lock()
+        # Job id -> job of the jobs that are not done yet
+        self._jobs = {}
+
+    def on_queued(self, job_id, job) -> None:
+        with self._lock:
+            self._jobs[job_id] = job
+        self.listener.on_queued(job_id, job)
+
+    def on_started(self, job_id, job) -> None:
+        self.listener.on_started(job_id, job)
+
+    def on_progress(self, job_id, bytes_done, bytes_total) -> None:
+        self.listener.on_progress(job_id, bytes_done, bytes_total)
+
+    def on_finished(self, job_id, destination_path) -> None:
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is not None:
+            self.history.add(job, "archived", destination_path)
+        self.listener.on_finished(job_id, destination_path)
+
+    def on_failed(self, job_id, error) -> None:
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is not None:
+            cancelled = isinstance(error, ProcessingCancelled)
+            self.history.add(job, "cancelled" if cancelled else "failed", message=str(error) or type(error).__name__)
+        self.listener.on_failed(job_id, error)
+
+    def on_feed_failed(self, error) -> None:
+        self.listener.on_feed_failed(error)
+
+
+def _where(filters: dict, until_id: int = None) -> tuple[str, list]:
+    """
+    :return: WHERE clause and its parameters for the given column filters and newest id
+    """
+    filters = {column: value for column, value in (filters or {}).items() if value is not None}
+    for column in filters:
+        if column not in DIMENSIONS and column != "status":
+            raise ValueError(f"Cannot filter by {column}")
+    conditions = [f"{column} = ?" for column in filters]
+    parameters = list(filters.values())
+    if until_id is not None:
+        # Not usable as a range on the indexes, the index chosen for the filter and the order is kept
+        conditions.append("+id <= ?")
+        parameters.append(until_id)
+    if not conditions:
+        return "", []
+    return " WHERE " + " AND ".join(conditions), parameters
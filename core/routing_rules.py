@@ -0,0 +1,405 @@
+import json
+import logging
+import os
+import re
+import string
+import threading
+import time
+from types import SimpleNamespace
+
+from config.config import Config
+
+# Settings a rule can test and a template can use
+ROUTING_FIELDS = ("specialization", "exam_part", "file_type", "year", "period")
+DEFAULT_PATH = "{specialization}/{exam_part}/{year}/{period}"
+DEFAULT_FILENAME = "{file_type}_{timestamp}"
+# Fields that are only available in the file name template
+_FILENAME_FIELDS = ("timestamp", "name")
+# What a field matches when an archived path is parsed back into its settings
+_FIELD_PATTERNS = {"timestamp": r"\d{14}"}
+# Values a field of a top-level directory can have, the other settings come from the configured choices
+_TOP_LEVEL_PATTERNS = {"year": r"\d{4}"}
+_FIELD_CHOICES = {"specialization": Config.get_specializations, "exam_part": Config.get_exam_parts,
+                  "file_type": Config.get_file_types, "period": Config.get_periods}
+
+_logger = logging.getLogger("pruefungsdateien.routing")
+
+
+class _Route:
+    """
+    The compiled templates of one rule
+    """
+    __slots__ = ("levels", "filename", "conditions", "_pattern")
+
+    def __init__(self, path: str, filename: str, conditions: dict = None) -> None:
+        self.levels = _compile_template(path, ROUTING_FIELDS, directory=True)
+        self.filename = _compile_template(filename, ROUTING_FIELDS + _FILENAME_FIELDS)[0]
+        self.conditions = conditions or {}
+        self._pattern = None
+
+    @property
+    def layout(self) -> tuple:
+        return (*self.levels, self.filename)
+
+    def match(self, parts: list[str]):
+        """
+        :param parts: Directory names below the archive root and the file name of an archived file
+        :return: The settings contained in its path, None if the templates do not produce it
+        """
+        if len(parts) != len(self.levels) + 1:
+            return None
+        if self._pattern is None:
+            # Sequence numbers of taken names and the extension follow the file name template
+            used = set()
+            self._pattern = re.compile("/".join(_template_pattern(template, used) for template in self.layout)
+                                       + r"(?:_\d+)?(?:\.[^./]+)?")
+        match = self._pattern.fullmatch("/".join(parts))
+        if match is None:
+            return None
+        return {name: value for name, value in match.groupdict().items() if name in ROUTING_FIELDS}
+
+
+class _CompiledRules:
+    """
+    Rules compiled into a lookup table
+    Only the values a condition mentions can change the outcome, every other value of a setting behaves the same.
+    A job is therefore reduced to a key of the mentioned values, and the first matching rule is determined once
+    per key and kept in a dict, so a file costs one dict lookup regardless of the number of rules
+    """
+    def __init__(self, default: _Route, rules: list[tuple[dict, _Route]]) -> None:
+        self.default = default
+        self.rules = rules
+        # Tested setting -> all values mentioned by a condition on it
+        mentioned = {}
+        for conditions, _ in rules:
+            for name, values in conditions.items():
+                mentioned.setdefault(name, set()).update(values)
+        self.tested = tuple((name, frozenset(mentioned[name])) for name in ROUTING_FIELDS if name in mentioned)
+        self.routes = {}
+        # Settings -> rendered directory, the same few combinations recur for thousands of files
+        self.directories = {}
+        # Pattern of the top-level directory names, compiled on first use
+        self.top_level = None
+
+    def route(self, job) -> _Route:
+        """
+        :return: The route of the first rule matching job, the default route if none matches
+        """
+        key = []
+        for name, values in self.tested:
+            value = getattr(job, name)
+            key.append(value if value in values else None)
+        key = tuple(key)
+        route = self.routes.get(key)
+        if route is None:
+            route = self._match(dict(zip((name for name, _ in self.tested), key)))
+            # Concurrent workers may resolve the same key twice, both get the same route
+            self.routes[key] = route
+        return route
+
+    def _match(self, settings: dict) -> _Route:
+        for conditions, route in self.rules:
+            if all(settings[name] in values for name, values in conditions.items()):
+                return route
+        return self.default
+
+    def parse(self, parts: list[str]):
+        """
+        :return: The five settings of an archived file from the parts of its path, None if no template produces it.
+                 A template the rules in effect would choose for these settings wins over one that only matches,
+                 e.g. a file archived before a rule was added
+        """
+        matched = None
+        for route in [route for _, route in self.rules] + [self.default]:
+            settings = route.match(parts)
+            if settings is None:
+                continue
+            for name in ROUTING_FIELDS:
+                if name not in settings:
+                    # Only known from a condition with a single value, otherwise it is not recorded in the path
+                    values = route.conditions.get(name, ())
+                    settings[name] = next(iter(values)) if len(values) == 1 else ""
+            if self.route(SimpleNamespace(**settings)).layout == route.layout:
+                return settings
+            matched = matched or settings
+        return matched
+
+
+class RoutingRules:
+    """
+    Decides the directory and the file name every job is archived under
+    The rules are read from a JSON or TOML file (see load_rules) with path and file name templates and conditions
+    on the settings, e.g. archiving WISO without the exam part level. Without a rules file every file is archived
+    under <specialization>/<exam_part>/<year>/<period>/<file_type>_<timestamp>.ext. The file is checked for
+    changes at most once per reload interval and reloaded without a restart, a file with errors is ignored and
+    the previous rules stay in effect
+    """
+    def __init__(self, rules_path: str = None, reload_interval: float = None, fallback: bool = False) -> None:
+        """
+        Loads the rules
+
+        :param rules_path: Rules file, Config.get_routing_rules_path() if omitted. It does not have to exist yet
+        :param reload_interval: Seconds between two checks for changes, Config.get_routing_reload_interval() if omitted
+        :param fallback: Use the built-in layout if the rules file is invalid instead of raising, the error is kept
+                         in load_error until a corrected file is loaded
+        :raises ValueError: If the rules file exists but is invalid and fallback is not set
+        """
+        self.rules_path = rules_path or Config.get_routing_rules_path()
+        self.reload_interval = Config.get_routing_reload_interval() if reload_interval is None else reload_interval
+        self.load_error = None
+        self._lock = threading.Lock()
+        self._signature = _signature(self.rules_path)
+        try:
+            self._rules = load_rules(self.rules_path) if self._signature else _default_rules()
+        except (OSError, ValueError) as error:
+            if not fallback:
+                raise
+            _logger.warning("Routing rules %s not loaded, using the built-in layout: %s", self.rules_path, error)
+            self.load_error = error
+            self._rules = _default_rules()
+        self._checked_at = time.monotonic()
+
+    def directory(self, job) -> str:
+        """
+        :param job: Object with the five settings as attributes, e.g. a FileJob
+        :return: Directory of the job relative to the archive root
+        """
+        rules = self._current()
+        key = (job.specialization, job.exam_part, job.file_type, job.year, job.period)
+        directory = rules.directories.get(key)
+        if directory is None:
+            directory = os.path.join(*(_render(level, job) for level in rules.route(job).levels))
+            rules.directories[key] = directory
+        return directory
+
+    def file_stem(self, job, timestamp: str) -> str:
+        """
+        :param job: Object with the five settings and file_path as attributes, e.g. a FileJob
+        :param timestamp: Time of archiving as YYYYMMDDHHMMSS
+        :return: File name of the job without extension
+        """
+        route = self._current().route(job)
+        return _render(route.filename, job, timestamp=timestamp,
+                       name=os.path.splitext(os.path.basename(job.file_path))[0])
+
+    def parse(self, relative_path: str):
+        """
+        Recovers the settings of an archived file from its path, the inverse of directory and file_stem
+
+        :param relative_path: Path of the file below the archive root
+        :return: Dict of the five settings, settings the path does not contain are empty. None if no template of
+                 the rules in effect produces the path
+        """
+        parts = [part for part in relative_path.replace("\\", "/").split("/") if part]
+        return self._current().parse(parts)
+
+    def is_top_level_directory(self, name: str) -> bool:
+        """
+        :return: True if name can be a top-level directory of the structure the rules create, e.g. a specialization
+                 with the default layout or a year with "{year}/{specialization}"
+        """
+        rules = self._current()
+        if rules.top_level is None:
+            rules.top_level = re.compile("|".join(
+                _top_level_pattern(route.levels[0]) for route in [route for _, route in rules.rules] + [rules.default]
+            ))
+        return rules.top_level.fullmatch(name) is not None
+
+    def path_layouts(self) -> list[tuple[str, dict]]:
+        """
+        :return: (path template, settings fixed by the conditions) of the distinct path templates in effect, in the
+                 order of the first rule using them. A setting is fixed if every rule with the template only applies to the
+                 same single value of it
+        """
+        rules = self._current()
+        layouts = {}
+        for route in [route for _, route in rules.rules] + [rules.default]:
+            fixed = {name: next(iter(values)) for name, values in route.conditions.items() if len(values) == 1}
+            template = "/".join(route.levels)
+            if template in layouts:
+                fixed = {name: value for name, value in fixed.items() if layouts[template].get(name) == value}
+            layouts[template] = fixed
+        return list(layouts.items())
+
+    def path_layout(self, settings: dict) -> str:
+        """
+        :param settings: Values of the settings, missing ones only match rules that do not test them
+        :return: Path template of the rule a file with these settings is archived under
+        """
+        job = SimpleNamespace(**{name: settings.get(name) for name in ROUTING_FIELDS})
+        return "/".join(self._current().route(job).levels)
+
+    def reload(self) -> bool:
+        """
+        Reloads the rules file if it changed, called automatically at most once per reload interval
+
+        :return: True if other rules are in effect afterwards
+        """
+        with self._lock:
+            self._checked_at = time.monotonic()
+            signature = _signature(self.rules_path)
+            if signature == self._signature:
+                return False
+            try:
+                rules = load_rules(self.rules_path) if signature else _default_rules()
+            except (OSError, ValueError) as error:
+                _logger.warning("Routing rules %s not reloaded: %s", self.rules_path, error)
+                return False
+            self._signature = signature
+            self._rules = rules
+            self.load_error = None
+            return True
+
+    def _current(self) -> _CompiledRules:
+        if time.monotonic() - self._checked_at >= self.reload_interval:
+            self.reload()
+        return self._rules
+
+
+def load_rules(rules_path: str) -> _CompiledRules:
+    """
+    Reads and compiles a rules file, TOML if its name ends with .toml, JSON otherwise
+    The file has a default path and file name template and a list of rules that are tested in order:
+
+        path = "{specialization}/{exam_part}/{year}/{period}"
+        filename = "{file_type}_{timestamp}"
+
+        [[rules]]
+        when = { specialization = "WISO" }
+        path = "{specialization}/{year}/{period}"
+
+    A condition maps a setting to a value or a list of values, a rule without path or filename keeps the default.
+    Templates use the five settings, file names also {timestamp} and {name}, the original name without extension
+
+    :raises ValueError: If the file is invalid
+    """
+    with open(rules_path, "rb") as f:
+        data = f.read()
+    try:
+        if rules_path.lower().endswith(".toml"):
+            document = _toml().loads(data.decode("utf-8"))
+        else:
+            document = json.loads(data)
+    except ValueError as error:
+        raise ValueError(f"Invalid rules file {rules_path}: {error}") from None
+    if not isinstance(document, dict):
+        raise ValueError(f"Invalid rules file {rules_path}: expected a table")
+    default_path = document.get("path", DEFAULT_PATH)
+    default_filename = document.get("filename", DEFAULT_FILENAME)
+    rules = []
+    for index, rule in enumerate(document.get("rules", [])):
+        if not isinstance(rule, dict):
+            raise ValueError(f"Rule {index + 1} is not a table")
+        conditions = {}
+        for name, values in rule.get("when", {}).items():
+            if name not in ROUTING_FIELDS:
+                raise ValueError(f"Rule {index + 1} tests unknown setting {name}")
+            conditions[name] = frozenset(map(str, values if isinstance(values, list) else [values]))
+        try:
+            route = _Route(rule.get("path", default_path), rule.get("filename", default_filename), conditions)
+        except ValueError as error:
+            raise ValueError(f"Rule {index + 1}: {error}") from None
+        rules.append((conditions, route))
+    return _CompiledRules(_Route(default_path, default_filename), rules)
+
+
+def _toml():
+    """
+    :return: The TOML parser, tomllib from Python 3.11 on and the optional tomli before
+    """
+    try:
+        import tomllib
+    except ImportError:
+        try:
+            import tomli as tomllib
+        except ImportError:
+            raise ValueError("TOML rules files need Python 3.11 or the tomli package, use JSON instead") from None
+    return tomllib
+
+
+def _default_rules() -> _CompiledRules:
+    return _CompiledRules(_Route(DEFAULT_PATH, DEFAULT_FILENAME), [])
+
+
+def _compile_template(template, fields: tuple, directory: bool = False) -> list[str]:
+    """
+    Checks a template and splits a path template into its directory levels
+
+    :raises ValueError: If the template is empty or uses an unknown field
+    """
+    if not isinstance(template, str):
+        raise ValueError(f"Template {template!r} is not a string")
+    if directory:
+        levels = [level for level in template.replace("\\", "/").split("/") if level]
+    elif "/" in template or "\\" in template:
+        raise ValueError(f"File name template {template!r} contains a directory")
+    else:
+        levels = [template] if template else []
+    if not levels:
+        raise ValueError(f"Empty template {template!r}")
+    for level in levels:
+        if level in (".", ".."):
+            raise ValueError(f"Invalid directory {level} in template {template!r}")
+        try:
+            names = [name for _, name, _, _ in string.Formatter().parse(level) if name is not None]
+        except ValueError as error:
+            raise ValueError(f"Invalid template {template!r}: {error}") from None
+        unknown = [name for name in names if name not in fields]
+        if unknown:
+            raise ValueError(f"Unknown field {unknown[0]!r} in template {template!r}")
+    return levels
+
+
+def _template_pattern(template: str, used: set) -> str:
+    """
+    :param used: Fields that already have a group in the pattern, a repeated field must match the same value
+    :return: Regular expression matching what the template renders, with a named group per field
+    """
+    pattern = []
+    for literal, name, _, _ in string.Formatter().parse(template):
+        pattern.append(re.escape(literal))
+        if name is None:
+            continue
+        if name in used:
+            pattern.append(f"(?P={name})")
+        else:
+            used.add(name)
+            pattern.append(f"(?P<{name}>{_FIELD_PATTERNS.get(name, r'[^/]+?')})")
+    return "".join(pattern)
+
+
+def _top_level_pattern(template: str) -> str:
+    """
+    :return: Regular expression matching the names a top-level directory template renders with the configured values
+    """
+    pattern = []
+    for literal, name, _, _ in string.Formatter().parse(template):
+        pattern.append(re.escape(literal))
+        if name is None:
+            continue
+        if name in _FIELD_CHOICES:
+            values = [value.replace("/", "-").replace("\\", "-") for value in _FIELD_CHOICES[name]()]
+            pattern.append("(?:" + "|".join(map(re.escape, values)) + ")")
+        else:
+            pattern.append(_TOP_LEVEL_PATTERNS[name])
+    return "(?:" + "".join(pattern) + ")"
+
+
+def _render(template: str, job, **extra) -> str:
+    """
+    :return: template filled with the settings of job, separators in the values are replaced
+    """
+    values = {name: str(getattr(job, name)).replace("/", "-").replace("\\", "-") for name in ROUTING_FIELDS}
+    values.update(extra)
+    return template.format_map(values)
+
+
+def _signature(rules_path: str):
+    """
+    :return: (mtime, size) of the rules file, None if it does not exist
+    """
+    try:
+        stat = os.stat(rules_path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
@@ -0,0 +1,312 @@
+import multiprocessing
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from config.config import Config
+from core.text_extraction import extract_text
+
+# Extracted documents are written in one transaction once this many have been collected
+_WRITE_CHUNK_SIZE = 64
+_TERM = re.compile(r"\w+\*?")
+
+
+@dataclass(frozen=True)
+class SearchHit:
+    """
+    An archived file matching a search, better matches have a lower score
+    """
+    path: str
+    specialization: str
+    exam_part: str
+    year: str
+    period: str
+    file_type: str
+    score: float
+    snippet: str
+
+
+class SearchIndex:
+    """
+    Full-text index over the archived files, stored in SQLite FTS5
+    Text extraction runs in a process pool, so parsing PDFs uses all cores. A file is only extracted again
+    if its size or modification time changed since it was indexed
+    """
+    def __init__(self, db_path: str = None, max_workers: int = None) -> None:
+        """
+        Opens or creates the index
+
+        :param db_path: SQLite database file, search.sqlite in Config.get_data_dir() if omitted
+        :param max_workers: Number of extraction processes, Config.get_index_workers() if omitted
+        """
+        if db_path is None:
+            os.makedirs(Config.get_data_dir(), exist_ok=True)
+            db_path = os.path.join(Config.get_data_dir(), "search.sqlite")
+        self.max_workers = max_workers or Config.get_index_workers()
+        self._lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending_done = threading.Condition(self._pending_lock)
+        # Started on first use, spawning the processes is only worth it once there is something to extract
+        self._executor = None
+        # Path -> future of the submitted extractions that are not written yet
+        self._pending = {}
+        # Extracted rows waiting to be written
+        self._extracted = []
+        self._connection = sqlite3.connect(db_path, timeout=Config.get_db_timeout(), check_same_thread=False,
+                                           isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,"
+            " specialization TEXT NOT NULL, exam_part TEXT NOT NULL, year TEXT NOT NULL, period TEXT NOT NULL,"
+            " file_type TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS documents_settings ON documents (specialization, exam_part, year);"
+            "CREATE VIRTUAL TABLE IF NOT EXISTS texts USING fts5(body, tokenize='unicode61 remove_diacritics 2',"
+            " prefix='3 4');"
+        )
+
+    def submit(self, path: str, specialization: str, exam_part: str, year: str, period: str, file_type: str) -> bool:
+        """
+        Queues a file for extraction unless it is indexed in its current version
+        The text is extracted in the background, the result is written on the next flush
+
+        :param path: Path of the archived file
+        :return: True if the file was queued
+        """
+        document = _document(path, (specialization, exam_part, year, period, file_type))
+        if document is None or not self._is_stale([document]):
+            return False
+        with self._pending_lock:
+            if document[0] in self._pending:
+                return False
+            future = self._pool().submit(extract_text, document[0])
+            self._pending[document[0]] = future
+        future.add_done_callback(lambda future, document=document: self._extracted_done(document, future))
+        return True
+
+    def update(self, entries, prune: bool = False) -> tuple[int, int]:
+        """
+        Brings the index up to date with a set of archived files, e.g. ArchiveCatalog.query()
+
+        :param entries: Objects with path and the five settings as attributes
+        :param prune: Also remove indexed files that are not among the entries
+        :return: (number of extracted files, number of removed files)
+        """
+        documents = []
+        for entry in entries:
+            document = _document(entry.path, (entry.specialization, entry.exam_part, entry.year, entry.period,
+                                              entry.file_type))
+            if document is not None:
+                documents.append(document)
+        removed = self._prune({document[0] for document in documents}) if prune else 0
+        stale = self._is_stale(documents)
+        chunksize = max(1, min(16, len(stale) // (self.max_workers * 4)))
+        texts = self._pool().map(extract_text, [document[0] for document in stale], chunksize=chunksize) if stale else []
+        rows = []
+        for document, text in zip(stale, texts):
+            rows.append((document, text))
+            if len(rows) >= _WRITE_CHUNK_SIZE:
+                self._write(rows)
+                rows = []
+        self._write(rows)
+        return len(stale), removed
+
+    def search(self, query: str, specialization: str = None, exam_part: str = None, year: str = None,
+               period: str = None, file_type: str = None, limit: int = 20) -> list[SearchHit]:
+        """
+        Searches the indexed texts, omitted settings match everything
+        All words of the query must occur, a word ending in * matches every word starting with it
+
+        :return: The best matches, best first
+        """
+        expression = _match_expression(query)
+        if not expression:
+            return []
+        filters = {
+            "specialization": specialization, "exam_part": exam_part, "year": year,
+            "period": period, "file_type": file_type,
+        }
+        conditions = [f" AND d.{column} = ?" for column, value in filters.items() if value is not None]
+        parameters = [expression, *(value for value in filters.values() if value is not None), limit]
+        sql = (
+            "SELECT d.path, d.specialization, d.exam_part, d.year, d.period, d.file_type, bm25(texts),"
+            " snippet(texts, 0, '[', ']', ' … ', 12)"
+            " FROM texts JOIN documents d ON d.id = texts.rowid WHERE texts MATCH ?"
+            + "".join(conditions) + " ORDER BY bm25(texts) LIMIT ?"
+        )
+        with self._lock:
+            rows = self._connection.execute(sql, parameters).fetchall()
+        return [SearchHit(*row) for row in rows]
+
+    def remove(self, path: str) -> None:
+        """
+        Removes a file from the index
+        """
+        with self._transaction():
+            self._delete(os.path.abspath(path))
+
+    def relocate(self, moves: list[tuple[str, str, dict]]) -> None:
+        """
+        Updates the paths and settings of moved files without extracting them again, see ArchiveCatalog.relocate
+
+        :param moves: (old path, new path, settings) per moved file or directory
+        """
+        with self._transaction():
+            for old_path, new_path, settings in moves:
+                old_path, new_path = os.path.abspath(old_path), os.path.abspath(new_path)
+                # A document already indexed under the new path of a file is replaced, including its text
+                self._delete(new_path)
+                assignments = "".join(f", {column} = ?" for column in settings)
+                self._connection.execute(
+                    f"UPDATE documents SET path = ? || substr(path, ?){assignments}"
+                    " WHERE path = ? OR (path > ? AND path < ?)",
+                    (new_path, len(old_path) + 1, *settings.values(), old_path, old_path + os.sep,
+                     old_path + chr(ord(os.sep) + 1))
+                )
+
+    def count(self) -> int:
+        """
+        :return: Number of indexed files
+        """
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def flush(self, wait: bool = False) -> None:
+        """
+        Writes the texts extracted so far
+
+        :param wait: First wait for all queued extractions
+        """
+        with self._pending_done:
+            if wait:
+                self._pending_done.wait_for(lambda: not self._pending)
+            rows, self._extracted = self._extracted, []
+        self._write(rows)
+
+    def close(self) -> None:
+        """
+        Waits for the queued extractions, writes them and closes the database connection
+        """
+        self.flush(wait=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        with self._lock:
+            self._connection.close()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Forking a process that runs threads with open database connections is unsafe
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def _extracted_done(self, document: tuple, future) -> None:
+        """
+        Collects the result of a background extraction, called from the executor's result thread
+        """
+        text = "" if future.cancelled() or future.exception() else future.result()
+        with self._pending_done:
+            self._pending.pop(document[0], None)
+            self._extracted.append((document, text))
+            full = len(self._extracted) >= _WRITE_CHUNK_SIZE
+            self._pending_done.notify_all()
+        if full:
+            self.flush()
+
+    def _is_stale(self, documents: list[tuple]) -> list[tuple]:
+        """
+        :return: The documents that are not indexed or changed since they were indexed
+        """
+        with self._lock:
+            indexed = {}
+            for start in range(0, len(documents), 500):
+                paths = [document[0] for document in documents[start:start + 500]]
+                indexed.update(
+                    (path, (size, mtime_ns, settings)) for path, size, mtime_ns, *settings in self._connection.execute(
+                        "SELECT path, size, mtime_ns, specialization, exam_part, year, period, file_type FROM documents"
+                        f" WHERE path IN ({','.join('?' * len(paths))})", paths
+                    )
+                )
+        return [document for document in documents
+                if indexed.get(document[0]) != (document[1], document[2], list(document[3:]))]
+
+    def _write(self, rows: list[tuple]) -> None:
+        """
+        Replaces the indexed text of the given documents in one transaction
+        """
+        if not rows:
+            return
+        with self._transaction():
+            for document, text in rows:
+                self._delete(document[0])
+                cursor = self._connection.execute(
+                    "INSERT INTO documents (path, size, mtime_ns, specialization, exam_part, year, period, file_type)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)", document
+                )
+                self._connection.execute("INSERT INTO texts (rowid, body) VALUES (?, ?)", (cursor.lastrowid, text))
+
+    def _prune(self, paths: set) -> int:
+        """
+        Removes the indexed files that are not in paths
+
+        :return: Number of removed files
+        """
+        with self._lock:
+            indexed = [row[0] for row in self._connection.execute("SELECT path FROM documents")]
+        obsolete = [path for path in indexed if path not in paths]
+        with self._transaction():
+            for path in obsolete:
+                self._delete(path)
+        return len(obsolete)
+
+    def _delete(self, path: str) -> None:
+        """
+        Deletes a document and its text, the caller holds the transaction
+        """
+        row = self._connection.execute("SELECT id FROM documents WHERE path = ?", (path,)).fetchone()
+        if row is not None:
+            self._connection.execute("DELETE FROM texts WHERE rowid = ?", row)
+            self._connection.execute("DELETE FROM documents WHERE id = ?", row)
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Runs the enclosed statements in one transaction while holding the lock
+        """
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+
+def _document(path: str, settings: tuple):
+    """
+    :return: (path, size, mtime_ns, *settings) of an existing file, None if it cannot be read
+    """
+    path = os.path.abspath(path)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (path, stat.st_size, stat.st_mtime_ns, *settings)
+
+
+def _match_expression(query: str) -> str:
+    """
+    Turns a user query into an FTS5 expression, every word is quoted so operators in the query have no effect
+    """
+    terms = []
+    for term in _TERM.findall(query):
+        prefix = term.endswith("*")
+        terms.append(f'"{term.rstrip("*")}"' + ("*" if prefix else ""))
+    return " ".join(terms)
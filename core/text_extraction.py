@@ -0,0 +1,47 @@
+import os
+import re
+import zipfile
+
+_XML_TAG = re.compile(r"<[^>]+>")
+
+
+def extract_text(file_path: str, max_pages: int = None) -> str:
+    """
+    Extracts the plain text of a document
+    PDF files need the optional pypdf package, Word documents and text files are read with the
+    standard library. Unsupported or unreadable files yield an empty string
+
+    :param file_path: Document to read
+    :param max_pages: Only read the first pages of a PDF
+    :return: The extracted text
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    try:
+        if extension == ".pdf":
+            return _extract_pdf(file_path, max_pages)
+        if extension == ".docx":
+            return _extract_docx(file_path)
+        if extension in (".txt", ".md", ".csv"):
+            with open(file_path, encoding="utf-8", errors="replace") as f:
+                return f.read()
+    except Exception:
+        # Broken documents are treated like documents without text
+        return ""
+    return ""
+
+
+def _extract_pdf(file_path: str, max_pages: int = None) -> str:
+    # Imported on first use, pypdf is optional and slow to import
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return ""
+    reader = PdfReader(file_path)
+    page_count = len(reader.pages) if max_pages is None else min(len(reader.pages), max_pages)
+    return "\n".join(reader.pages[index].extract_text() or "" for index in range(page_count))
+
+
+def _extract_docx(file_path: str) -> str:
+    with zipfile.ZipFile(file_path) as archive:
+        xml = archive.read("word/document.xml").decode("utf-8", errors="replace")
+    return _XML_TAG.sub(" ", xml.replace("</w:p>", "\n"))
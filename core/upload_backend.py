@@ -0,0 +1,709 @@
+import abc
+import base64
+import datetime
+import hashlib
+import hmac
+import http.client
+import json
+import logging
+import os
+import queue
+import threading
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlsplit, parse_qsl
+
+from config.config import Config
+from core.file_transfer import FileTransfer
+
+# Errors after which a kept-alive connection is considered stale and the request is sent again on another one
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.CannotSendRequest, ConnectionResetError,
+                            BrokenPipeError)
+# Smallest part S3 accepts for all but the last part of a multipart upload
+_S3_MIN_PART_SIZE = 5 * 1024 * 1024
+
+_logger = logging.getLogger("pruefungsdateien.upload")
+
+
+class UploadError(OSError):
+    """
+    Raised when the archive server rejects a request
+    """
+    def __init__(self, message: str, status: int = None) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+class UploadBackend(abc.ABC):
+    """
+    Target that archived files are pushed to
+    Keys are relative paths with forward slashes, e.g. WISO/AP1/2024/Sommer/Löser_20240101120000.pdf
+    """
+    @abc.abstractmethod
+    def upload(self, source: str, key: str, progress_callback=None) -> None:
+        """
+        Uploads a file, an interrupted upload of the same unchanged file is resumed
+
+        :param source: Local file to upload, it is not modified
+        :param key: Destination key
+        :param progress_callback: Optional callable receiving (bytes_done, bytes_total)
+        :raises UploadError: If the server rejects the upload
+        """
+
+    @abc.abstractmethod
+    def exists(self, key: str) -> bool:
+        """
+        :return: True if the target already contains key
+        """
+
+    def resume_pending(self, on_failed=None) -> int:
+        """
+        Finishes the uploads that were interrupted, e.g. by a crash or a network failure
+        An upload that fails again keeps its state and is retried by the next call
+
+        :param on_failed: Optional callable receiving (key, error) for each upload that failed again
+        :return: Number of uploads finished
+        """
+        return 0
+
+    def close(self) -> None:
+        pass
+
+
+class LocalBackend(UploadBackend):
+    """
+    Copies the files into a directory, e.g. a mounted network share
+    Copies are resumable through the partial files of FileTransfer
+    """
+    def __init__(self, root: str, file_transfer: FileTransfer = None) -> None:
+        """
+        :param root: Root directory of the central archive
+        :param file_transfer: Transfer layer used for the copies, a new FileTransfer if omitted
+        """
+        self.root = root
+        self.file_transfer = file_transfer or FileTransfer()
+
+    def upload(self, source: str, key: str, progress_callback=None) -> None:
+        destination = os.path.join(self.root, *key.split("/"))
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        self.file_transfer.copy(source, destination, progress_callback)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self.root, *key.split("/")))
+
+
+class _ConnectionPool:
+    """
+    Keep-alive HTTP connections to one host, at most size requests run at the same time
+    """
+    def __init__(self, scheme: str, netloc: str, size: int, timeout: float = 60.0) -> None:
+        self.scheme = scheme
+        self.netloc = netloc
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def request(self, method: str, path: str, headers: dict = None, body=None) -> tuple[int, dict, bytes]:
+        """
+        Sends a request on an idle connection or a new one
+
+        :param body: Bytes or a file object that is streamed, files need a Content-Length header
+        :return: Status, headers with lowercase names and body of the response
+        """
+        start = body.tell() if hasattr(body, "seek") else None
+        with self._slots:
+            while True:
+                try:
+                    connection, reused = self._idle.get_nowait(), True
+                except queue.Empty:
+                    connection, reused = self._connect(), False
+                if start is not None:
+                    body.seek(start)
+                try:
+                    connection.request(method, path, body=body, headers=headers or {})
+                    response = connection.getresponse()
+                    data = response.read()
+                except _STALE_CONNECTION_ERRORS:
+                    connection.close()
+                    if reused:
+                        # The server closed the idle connection, try the next one
+                        continue
+                    raise
+                except Exception:
+                    connection.close()
+                    raise
+                if response.will_close:
+                    connection.close()
+                else:
+                    self._idle.put(connection)
+                return response.status, {name.lower(): value for name, value in response.getheaders()}, data
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(self.netloc, timeout=self.timeout)
+
+
+class _ByteBudget:
+    """
+    Bounds the bytes held in memory by all running chunk uploads
+    """
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self._available = limit
+        self._condition = threading.Condition()
+
+    def acquire(self, count: int) -> int:
+        """
+        Waits until count bytes are available, requests larger than the limit take the whole budget
+
+        :return: The number of bytes to release later
+        """
+        count = min(count, self.limit)
+        with self._condition:
+            while self._available < count:
+                self._condition.wait()
+            self._available -= count
+        return count
+
+    def release(self, count: int) -> None:
+        with self._condition:
+            self._available += count
+            self._condition.notify_all()
+
+
+class _ProgressReader:
+    """
+    File object streamed as a request body that reports how much of it has been sent
+    """
+    def __init__(self, f, size: int, progress_callback) -> None:
+        self.f = f
+        self.size = size
+        self.progress_callback = progress_callback
+
+    def read(self, count: int = -1) -> bytes:
+        data = self.f.read(count)
+        if self.progress_callback and data:
+            self.progress_callback(self.f.tell(), self.size)
+        return data
+
+    def seek(self, offset: int) -> int:
+        return self.f.seek(offset)
+
+    def tell(self) -> int:
+        return self.f.tell()
+
+
+class _UploadState:
+    """
+    Progress of one chunked upload, persisted so that it can be resumed after an interruption
+    The state belongs to a source file with a given size and modification time, it is discarded if the file changed
+    """
+    def __init__(self, state_dir: str, key: str, source: str) -> None:
+        self.path = os.path.join(state_dir, hashlib.blake2b(key.encode("utf-8"), digest_size=12).hexdigest() + ".json")
+        self.key = key
+        self.source = source
+        stat = os.stat(source)
+        self.identity = [stat.st_size, stat.st_mtime_ns]
+        self.upload_id = None
+        # Offset or part number (as string) -> ETag or True of the finished chunks
+        self.done = {}
+        self._lock = threading.Lock()
+
+        stored = _read_json(self.path)
+        if stored and stored.get("identity") == self.identity and stored.get("source") == source:
+            self.upload_id = stored.get("upload_id")
+            self.done = stored.get("done", {})
+        self.resumed = bool(self.done or self.upload_id)
+
+    def mark_done(self, chunk: str, value=True) -> None:
+        with self._lock:
+            self.done[chunk] = value
+            self.save()
+
+    def save(self) -> None:
+        data = {"key": self.key, "source": self.source, "identity": self.identity, "upload_id": self.upload_id,
+                "done": self.done}
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(temporary_path, self.path)
+
+    def remove(self) -> None:
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class _RemoteBackend(UploadBackend):
+    """
+    Common part of the HTTP based backends: connection pool, chunk workers, in-flight budget and resume state
+    Files up to chunk_size are sent in one request, larger files in parallel chunks
+    """
+    def __init__(self, url: str, chunk_size: int = None, workers: int = None, max_in_flight: int = None,
+                 state_dir: str = None) -> None:
+        """
+        :param url: Base URL of the archive
+        :param chunk_size: Bytes per chunk, Config.get_upload_chunk_size() if omitted
+        :param workers: Parallel requests, Config.get_upload_workers() if omitted
+        :param max_in_flight: Bytes of all chunks held in memory at once, Config.get_upload_max_in_flight() if omitted
+        :param state_dir: Directory of the resume state, uploads in Config.get_data_dir() if omitted
+        """
+        parts = urlsplit(url)
+        self.scheme = parts.scheme
+        self.netloc = parts.netloc.rsplit("@", 1)[-1]
+        self.base_path = parts.path.rstrip("/")
+        self.chunk_size = chunk_size or Config.get_upload_chunk_size()
+        self.workers = workers or Config.get_upload_workers()
+        self.state_dir = state_dir or os.path.join(Config.get_data_dir(), "uploads")
+        os.makedirs(self.state_dir, exist_ok=True)
+
+        # One connection per chunk worker plus one for the requests of the calling threads
+        self.pool = _ConnectionPool(self.scheme, self.netloc, self.workers + 1)
+        self.budget = _ByteBudget(max(max_in_flight or Config.get_upload_max_in_flight(), self.chunk_size))
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="upload")
+
+    def upload(self, source: str, key: str, progress_callback=None) -> None:
+        state = _UploadState(self.state_dir, key, source)
+        state.save()
+        size = state.identity[0]
+        try:
+            self._upload(source, key, size, state, progress_callback)
+        except UploadError as error:
+            if error.status != 404 or not state.resumed:
+                raise
+            # The server dropped the partial upload, start over
+            state.upload_id = None
+            state.done = {}
+            state.resumed = False
+            state.save()
+            self._upload(source, key, size, state, progress_callback)
+        state.remove()
+
+    def _upload(self, source: str, key: str, size: int, state: _UploadState, progress_callback) -> None:
+        if size <= self.chunk_size:
+            reserved = self.budget.acquire(size)
+            try:
+                with open(source, "rb") as f:
+                    data = f.read()
+                self._put_whole(key, data)
+            finally:
+                self.budget.release(reserved)
+            if progress_callback:
+                progress_callback(size, size)
+        else:
+            self._put_large(source, key, size, state, progress_callback)
+
+    def resume_pending(self, on_failed=None) -> int:
+        finished = 0
+        for name in os.listdir(self.state_dir):
+            if not name.endswith(".json"):
+                continue
+            stored = _read_json(os.path.join(self.state_dir, name))
+            if not stored:
+                continue
+            source = stored.get("source")
+            try:
+                stat = os.stat(source)
+            except (OSError, TypeError):
+                stat = None
+            if stat is None or [stat.st_size, stat.st_mtime_ns] != stored.get("identity"):
+                # The archived file was removed or changed, its upload cannot be finished
+                self._discard(stored)
+                os.unlink(os.path.join(self.state_dir, name))
+                continue
+            try:
+                self.upload(source, stored["key"])
+            except Exception as error:
+                _logger.warning("Upload of %s to %s not resumed: %s", source, stored["key"], error)
+                if on_failed:
+                    on_failed(stored["key"], error)
+                continue
+            finished += 1
+        return finished
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        self.pool.close()
+
+    def _put_large(self, source: str, key: str, size: int, state: _UploadState, progress_callback) -> None:
+        """
+        Uploads a file larger than chunk_size, in parallel chunks unless the backend overrides it
+        """
+        self._put_chunked(source, key, size, state, progress_callback)
+
+    def _put_chunked(self, source: str, key: str, size: int, state: _UploadState, progress_callback) -> None:
+        """
+        Uploads the chunks that are not done yet in parallel and completes the upload
+        """
+        self._begin_chunked(key, size, state)
+        chunks = [(number, offset, min(self.chunk_size, size - offset))
+                  for number, offset in enumerate(range(0, size, self.chunk_size), start=1)]
+        progress_lock = threading.Lock()
+        progress = [sum(length for number, offset, length in chunks if self._chunk_id(number, offset) in state.done)]
+        if progress_callback:
+            progress_callback(progress[0], size)
+
+        def send(number: int, offset: int, length: int) -> None:
+            reserved = self.budget.acquire(length)
+            try:
+                with open(source, "rb") as f:
+                    f.seek(offset)
+                    data = f.read(length)
+                value = self._put_chunk(key, state, number, offset, data, size)
+            finally:
+                self.budget.release(reserved)
+            state.mark_done(self._chunk_id(number, offset), value)
+            if progress_callback:
+                with progress_lock:
+                    progress[0] += length
+                    done = progress[0]
+                progress_callback(done, size)
+
+        futures = [self._executor.submit(send, number, offset, length) for number, offset, length in chunks
+                   if self._chunk_id(number, offset) not in state.done]
+        errors = [future.exception() for future in futures]
+        for error in errors:
+            if error is not None:
+                raise error
+        self._complete_chunked(key, size, state)
+
+    @abc.abstractmethod
+    def _chunk_id(self, number: int, offset: int) -> str:
+        """
+        :return: Key of a chunk in the resume state
+        """
+
+    @abc.abstractmethod
+    def _put_whole(self, key: str, data: bytes) -> None:
+        pass
+
+    def _begin_chunked(self, key: str, size: int, state: _UploadState) -> None:
+        pass
+
+    @abc.abstractmethod
+    def _put_chunk(self, key: str, state: _UploadState, number: int, offset: int, data: bytes, size: int):
+        """
+        :return: Value stored for the chunk in the resume state
+        """
+
+    @abc.abstractmethod
+    def _complete_chunked(self, key: str, size: int, state: _UploadState) -> None:
+        pass
+
+    def _discard(self, stored: dict) -> None:
+        """
+        Releases the server side resources of an upload that is given up
+        """
+        pass
+
+    def _path(self, key: str) -> str:
+        return quote(f"{self.base_path}/{key}", safe="/-_.~")
+
+
+class HttpPutBackend(_RemoteBackend):
+    """
+    Uploads to a WebDAV or plain HTTP server with PUT
+    Large files are streamed with a single PUT, on WebDAV servers into <key>.part and moved to the key with MOVE
+    once complete, so the key never shows a partial file. The result is checked with HEAD, which also lets an
+    interrupted upload skip what the server already holds. Servers that accept PUT with Content-Range (most
+    reject it, RFC 7231 section 4.3.4) can be used with partial_put, large files are then written in parallel
+    chunks and resumed from the finished offsets. Missing collections are created with MKCOL
+    """
+    def __init__(self, url: str, username: str = None, password: str = None, webdav: bool = True,
+                 partial_put: bool = False, **options) -> None:
+        """
+        :param url: Base URL, e.g. https://archiv.example.org/dav/pruefungen
+        :param username: Optional user for basic authentication, also taken from the URL
+        :param password: Optional password for basic authentication, also taken from the URL
+        :param webdav: Create collections with MKCOL and upload through <key>.part, disable for servers that
+                       create directories on PUT and do not support MOVE
+        :param partial_put: The server accepts PUT with Content-Range, large files are uploaded in parallel chunks
+        :param options: chunk_size, workers, max_in_flight and state_dir, see _RemoteBackend
+        """
+        super().__init__(url, **options)
+        parts = urlsplit(url)
+        username = username or parts.username
+        password = password or parts.password
+        self.webdav = webdav
+        self.partial_put = partial_put and webdav
+        self._headers = {}
+        if username:
+            credentials = base64.b64encode(f"{username}:{password or ''}".encode("utf-8")).decode("ascii")
+            self._headers["Authorization"] = f"Basic {credentials}"
+        self._collections = set()
+        self._collections_lock = threading.Lock()
+
+    def exists(self, key: str) -> bool:
+        status, _, _ = self.pool.request("HEAD", self._path(key), self._headers)
+        return 200 <= status < 300
+
+    def _chunk_id(self, number: int, offset: int) -> str:
+        return str(offset)
+
+    def _put_whole(self, key: str, data: bytes) -> None:
+        self._ensure_collections(key)
+        self._check(self.pool.request("PUT", self._path(key), self._headers, data), "PUT", key)
+
+    def _put_large(self, source: str, key: str, size: int, state: _UploadState, progress_callback) -> None:
+        if self.partial_put:
+            self._put_chunked(source, key, size, state, progress_callback)
+            return
+        if state.resumed:
+            # The PUT finished before the interruption, the MOVE or removing the state may be missing
+            if self._remote_size(key) == size:
+                if progress_callback:
+                    progress_callback(size, size)
+                return
+            if self.webdav and self._remote_size(key + ".part") == size:
+                self._complete_chunked(key, size, state)
+                if progress_callback:
+                    progress_callback(size, size)
+                return
+        self._ensure_collections(key)
+        target = key + ".part" if self.webdav else key
+        headers = dict(self._headers)
+        headers["Content-Length"] = str(size)
+        with open(source, "rb") as f:
+            self._check(self.pool.request("PUT", self._path(target), headers, _ProgressReader(f, size, progress_callback)),
+                        "PUT", key)
+        state.mark_done("put")
+        if self.webdav:
+            self._complete_chunked(key, size, state)
+        remote_size = self._remote_size(key)
+        if remote_size != size:
+            raise UploadError(f"PUT {key} stored {remote_size} of {size} bytes")
+
+    def _remote_size(self, key: str):
+        """
+        :return: Size of key on the server, None if it does not exist or the server does not report it
+        """
+        status, headers, _ = self.pool.request("HEAD", self._path(key), self._headers)
+        if not 200 <= status < 300 or "content-length" not in headers:
+            return None
+        return int(headers["content-length"])
+
+    def _begin_chunked(self, key: str, size: int, state: _UploadState) -> None:
+        self._ensure_collections(key)
+        if not state.resumed:
+            # A partial file left by an upload of a different version must not be mixed in
+            status, _, _ = self.pool.request("DELETE", self._path(key + ".part"), self._headers)
+            if status not in (200, 204, 404):
+                raise UploadError(f"DELETE {key}.part failed with status {status}", status)
+
+    def _put_chunk(self, key: str, state: _UploadState, number: int, offset: int, data: bytes, size: int):
+        headers = dict(self._headers)
+        headers["Content-Range"] = f"bytes {offset}-{offset + len(data) - 1}/{size}"
+        self._check(self.pool.request("PUT", self._path(key + ".part"), headers, data), "PUT", key)
+        return True
+
+    def _complete_chunked(self, key: str, size: int, state: _UploadState) -> None:
+        headers = dict(self._headers)
+        headers["Destination"] = f"{self.scheme}://{self.netloc}{self._path(key)}"
+        headers["Overwrite"] = "T"
+        self._check(self.pool.request("MOVE", self._path(key + ".part"), headers), "MOVE", key)
+
+    def _discard(self, stored: dict) -> None:
+        try:
+            self.pool.request("DELETE", self._path(stored["key"] + ".part"), self._headers)
+        except OSError:
+            pass
+
+    def _ensure_collections(self, key: str) -> None:
+        """
+        Creates the missing parent collections of key, each collection is only created once per backend
+        """
+        if not self.webdav:
+            return
+        parent = ""
+        for name in key.split("/")[:-1]:
+            parent = f"{parent}/{name}" if parent else name
+            with self._collections_lock:
+                if parent in self._collections:
+                    continue
+            status, _, _ = self.pool.request("MKCOL", self._path(parent), self._headers)
+            # 405: the collection exists already
+            if status not in (201, 405) and not 200 <= status < 300:
+                raise UploadError(f"MKCOL {parent} failed with status {status}", status)
+            with self._collections_lock:
+                self._collections.add(parent)
+
+    @staticmethod
+    def _check(response: tuple, method: str, key: str) -> None:
+        status = response[0]
+        if not 200 <= status < 300:
+            raise UploadError(f"{method} {key} failed with status {status}", status)
+
+
+class S3Backend(_RemoteBackend):
+    """
+    Uploads to an S3 compatible object store (path-style addressing, AWS Signature Version 4)
+    Large files use multipart uploads with parallel parts, the upload id and the ETags of the finished
+    parts are kept in the resume state
+    """
+    def __init__(self, endpoint: str, bucket: str, access_key: str, secret_key: str, region: str = "us-east-1",
+                 prefix: str = "", **options) -> None:
+        """
+        :param endpoint: URL of the object store, e.g. https://s3.example.org
+        :param bucket: Bucket the files are uploaded to
+        :param access_key: Access key id
+        :param secret_key: Secret access key
+        :param region: Region used in the signature
+        :param prefix: Optional key prefix, e.g. pruefungen
+        :param options: chunk_size, workers, max_in_flight and state_dir, see _RemoteBackend
+        """
+        options["chunk_size"] = max(options.get("chunk_size") or Config.get_upload_chunk_size(), _S3_MIN_PART_SIZE)
+        super().__init__(f"{endpoint.rstrip('/')}/{bucket}/{prefix.strip('/')}", **options)
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+
+    def exists(self, key: str) -> bool:
+        status, _, _ = self._request("HEAD", key)
+        return 200 <= status < 300
+
+    def _chunk_id(self, number: int, offset: int) -> str:
+        return str(number)
+
+    def _put_whole(self, key: str, data: bytes) -> None:
+        self._check(self._request("PUT", key, body=data), "PutObject", key)
+
+    def _begin_chunked(self, key: str, size: int, state: _UploadState) -> None:
+        if state.upload_id:
+            return
+        response = self._check(self._request("POST", key, {"uploads": ""}), "CreateMultipartUpload", key)
+        state.upload_id = _xml_text(response[2], "UploadId")
+        state.done = {}
+        state.save()
+
+    def _put_chunk(self, key: str, state: _UploadState, number: int, offset: int, data: bytes, size: int):
+        query = {"partNumber": str(number), "uploadId": state.upload_id}
+        status, headers, _ = self._check(self._request("PUT", key, query, data), "UploadPart", key)
+        return headers.get("etag", "")
+
+    def _complete_chunked(self, key: str, size: int, state: _UploadState) -> None:
+        parts = "".join(
+            f"<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>"
+            for number, etag in sorted(state.done.items(), key=lambda item: int(item[0]))
+        )
+        body = f"<CompleteMultipartUpload>{parts}</CompleteMultipartUpload>".encode("utf-8")
+        response = self._check(self._request("POST", key, {"uploadId": state.upload_id}, body), "CompleteMultipartUpload", key)
+        # Errors of CompleteMultipartUpload may arrive with status 200
+        if b"<Error>" in response[2]:
+            raise UploadError(f"CompleteMultipartUpload {key} failed: {response[2][:200]!r}")
+
+    def _discard(self, stored: dict) -> None:
+        if stored.get("upload_id"):
+            try:
+                self._request("DELETE", stored["key"], {"uploadId": stored["upload_id"]})
+            except OSError:
+                pass
+
+    def _request(self, method: str, key: str, query: dict = None, body: bytes = None) -> tuple[int, dict, bytes]:
+        """
+        Sends a signed request for key
+        """
+        path = self._path(key)
+        canonical_query = "&".join(
+            f"{quote(name, safe='-_.~')}={quote(value, safe='-_.~')}" for name, value in sorted((query or {}).items())
+        )
+        headers = sign_v4(method, self.netloc, path, canonical_query, body or b"", self.access_key, self.secret_key,
+                          self.region)
+        return self.pool.request(method, f"{path}?{canonical_query}" if canonical_query else path, headers, body)
+
+    @staticmethod
+    def _check(response: tuple, operation: str, key: str) -> tuple:
+        status = response[0]
+        if not 200 <= status < 300:
+            raise UploadError(f"{operation} {key} failed with status {status}: {response[2][:200]!r}", status)
+        return response
+
+
+def sign_v4(method: str, host: str, path: str, canonical_query: str, body: bytes, access_key: str, secret_key: str,
+            region: str, service: str = "s3", now: datetime.datetime = None) -> dict:
+    """
+    Creates the headers of a request signed with AWS Signature Version 4
+
+    :param path: URI-encoded path
+    :param canonical_query: Sorted, URI-encoded query string
+    :return: Headers including Authorization
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    date = now.strftime("%Y%m%d")
+    payload_hash = hashlib.sha256(body).hexdigest()
+    headers = {"host": host, "x-amz-content-sha256": payload_hash, "x-amz-date": amz_date}
+    signed_headers = ";".join(sorted(headers))
+    canonical_headers = "".join(f"{name}:{headers[name]}\n" for name in sorted(headers))
+    canonical_request = "\n".join([method, path, canonical_query, canonical_headers, signed_headers, payload_hash])
+    scope = f"{date}/{region}/{service}/aws4_request"
+    string_to_sign = "\n".join([
+        "AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request.encode("utf-8")).hexdigest()
+    ])
+    key = f"AWS4{secret_key}".encode("utf-8")
+    for part in (date, region, service, "aws4_request"):
+        key = hmac.new(key, part.encode("utf-8"), hashlib.sha256).digest()
+    signature = hmac.new(key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+    headers["Authorization"] = (f"AWS4-HMAC-SHA256 Credential={access_key}/{scope}, "
+                                f"SignedHeaders={signed_headers}, Signature={signature}")
+    return headers
+
+
+def create_backend(target: str) -> UploadBackend:
+    """
+    Creates a backend from a target URL
+        - /path or file:///path: LocalBackend
+        - http(s)://[user:password@]host/path[?partial_put=1]: HttpPutBackend, credentials also from
+          PRUEFUNGSDATEIEN_UPLOAD_USER and PRUEFUNGSDATEIEN_UPLOAD_PASSWORD. partial_put=1 only for servers
+          that accept PUT with Content-Range
+        - s3://bucket/prefix?endpoint=https://host&region=eu-central-1: S3Backend, the keys are taken from
+          AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY, the endpoint also from AWS_ENDPOINT_URL
+    """
+    parts = urlsplit(target)
+    if parts.scheme in ("http", "https"):
+        query = dict(parse_qsl(parts.query))
+        return HttpPutBackend(target.split("?", 1)[0], os.environ.get("PRUEFUNGSDATEIEN_UPLOAD_USER"),
+                              os.environ.get("PRUEFUNGSDATEIEN_UPLOAD_PASSWORD"),
+                              partial_put=query.get("partial_put") in ("1", "true", "yes"))
+    if parts.scheme == "s3":
+        query = dict(parse_qsl(parts.query))
+        endpoint = query.get("endpoint") or os.environ.get("AWS_ENDPOINT_URL")
+        if not endpoint:
+            raise ValueError("S3 targets need an endpoint (?endpoint=... or AWS_ENDPOINT_URL)")
+        return S3Backend(endpoint, parts.netloc, os.environ.get("AWS_ACCESS_KEY_ID", ""),
+                         os.environ.get("AWS_SECRET_ACCESS_KEY", ""),
+                         query.get("region") or os.environ.get("AWS_REGION", "us-east-1"), parts.path)
+    if parts.scheme == "file":
+        return LocalBackend(parts.path)
+    if parts.scheme:
+        raise ValueError(f"Unsupported upload target: {target}")
+    return LocalBackend(target)
+
+
+def _xml_text(data: bytes, tag: str) -> str:
+    """
+    :return: Text of the first element named tag, independent of its namespace
+    """
+    for element in ElementTree.fromstring(data).iter():
+        if element.tag.rsplit("}", 1)[-1] == tag:
+            return element.text
+    raise UploadError(f"Response without {tag}: {data[:200]!r}")
+
+
+def _read_json(path: str):
+    """
+    :return: Decoded content of a JSON file or None if it is missing or broken
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
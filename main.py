@@ -1,40 +1,81 @@
 # main.py
 
+import time
+
+# Taken before any other import, so the startup profile includes the import of Qt and the UI
+_STARTED = time.perf_counter()
+
 import sys
-import os
 from PyQt6.QtWidgets import QApplication
-from ui.main_window import MainWindow
 
-def resource_path(relative_path: str) -> str:
+
+def parse_startup_options(argv: list[str]) -> tuple[bool, float, list[str]]:
     """
-    Returns the absolute path to the resource. Works for development
-    (running .py files) and for PyInstaller-compiled EXEs.
+    Removes the startup profiling options from the arguments before they are passed to Qt
+
+    :return: (profile_startup, budget_ms, remaining arguments)
+    :raises SystemExit: If the budget is not a number
     """
-    if hasattr(sys, '_MEIPASS'):
-        base_path = sys._MEIPASS
-    else:
-        base_path = os.path.abspath(".")
+    profile_startup = False
+    budget_ms = None
+    remaining = []
+    for argument in argv:
+        if argument == "--profile-startup":
+            profile_startup = True
+        elif argument.startswith("--startup-budget="):
+            profile_startup = True
+            try:
+                budget_ms = float(argument.split("=", 1)[1])
+            except ValueError:
+                raise SystemExit(f"Ungültiges Startbudget: {argument.split('=', 1)[1]!r} (Millisekunden erwartet)")
+        else:
+            remaining.append(argument)
+    return profile_startup, budget_ms, remaining
 
-    return os.path.join(base_path, relative_path)
 
 def main() -> int:
     """
     Initialize and run the main application
+    With --profile-startup the time from process start to the first paint is reported and the
+    application quits, --startup-budget=<ms> additionally fails if the budget is exceeded
 
     Returns:
         int: The exit status of the application
     """
-    app = QApplication(sys.argv)
+    profile_startup, budget_ms, argv = parse_startup_options(sys.argv)
+    profiler = None
+    if profile_startup:
+        from ui.startup_profiler import StartupProfiler
+        profiler = StartupProfiler(_STARTED, budget_ms)
+        profiler.mark("Qt importieren")
 
-    style_file = resource_path("resources/styles.qss")
-    with open(style_file, "r") as f:
-        qss = f.read()
-    app.setStyleSheet(qss)
+    app = QApplication(argv)
+    if profiler:
+        profiler.mark("QApplication")
+
+    from ui.resources import load_stylesheet
+    app.setStyleSheet(load_stylesheet())
+    if profiler:
+        profiler.mark("Stylesheet")
+
+    from ui.main_window import MainWindow
+    if profiler:
+        profiler.mark("UI importieren")
 
     window = MainWindow()
+    if profiler:
+        profiler.mark("Hauptfenster")
+        profiler.watch(window)
+
     window.show()
+    if profiler:
+        profiler.mark("Anzeigen")
 
     return app.exec()
 
 if __name__ == "__main__":
-    sys.exit(main())
\ No newline at end of file
+    if getattr(sys, "frozen", False):
+        # The extraction processes of the search index start the bundled executable again
+        import multiprocessing
+        multiprocessing.freeze_support()
+    sys.exit(main())
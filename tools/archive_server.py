@@ -0,0 +1,236 @@
+# tools/archive_server.py
+
+import argparse
+import os
+import re
+import shutil
+import sys
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+_PART = re.compile(rb"<PartNumber>(\d+)</PartNumber>")
+
+
+class ArchiveRequestHandler(BaseHTTPRequestHandler):
+    """
+    Minimal stand-in for the central archive server, for development and tests of the upload backends
+    Understands the WebDAV subset of HttpPutBackend (PUT, with Content-Range unless disabled, HEAD, GET, DELETE,
+    MKCOL, MOVE)
+    and, with --s3, the S3 subset of S3Backend (PutObject and multipart uploads). Signatures are not verified
+    """
+    protocol_version = "HTTP/1.1"
+    server_version = "ArchiveStandIn/1.0"
+
+    def do_HEAD(self) -> None:
+        path = self._local_path()
+        if os.path.isfile(path):
+            self._respond(200, headers={"Content-Length": str(os.path.getsize(path))}, body=None)
+        else:
+            self._respond(404, body=None)
+
+    def do_GET(self) -> None:
+        path = self._local_path()
+        if not os.path.isfile(path):
+            self._respond(404)
+            return
+        with open(path, "rb") as f:
+            self._respond(200, f.read())
+
+    def do_PUT(self) -> None:
+        body = self._read_body()
+        if self._inject_failure():
+            return
+        query = self._query()
+        if self.server.s3 and "uploadId" in query:
+            upload_dir = self._upload_dir(query["uploadId"])
+            if not os.path.isdir(upload_dir):
+                self._respond(404, b"<Error><Code>NoSuchUpload</Code></Error>")
+                return
+            with open(os.path.join(upload_dir, f"{int(query['partNumber']):05d}"), "wb") as f:
+                f.write(body)
+            self._respond(200, headers={"ETag": f'"{uuid.uuid4().hex}"'})
+            return
+
+        path = self._local_path()
+        if self.server.s3:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        elif not os.path.isdir(os.path.dirname(path)):
+            self._respond(409)
+            return
+        content_range = self.headers.get("Content-Range")
+        if content_range and not self.server.partial_put:
+            # Like most servers, RFC 7231 section 4.3.4
+            self._respond(400)
+            return
+        if content_range:
+            match = _CONTENT_RANGE.fullmatch(content_range.strip())
+            if not match or int(match.group(2)) - int(match.group(1)) + 1 != len(body):
+                self._respond(400)
+                return
+            with self.server.lock:
+                mode = "r+b" if os.path.exists(path) else "wb"
+                with open(path, mode) as f:
+                    f.seek(int(match.group(1)))
+                    f.write(body)
+            self._respond(204)
+            return
+        with open(path, "wb") as f:
+            f.write(body)
+        self._respond(201)
+
+    def do_POST(self) -> None:
+        body = self._read_body()
+        query = self._query()
+        if not self.server.s3:
+            self._respond(405)
+            return
+        if "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            os.makedirs(self._upload_dir(upload_id))
+            self._respond(200, f"<InitiateMultipartUploadResult><UploadId>{upload_id}</UploadId>"
+                               f"</InitiateMultipartUploadResult>".encode("utf-8"))
+            return
+        upload_dir = self._upload_dir(query.get("uploadId", ""))
+        if not os.path.isdir(upload_dir):
+            self._respond(404, b"<Error><Code>NoSuchUpload</Code></Error>")
+            return
+        path = self._local_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as output:
+            for number in _PART.findall(body):
+                with open(os.path.join(upload_dir, f"{int(number):05d}"), "rb") as part:
+                    shutil.copyfileobj(part, output)
+        shutil.rmtree(upload_dir)
+        self._respond(200, b"<CompleteMultipartUploadResult></CompleteMultipartUploadResult>")
+
+    def do_DELETE(self) -> None:
+        query = self._query()
+        if self.server.s3 and "uploadId" in query:
+            shutil.rmtree(self._upload_dir(query["uploadId"]), ignore_errors=True)
+            self._respond(204)
+            return
+        path = self._local_path()
+        if not os.path.exists(path):
+            self._respond(404)
+            return
+        os.unlink(path)
+        self._respond(204)
+
+    def do_MKCOL(self) -> None:
+        path = self._local_path()
+        if os.path.exists(path):
+            self._respond(405)
+        elif not os.path.isdir(os.path.dirname(path)):
+            self._respond(409)
+        else:
+            os.mkdir(path)
+            self._respond(201)
+
+    def do_MOVE(self) -> None:
+        source = self._local_path()
+        destination = self._local_path(urlsplit(self.headers.get("Destination", "")).path)
+        if not os.path.isfile(source):
+            self._respond(404)
+            return
+        os.replace(source, destination)
+        self._respond(201)
+
+    def log_message(self, format, *args) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _inject_failure(self) -> bool:
+        """
+        Fails every n-th PUT with status 500 if --fail-every is set
+        """
+        if not self.server.fail_every:
+            return False
+        with self.server.lock:
+            self.server.put_count += 1
+            failing = self.server.put_count % self.server.fail_every == 0
+        if failing:
+            self._respond(500)
+        return failing
+
+    def _query(self) -> dict:
+        return {name: values[0] for name, values in parse_qs(urlsplit(self.path).query, keep_blank_values=True).items()}
+
+    def _local_path(self, url_path: str = None) -> str:
+        relative = unquote(url_path if url_path is not None else urlsplit(self.path).path).lstrip("/")
+        path = os.path.normpath(os.path.join(self.server.root, relative))
+        if os.path.commonpath([path, self.server.root]) != self.server.root:
+            raise PermissionError(f"Path outside of the archive: {relative}")
+        return path
+
+    def _upload_dir(self, upload_id: str) -> str:
+        return os.path.join(self.server.root, ".uploads", re.sub(r"[^0-9a-f]", "", upload_id) or "-")
+
+    def _respond(self, status: int, body: bytes = b"", headers: dict = None) -> None:
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if body is not None:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+
+def create_server(root: str, port: int = 0, s3: bool = False, fail_every: int = 0, verbose: bool = False,
+                  partial_put: bool = True) -> ThreadingHTTPServer:
+    """
+    Creates the stand-in server, call serve_forever to run it
+
+    :param root: Directory the archive is stored in
+    :param port: TCP port on localhost, 0 picks a free port (see server.server_address)
+    :param s3: Speak the S3 subset instead of WebDAV
+    :param fail_every: Fail every n-th PUT to exercise retries and resuming, 0 disables it
+    :param partial_put: Accept PUT with Content-Range, reject it with 400 like most servers if disabled
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), ArchiveRequestHandler)
+    server.daemon_threads = True
+    server.root = os.path.abspath(root)
+    server.s3 = s3
+    server.fail_every = fail_every
+    server.partial_put = partial_put
+    server.verbose = verbose
+    server.lock = threading.Lock()
+    server.put_count = 0
+    os.makedirs(server.root, exist_ok=True)
+    return server
+
+
+def main(argv: list[str] = None) -> int:
+    """
+    Run the stand-in server until interrupted
+
+    Returns:
+        int: The exit status
+    """
+    parser = argparse.ArgumentParser(prog="archive_server", description="Lokaler Ersatz für den zentralen Archivserver")
+    parser.add_argument("root", help="Ordner, in dem die hochgeladenen Dateien abgelegt werden")
+    parser.add_argument("--port", type=int, default=8080, help="TCP-Port (Standard: 8080)")
+    parser.add_argument("--s3", action="store_true", help="S3-Schnittstelle statt WebDAV")
+    parser.add_argument("--fail-every", type=int, default=0, help="Jeden n-ten PUT mit Status 500 ablehnen")
+    parser.add_argument("--no-partial-put", action="store_true", help="PUT mit Content-Range ablehnen (wie nginx)")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Anfragen protokollieren")
+    args = parser.parse_args(argv)
+
+    server = create_server(args.root, args.port, args.s3, args.fail_every, args.verbose, not args.no_partial_put)
+    print(f"Archivserver auf http://127.0.0.1:{server.server_address[1]} ({'S3' if args.s3 else 'WebDAV'})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+from PyQt6.QtWidgets import QGroupBox, QVBoxLayout, QLabel
+from PyQt6.QtCore import QTimer
+from PyQt6.QtGui import QFont
+from core.metrics import Metrics
+
+
+class DiagnosticsPanel(QGroupBox):
+    """
+    Hidden panel showing the live throughput and the stage timings of the file processing
+    It is toggled with Ctrl+Shift+D and only reads the metrics while it is visible
+    """
+
+    def __init__(self, metrics: Metrics, interval_ms: int = 1000) -> None:
+        """
+        Initializes the diagnostics panel
+
+        :param metrics: Metrics of the file processor
+        :param interval_ms: Refresh interval in milliseconds
+        """
+        super().__init__()
+        self.setTitle("")
+        self.metrics = metrics
+        # (uptime, files_processed, bytes_moved) of the previous refresh, used for the rates
+        self._previous = None
+        self.init_ui()
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.refresh)
+        self.setVisible(False)
+
+    def init_ui(self) -> None:
+        """
+        Sets up the labels of the panel
+        """
+        layout = QVBoxLayout()
+        layout.setContentsMargins(20, 10, 20, 10)
+
+        self.throughput_label = QLabel()
+        self.throughput_label.setFont(QFont("Segoe UI", 11))
+        self.counters_label = QLabel()
+        self.counters_label.setFont(QFont("Segoe UI", 10))
+        self.devices_label = QLabel()
+        self.devices_label.setFont(QFont("Segoe UI", 10))
+        self.stages_label = QLabel()
+        self.stages_label.setFont(QFont("Consolas", 10))
+
+        layout.addWidget(self.throughput_label)
+        layout.addWidget(self.counters_label)
+        layout.addWidget(self.devices_label)
+        layout.addWidget(self.stages_label)
+        self.setLayout(layout)
+
+    def toggle(self) -> None:
+        """
+        Shows or hides the panel, the refresh timer only runs while it is shown
+        """
+        visible = not self.isVisible()
+        self.setVisible(visible)
+        if visible:
+            self._previous = None
+            self.refresh()
+            self.timer.start()
+        else:
+            self.timer.stop()
+
+    def refresh(self) -> None:
+        """
+        Reads a snapshot of the metrics and updates the labels
+        """
+        snapshot = self.metrics.snapshot()
+        counters = snapshot["counters"]
+        current = (snapshot["uptime"], counters.get("files_processed", 0), counters.get("bytes_moved", 0))
+        if self._previous is not None and current[0] > self._previous[0]:
+            elapsed = current[0] - self._previous[0]
+            files_per_second = (current[1] - self._previous[1]) / elapsed
+            megabytes_per_second = (current[2] - self._previous[2]) / elapsed / (1024 * 1024)
+            self.throughput_label.setText(f"Durchsatz: {files_per_second:.1f} Dateien/s, {megabytes_per_second:.1f} MiB/s")
+        else:
+            self.throughput_label.setText("Durchsatz: -")
+        self._previous = current
+
+        self.counters_label.setText(
+            f"Verarbeitet: {counters.get('files_processed', 0)}   "
+            f"Übersprungen: {counters.get('files_skipped', 0)}   "
+            f"Fehlgeschlagen: {counters.get('files_failed', 0)}   "
+            f"Verschoben: {counters.get('bytes_moved', 0) / (1024 * 1024):.1f} MiB"
+        )
+        gauges = snapshot["gauges"]
+        waiting, active = gauges.get("io_queue_depth", {}), gauges.get("io_active", {})
+        self.devices_label.setText("Laufwerke: " + ("   ".join(
+            f"{device} wartend {waiting[device]:g}, aktiv {active.get(device, 0):g}" for device in sorted(waiting)
+        ) or "-"))
+        self.stages_label.setText("\n".join(
+            f"{stage:<10} n={values['count']:<8} p50 ≤ {values['p50'] * 1000:.1f} ms   p99 ≤ {values['p99'] * 1000:.1f} ms"
+            for stage, values in sorted(snapshot["stages"].items())
+        ))
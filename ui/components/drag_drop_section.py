@@ -1,15 +1,17 @@
-from PyQt6.QtWidgets import QWidget, QVBoxLayout, QFrame, QLabel, QPushButton, QMessageBox
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QFrame, QLabel, QPushButton
 from PyQt6.QtGui import QFont
 from PyQt6.QtCore import Qt
 
 class DragDropSection(QWidget):
-    def __init__(self, upload_callback) -> None:
+    def __init__(self, upload_callback, folder_callback=None) -> None:
         """
         Initializes the drag and drop section widget
-        :param upload_callback: Callback function to trigger file upload
+        :param upload_callback: Callback function to trigger file upload, receives the list of dropped paths
+        :param folder_callback: Optional callback function to trigger a folder upload
         """
         super().__init__()
         self.upload_callback = upload_callback
+        self.folder_callback = folder_callback
         self.init_ui()
         self.setAcceptDrops(True)
 
@@ -25,7 +27,7 @@ class DragDropSection(QWidget):
         self.drop_frame.setObjectName("DropFrame")
         self.drop_frame.setFixedHeight(250)
         drop_layout = QVBoxLayout()
-        self.drop_label = QLabel("Datei ablegen oder unten klicken")
+        self.drop_label = QLabel("Dateien oder Ordner ablegen oder unten klicken")
         self.drop_label.setFont(QFont("Segoe UI", 16))
         self.drop_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         drop_layout.addStretch()
@@ -33,20 +35,31 @@ class DragDropSection(QWidget):
         drop_layout.addStretch()
         self.drop_frame.setLayout(drop_layout)
 
-        self.upload_button = QPushButton("Datei wählen")
+        self.upload_button = QPushButton("Dateien wählen")
         self.upload_button.setFixedSize(220, 50)
         self.upload_button.setFont(QFont("Segoe UI", 14))
-        self.upload_button.clicked.connect(self.upload_callback)
+        self.upload_button.clicked.connect(lambda: self.upload_callback())
+
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        button_layout.addWidget(self.upload_button)
+        if self.folder_callback:
+            self.folder_button = QPushButton("Ordner wählen")
+            self.folder_button.setFixedSize(220, 50)
+            self.folder_button.setFont(QFont("Segoe UI", 14))
+            self.folder_button.clicked.connect(lambda: self.folder_callback())
+            button_layout.addWidget(self.folder_button)
+        button_layout.addStretch()
 
         layout.addWidget(self.drop_frame)
-        layout.addWidget(self.upload_button, alignment=Qt.AlignmentFlag.AlignCenter)
+        layout.addLayout(button_layout)
         self.setLayout(layout)
 
     def dragEnterEvent(self, event) -> None:
         """
         Handle drag&drop enter event
         """
-        if event.mimeData().hasUrls() and len(event.mimeData().urls()) == 1:
+        if event.mimeData().hasUrls() and any(url.isLocalFile() for url in event.mimeData().urls()):
             event.acceptProposedAction()
             self.drop_frame.setStyleSheet("""
                 #DropFrame {
@@ -75,14 +88,10 @@ class DragDropSection(QWidget):
         Handle drag&drop drop event
         """
         if event.mimeData().hasUrls():
-            urls = event.mimeData().urls()
-            if len(urls) != 1:
-                QMessageBox.warning(self, "Warnung", "Bitte legen Sie maximal eine Datei gleichzeitig ab", QMessageBox.StandardButton.Ok)
-                event.ignore()
-                return
-            file_path = urls[0].toLocalFile()
-            if file_path:
-                self.upload_callback(file_path)
+            file_paths = [url.toLocalFile() for url in event.mimeData().urls() if url.isLocalFile()]
+            if file_paths:
+                event.acceptProposedAction()
+                self.upload_callback(file_paths)
             self.drop_frame.setStyleSheet("""
                 #DropFrame {
                     border: 2px dashed #16a085;
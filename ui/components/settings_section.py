@@ -1,4 +1,4 @@
-from PyQt6.QtWidgets import QGroupBox, QHBoxLayout, QVBoxLayout, QLabel, QComboBox
+from PyQt6.QtWidgets import QGroupBox, QHBoxLayout, QVBoxLayout, QLabel, QComboBox, QCheckBox
 from PyQt6.QtGui import QFont
 from config.config import Config
 from datetime import datetime
@@ -45,6 +45,12 @@ class SettingsSection(QGroupBox):
             card_layout.addWidget(combo)
             layout.addLayout(card_layout)
 
+        auto_classify_check = QCheckBox("Automatisch erkennen")
+        auto_classify_check.setObjectName("auto_classify_check")
+        auto_classify_check.setToolTip("Einstellungen aus Dateiname, Ordnern und erster Seite ableiten, unsichere Felder aus der Auswahl übernehmen")
+        auto_classify_check.setFont(QFont("Segoe UI", 11))
+        layout.addWidget(auto_classify_check)
+
         layout.addStretch()
         self.setLayout(layout)
 
@@ -75,4 +81,11 @@ class SettingsSection(QGroupBox):
         :return: The currently selected text from the corresponding combobox, or None if not found
         """
         widget = self.findChild(QComboBox, f"{setting}_combo")
-        return widget.currentText() if widget else None
\ No newline at end of file
+        return widget.currentText() if widget else None
+
+    def is_auto_classify_enabled(self) -> bool:
+        """
+        :return: True if the settings should be inferred from the files themselves
+        """
+        widget = self.findChild(QCheckBox, "auto_classify_check")
+        return bool(widget and widget.isChecked())
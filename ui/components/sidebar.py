@@ -45,6 +45,10 @@ class Sidebar(QWidget):
         self.btn_upload.setObjectName("navBtn")
         layout.addWidget(self.btn_upload)
 
+        self.btn_history = QPushButton("Verlauf")
+        self.btn_history.setObjectName("navBtn")
+        layout.addWidget(self.btn_history)
+
         self.btn_settings = QPushButton("Einstellungen")
         self.btn_settings.setObjectName("navBtn")
         layout.addWidget(self.btn_settings)
@@ -60,6 +64,7 @@ class Sidebar(QWidget):
         self.set_active_button(self.btn_upload)
 
         self.btn_upload.clicked.connect(lambda: self.set_active_button(self.btn_upload))
+        self.btn_history.clicked.connect(lambda: self.set_active_button(self.btn_history))
         self.btn_settings.clicked.connect(lambda: self.set_active_button(self.btn_settings))
         self.btn_about.clicked.connect(lambda: self.set_active_button(self.btn_about))
 
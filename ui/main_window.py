@@ -1,15 +1,13 @@
 from PyQt6.QtWidgets import (
     QMainWindow, QWidget, QHBoxLayout, QVBoxLayout, QStackedWidget
 )
-from PyQt6.QtGui import QIcon
+from PyQt6.QtGui import QIcon, QKeySequence, QShortcut
 
-# Import UI components and pages
+# Import UI components, the pages are imported when they are first shown
 from ui.components.sidebar import Sidebar
 from ui.components.settings_section import SettingsSection
-
-from ui.pages.upload_page import UploadPage
-from ui.pages.settings_page import SettingsPage
-from ui.pages.about_page import AboutPage
+from ui.components.diagnostics_panel import DiagnosticsPanel
+from ui.resources import resource
 
 class MainWindow(QMainWindow):
     """
@@ -25,7 +23,7 @@ class MainWindow(QMainWindow):
         Configure the windows title, icon, and size/position
         """
         self.setWindowTitle("IHK Prüfungsdateien")
-        self.setWindowIcon(QIcon("resources/icon.png"))
+        self.setWindowIcon(QIcon(resource("icon.png")))
         self.setGeometry(150, 150, 1400, 900)
 
     def _init_ui_components(self) -> None:
@@ -44,25 +42,72 @@ class MainWindow(QMainWindow):
         content_layout = QVBoxLayout()
         content_layout.setContentsMargins(20, 20, 20, 20)
         content_layout.addWidget(self.stacked_widget)
+        content_layout.addWidget(self.diagnostics_panel)
         main_layout.addLayout(content_layout, stretch=4)
 
         main_widget.setLayout(main_layout)
         self.setCentralWidget(main_widget)
 
-        self.sidebar.btn_upload.clicked.connect(lambda: self.stacked_widget.setCurrentIndex(0))
-        self.sidebar.btn_settings.clicked.connect(lambda: self.stacked_widget.setCurrentIndex(1))
-        self.sidebar.btn_about.clicked.connect(lambda: self.stacked_widget.setCurrentIndex(2))
+        self.sidebar.btn_upload.clicked.connect(lambda: self.show_page("upload"))
+        self.sidebar.btn_history.clicked.connect(lambda: self.show_page("history"))
+        self.sidebar.btn_settings.clicked.connect(lambda: self.show_page("settings"))
+        self.sidebar.btn_about.clicked.connect(lambda: self.show_page("about"))
+
+        # Hidden diagnostics panel with live throughput
+        self.diagnostics_shortcut = QShortcut(QKeySequence("Ctrl+Shift+D"), self)
+        self.diagnostics_shortcut.activated.connect(self.diagnostics_panel.toggle)
 
     def _init_stacked_pages(self) -> None:
         """
-        Initialize and add the different pages to the stacked widget
+        Initialize the stacked widget with the upload page, the other pages are created on first navigation
         """
         self.settings_section = SettingsSection()
-        self.upload_page = UploadPage(self.settings_section)
-        self.settings_page = SettingsPage(self.settings_section)
-        self.about_page = AboutPage()
-
         self.stacked_widget = QStackedWidget()
-        self.stacked_widget.addWidget(self.upload_page)
-        self.stacked_widget.addWidget(self.settings_page)
-        self.stacked_widget.addWidget(self.about_page)
\ No newline at end of file
+        self._page_factories = {
+            "upload": self._create_upload_page,
+            "history": self._create_history_page,
+            "settings": self._create_settings_page,
+            "about": self._create_about_page,
+        }
+        self._pages = {}
+        self.show_page("upload")
+        self.upload_page = self._pages["upload"]
+
+        self.diagnostics_panel = DiagnosticsPanel(self.upload_page.metrics)
+
+    def show_page(self, name: str) -> None:
+        """
+        Show a page, creating it on first use
+
+        :param name: upload, history, settings or about
+        """
+        page = self._pages.get(name)
+        if page is None:
+            page = self._pages[name] = self._page_factories[name]()
+            self.stacked_widget.addWidget(page)
+        self.stacked_widget.setCurrentWidget(page)
+
+    def _create_upload_page(self):
+        from ui.pages.upload_page import UploadPage
+        return UploadPage(self.settings_section)
+
+    def _create_history_page(self):
+        from ui.pages.history_page import HistoryPage
+        # The history is opened together with the processing
+        self.upload_page.init_processing()
+        return HistoryPage(self.upload_page.history)
+
+    def _create_settings_page(self):
+        from ui.pages.settings_page import SettingsPage
+        return SettingsPage(self.settings_section)
+
+    def _create_about_page(self):
+        from ui.pages.about_page import AboutPage
+        return AboutPage()
+
+    def closeEvent(self, event) -> None:
+        """
+        Stop the background processing before the window closes
+        """
+        self.upload_page.shutdown()
+        super().closeEvent(event)
\ No newline at end of file
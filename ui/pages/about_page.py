@@ -2,6 +2,7 @@ from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel
 from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QPixmap
 from config.config import Config
+from ui.resources import resource
 
 class AboutPage(QWidget):
     def __init__(self):
@@ -17,7 +18,7 @@ class AboutPage(QWidget):
         layout.setSpacing(20)
 
         logo_label = QLabel()
-        pixmap = QPixmap("resources/icon.png")
+        pixmap = QPixmap(resource("icon.png"))
         if not pixmap.isNull():
             logo_label.setPixmap(pixmap.scaled(150, 150, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation))
         logo_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
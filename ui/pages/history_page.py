@@ -0,0 +1,302 @@
+from collections import OrderedDict
+from datetime import datetime
+import os
+
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QTableView, QHeaderView, QAbstractItemView, QPushButton
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex, QTimer
+from PyQt6.QtGui import QFont
+from config.config import Config
+from core.processing_history import ProcessingHistory, DIMENSIONS
+
+# (header, HistoryEntry attribute, sort column in ProcessingHistory or None if the column cannot be sorted)
+COLUMNS = (
+    ("Zeitpunkt", "finished_at", "id"),
+    ("Status", "status", "status"),
+    ("Datei", "source", None),
+    ("Fachrichtung", "specialization", "specialization"),
+    ("Prüfteil", "exam_part", "exam_part"),
+    ("Dateityp", "file_type", "file_type"),
+    ("Jahr", "year", "year"),
+    ("Abschlusszeitraum", "period", "period"),
+    ("Ziel", "destination", None),
+)
+STATUS_TEXT = {"archived": "Archiviert", "failed": "Fehlgeschlagen", "cancelled": "Abgebrochen"}
+PAGE_SIZE = 256
+# Pages kept in memory, enough for several screens of rows in both scroll directions
+MAX_CACHED_PAGES = 16
+
+
+class HistoryTableModel(QAbstractTableModel):
+    """
+    Table model over the processing history
+    Rows are read from the database in pages when the view asks for them, only the most recently used pages are
+    kept in memory. The rows are a snapshot up to the newest id at the last update, so pages stay consistent while
+    files are processed. New rows are picked up by refresh, which is meant to be called from a timer so that a burst
+    of finished files results in one model update
+    """
+
+    def __init__(self, history: ProcessingHistory, parent=None) -> None:
+        """
+        Initializes the model
+
+        :param history: The history to show
+        :param parent: Optional parent object
+        """
+        super().__init__(parent)
+        self.history = history
+        self.filters = {}
+        self.sort_column = 0
+        self.order_by = "id"
+        self.descending = True
+        self._pages = OrderedDict()
+        self._until_id = history.last_id()
+        self._row_count = history.count(until_id=self._until_id)
+        # True if rows were added that are not shown yet because the sort order would spread them over the table
+        self.stale = False
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else self._row_count
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return COLUMNS[section][0]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role not in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.ToolTipRole):
+            return None
+        entry = self.entry(index.row())
+        if entry is None:
+            return None
+        attribute = COLUMNS[index.column()][1]
+        value = getattr(entry, attribute)
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return entry.message or value if attribute == "status" else value
+        if attribute == "finished_at":
+            return datetime.fromtimestamp(value).strftime("%d.%m.%Y %H:%M:%S")
+        if attribute == "status":
+            return STATUS_TEXT.get(value, value)
+        if attribute == "source":
+            return os.path.basename(value)
+        return value
+
+    def entry(self, row: int):
+        """
+        :return: The HistoryEntry shown in a row, its page is loaded on first access
+        """
+        if not 0 <= row < self._row_count:
+            return None
+        number = row // PAGE_SIZE
+        page = self._pages.get(number)
+        if page is None:
+            page = self.history.page(number * PAGE_SIZE, PAGE_SIZE, self.filters, self.order_by, self.descending,
+                                     self._until_id)
+            self._pages[number] = page
+            while len(self._pages) > MAX_CACHED_PAGES:
+                self._pages.popitem(last=False)
+        else:
+            self._pages.move_to_end(number)
+        offset = row - number * PAGE_SIZE
+        return page[offset] if offset < len(page) else None
+
+    def sort(self, column: int, order=Qt.SortOrder.AscendingOrder) -> None:
+        """
+        Sorts by a column, columns without an index in the history keep the current order
+        """
+        descending = order == Qt.SortOrder.DescendingOrder
+        if COLUMNS[column][2] is None or (column == self.sort_column and descending == self.descending):
+            return
+        if self.stale:
+            # The rows that were held back change the row count, which a layout change cannot announce
+            self.sort_column = column
+            self.order_by = COLUMNS[column][2]
+            self.descending = descending
+            self.reload()
+            return
+        self.layoutAboutToBeChanged.emit()
+        self.sort_column = column
+        self.order_by = COLUMNS[column][2]
+        self.descending = descending
+        self._pages.clear()
+        self.layoutChanged.emit()
+
+    def set_filter(self, column: str, value: str) -> None:
+        """
+        Restricts the rows to one value of a dimension or status, None shows all values
+        """
+        if value is None:
+            self.filters.pop(column, None)
+        else:
+            self.filters[column] = value
+        self.reload()
+
+    def reload(self) -> None:
+        """
+        Rereads the rows including all rows written so far
+        """
+        self.beginResetModel()
+        self._pages.clear()
+        self._until_id = self.history.last_id()
+        self._row_count = self.history.count(self.filters, self._until_id)
+        self.stale = False
+        self.endResetModel()
+
+    def refresh(self) -> None:
+        """
+        Writes the buffered history rows and announces the new rows with one insert signal
+        In time order the new rows are appended or, newest first, inserted at the top. Any other sort order would
+        spread them over the table, they are held back until the next reload so the view keeps its scroll position
+        and selection, and stale is set
+        """
+        self.history.flush()
+        last_id = self.history.last_id()
+        if last_id == self._until_id:
+            return
+        if last_id < self._until_id:
+            self.reload()
+            return
+        if self.order_by != "id":
+            self.stale = True
+            return
+        row_count = self.history.count(self.filters, last_id)
+        self._until_id = last_id
+        added = row_count - self._row_count
+        if added <= 0:
+            return
+        if self.descending:
+            self.beginInsertRows(QModelIndex(), 0, added - 1)
+            # Every row moved down, so every cached page is stale
+            self._pages.clear()
+        else:
+            self.beginInsertRows(QModelIndex(), self._row_count, row_count - 1)
+            # Only the last page can have changed
+            self._pages.pop(self._row_count // PAGE_SIZE, None)
+        self._row_count = row_count
+        self.endInsertRows()
+
+
+class HistoryPage(QWidget):
+    """
+    Widget showing the processed files with filters for the five settings and the status
+    """
+
+    def __init__(self, history: ProcessingHistory, refresh_interval_ms: int = 500) -> None:
+        """
+        Initialize the HistoryPage widget
+
+        :param history: The history to show
+        :param refresh_interval_ms: Interval in which new rows are picked up while the page is visible
+        """
+        super().__init__()
+        self.history = history
+        self.model = HistoryTableModel(history, self)
+        self.init_ui()
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(refresh_interval_ms)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def init_ui(self) -> None:
+        """
+        Set up the user interface with header, filter row and table
+        """
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(20)
+
+        header = QLabel("Verlauf")
+        header.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        header.setStyleSheet("font: 18pt 'Segoe UI'; color: #333333;")
+        layout.addWidget(header)
+
+        filter_layout = QHBoxLayout()
+        choices = {
+            "specialization": Config.get_specializations(),
+            "exam_part": Config.get_exam_parts(),
+            "file_type": Config.get_file_types(),
+            "year": None,
+            "period": Config.get_periods(),
+            "status": list(STATUS_TEXT),
+        }
+        labels = {"specialization": "Alle Fachrichtungen", "exam_part": "Alle Prüfteile", "file_type": "Alle Dateitypen",
+                  "year": "Alle Jahre", "period": "Alle Zeiträume", "status": "Alle Status"}
+        self.filter_combos = {}
+        for column in (*DIMENSIONS, "status"):
+            combo = QComboBox()
+            combo.setObjectName(f"{column}_filter_combo")
+            combo.setFont(QFont("Segoe UI", 11))
+            combo.addItem(labels[column], None)
+            for value in choices[column] if choices[column] is not None else self.history.distinct(column):
+                combo.addItem(STATUS_TEXT.get(value, value), value)
+            combo.currentIndexChanged.connect(lambda _, column=column, combo=combo: self.model.set_filter(column, combo.currentData()))
+            filter_layout.addWidget(combo)
+            self.filter_combos[column] = combo
+        # Shown while new rows are held back because the table is not sorted by time
+        self.reload_button = QPushButton("Neue Einträge anzeigen")
+        self.reload_button.setFont(QFont("Segoe UI", 11))
+        self.reload_button.setVisible(False)
+        self.reload_button.clicked.connect(self.reload)
+        filter_layout.addWidget(self.reload_button)
+        layout.addLayout(filter_layout)
+
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSortingEnabled(True)
+        self.table.sortByColumn(0, Qt.SortOrder.DescendingOrder)
+        self.table.horizontalHeader().sortIndicatorChanged.connect(self.on_sort_indicator_changed)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.setAlternatingRowColors(True)
+        self.table.setWordWrap(False)
+        # Fixed row heights and header sizes, so the view never measures rows that are not visible
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Interactive)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        layout.addWidget(self.table, stretch=1)
+
+        self.setLayout(layout)
+
+    def on_sort_indicator_changed(self, column: int, order) -> None:
+        """
+        Move the sort indicator back to the sorted column if a column that cannot be sorted was clicked
+        """
+        if COLUMNS[column][2] is None:
+            current = Qt.SortOrder.DescendingOrder if self.model.descending else Qt.SortOrder.AscendingOrder
+            self.table.horizontalHeader().setSortIndicator(self.model.sort_column, current)
+
+    def refresh(self) -> None:
+        """
+        Pick up the rows written since the last refresh and new years for the year filter
+        """
+        self.model.refresh()
+        self.reload_button.setVisible(self.model.stale)
+        combo = self.filter_combos["year"]
+        known = {combo.itemData(index) for index in range(1, combo.count())}
+        for year in self.history.distinct("year"):
+            if year not in known:
+                combo.addItem(year, year)
+
+    def reload(self) -> None:
+        """
+        Show the rows that were held back
+        """
+        self.model.reload()
+        self.reload_button.setVisible(False)
+
+    def showEvent(self, event) -> None:
+        """
+        Refresh immediately and then periodically while the page is visible
+        """
+        if self.model.stale:
+            self.reload()
+        self.refresh()
+        self.refresh_timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event) -> None:
+        self.refresh_timer.stop()
+        super().hideEvent(event)
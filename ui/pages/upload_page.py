@@ -1,7 +1,11 @@
-from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel, QFileDialog
-from PyQt6.QtCore import Qt
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QFileDialog, QProgressBar, QPushButton, QMessageBox
+from PyQt6.QtCore import Qt, QTimer
 from ui.components.drag_drop_section import DragDropSection
-from core.file_processor import FileProcessor
+from core.metrics import Metrics
+from config.config import Config
+
+# Settings read from the settings section, in FileJob order
+SETTINGS = ("specialization", "exam_part", "file_type", "year", "period")
 
 
 class UploadPage(QWidget):
@@ -19,12 +23,77 @@ class UploadPage(QWidget):
         self.init_ui()
         self.settings_section = settings_section
 
-        self.file_processor = FileProcessor()
+        # Aggregated in memory only, read by the diagnostics panel
+        self.metrics = Metrics()
+        # Created by init_processing after the first paint, opening the databases and recovering
+        # interrupted batches must not delay it
+        self.file_processor = None
+        self.processing_engine = None
+        self.history = None
+        self._painted = False
+        # Created on first use, compiling the pattern tables is only needed with automatic detection
+        self.file_classifier = None
+
+        # job_id -> (bytes_done, bytes_total) of all jobs that are not done yet
+        self._job_progress = {}
+        # Error messages collected until all jobs are done, reported in one message box
+        self._failures = []
+
+    def paintEvent(self, event) -> None:
+        """
+        Schedule init_processing once the page has been painted for the first time
+        """
+        super().paintEvent(event)
+        if not self._painted:
+            self._painted = True
+            # A timer started now fires after the window has been flushed to the screen
+            QTimer.singleShot(0, self.init_processing)
+
+    def init_processing(self) -> None:
+        """
+        Create the file processor and the processing engine and finish interrupted batches.
+        Called from the event loop after the first paint and before the first processing, only the first call has an effect.
+        """
+        if self.processing_engine is not None:
+            return
+        from core.file_processor import FileProcessor
+        from core.processing_engine import ProcessingEngine
+        from core.dedup_index import DedupIndex
+        from core.archive_catalog import ArchiveCatalog
+        from core.batch_journal import BatchJournal
+        from core.processing_history import ProcessingHistory, HistoryRecorder
+        from core.search_index import SearchIndex
+        from core.io_scheduler import IoScheduler
+        from core.routing_rules import RoutingRules
+        from ui.processing_signals import ProcessingSignals
+
+        routing = RoutingRules(fallback=True)
+        if routing.load_error is not None:
+            QMessageBox.warning(self, "Regeldatei fehlerhaft",
+                                f"Die Regeldatei {routing.rules_path} kann nicht gelesen werden:\n{routing.load_error}\n\n"
+                                "Bis sie korrigiert ist, wird die Standard-Ordnerstruktur verwendet.",
+                                QMessageBox.StandardButton.Ok)
+        self.file_processor = FileProcessor(dedup_index=DedupIndex(), catalog=ArchiveCatalog(), journal=BatchJournal(),
+                                            metrics=self.metrics, search_index=SearchIndex(),
+                                            verify=Config.get_verify_transfers(), io_scheduler=IoScheduler(self.metrics),
+                                            routing=routing)
+        self.file_processor.recover()
+        self.processing_signals = ProcessingSignals(self)
+        self.processing_signals.file_queued.connect(self.on_processing_queued)
+        self.processing_signals.file_started.connect(self.on_processing_started)
+        self.processing_signals.file_progress.connect(self.on_processing_progress)
+        self.processing_signals.file_finished.connect(self.on_processing_finished)
+        self.processing_signals.file_failed.connect(self.on_processing_failed)
+        self.processing_signals.file_cancelled.connect(self.on_processing_cancelled)
+        self.processing_signals.feed_failed.connect(self.on_feed_failed)
+        self.history = ProcessingHistory()
+        self.processing_engine = ProcessingEngine(self.file_processor, HistoryRecorder(self.history, self.processing_signals))
+
     def init_ui(self) -> None:
         """
         Set up the user interface for the upload page, including header text and the drag-and-drop section
         """
-        self.drag_drop_section = DragDropSection(self.open_file_dialog)
+        self.drag_drop_section = DragDropSection(self.open_file_dialog, self.open_folder_dialog)
 
         layout = QVBoxLayout()
         layout.setContentsMargins(0, 0, 0, 0)
@@ -36,34 +105,170 @@ class UploadPage(QWidget):
         layout.addWidget(header)
 
         layout.addWidget(self.drag_drop_section, stretch=3)
+
+        progress_layout = QHBoxLayout()
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setVisible(False)
+        progress_layout.addWidget(self.progress_bar, stretch=1)
+
+        self.cancel_button = QPushButton("Abbrechen")
+        self.cancel_button.setFixedSize(140, 40)
+        self.cancel_button.setVisible(False)
+        self.cancel_button.clicked.connect(self.cancel_processing)
+        progress_layout.addWidget(self.cancel_button)
+        layout.addLayout(progress_layout)
+
+        self.status_label = QLabel("")
+        self.status_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.status_label.setStyleSheet("font: 11pt 'Segoe UI'; color: #555555;")
+        layout.addWidget(self.status_label)
+
         layout.addStretch()
         self.setLayout(layout)
 
-    def open_file_dialog(self, file_path: str = None) -> None:
+    def open_file_dialog(self, file_paths: list[str] = None) -> None:
         """
         Open a file dialog and start the file processing, including retrieving settings values from the settings section.
 
-        :param file_path: Optional file path - If provided, the file dialog is bypassed
+        :param file_paths: Optional files and folders - If provided, the file dialog is bypassed
         """
-        if not file_path:
-            file_path, _ = QFileDialog.getOpenFileName(
+        if not file_paths:
+            file_paths, _ = QFileDialog.getOpenFileNames(
                 self,
-                "Datei auswählen",
+                "Dateien auswählen",
                 "",
                 "Alle Dateien (*);;PDF-Dateien (*.pdf);;Word-Dokumente (*.docx)"
             )
-        if file_path:
-            specialization = self.settings_section.get_setting("specialization")
-            exam_part = self.settings_section.get_setting("exam_part")
-            file_type = self.settings_section.get_setting("file_type")
-            year = self.settings_section.get_setting("year")
-            period = self.settings_section.get_setting("period")
+        if file_paths:
+            self.process_paths(file_paths)
+
+    def open_folder_dialog(self) -> None:
+        """
+        Open a folder dialog and start the processing of all files in the selected folder.
+        """
+        folder = QFileDialog.getExistingDirectory(self, "Ordner auswählen")
+        if folder:
+            self.process_paths([folder])
+
+    def process_paths(self, paths: list[str]) -> None:
+        """
+        Start the processing of files and whole folders with the current settings.
+        Folders are scanned lazily on the feeder thread of the processing engine.
+        With automatic detection the settings are inferred per file and the current settings are only used
+        for fields that could not be recognized with enough confidence.
+
+        :param paths: Files and folders to process
+        """
+        from core.file_processor import FileJob
+        from core.directory_scanner import scan_paths
+
+        self.init_processing()
+        settings = {name: self.settings_section.get_setting(name) for name in SETTINGS}
+        files = scan_paths(paths, routing=self.file_processor.routing)
+        if self.settings_section.is_auto_classify_enabled():
+            if self.file_classifier is None:
+                from core.file_classifier import FileClassifier
+                self.file_classifier = FileClassifier()
+            jobs = (self.file_classifier.classify_job(file_path, settings) for file_path in files)
+        else:
+            jobs = (FileJob(file_path, **settings) for file_path in files)
+        self.processing_engine.submit_many(jobs)
+
+    def cancel_processing(self) -> None:
+        """
+        Cancel all queued and running jobs
+        """
+        if self.processing_engine is not None:
+            self.processing_engine.cancel_all()
+
+    def shutdown(self) -> None:
+        """
+        Stop the processing engine, running jobs are cancelled
+        """
+        if self.processing_engine is not None:
+            self.processing_engine.shutdown(wait=True, cancel_pending=True)
+            self.history.close()
+            self.file_processor.search_index.close()
+            self.file_processor.close()
 
-            self.file_processor.process_file(file_path, specialization, exam_part, file_type, year, period)
+    def on_processing_queued(self, job_id: int, file_path: str) -> None:
+        """
+        Handle actions to perform when a file was queued for processing.
+        """
+        self._job_progress[job_id] = (0, 0)
+        self._update_progress()
+
+    def on_processing_started(self, job_id: int, file_path: str) -> None:
+        """
+        Handle actions to perform when a file starts processing.
+        """
+        self.status_label.setText(f"Verarbeite {file_path}")
 
-    def on_processing_finished(self) -> None:
+    def on_processing_progress(self, job_id: int, bytes_done: int, bytes_total: int) -> None:
+        """
+        Handle a progress report of a running file.
+        """
+        if job_id in self._job_progress:
+            self._job_progress[job_id] = (bytes_done, bytes_total)
+            self._update_progress()
+
+    def on_processing_finished(self, job_id: int, destination_path: str) -> None:
         """
         Handle actions to perform when the file processing is finished.
         """
-        # Display a notification – currently just a simple console output
-        print("Verarbeitung abgeschlossen")
+        self._job_progress.pop(job_id, None)
+        self.status_label.setText(f"Verarbeitung abgeschlossen: {destination_path}")
+        self._update_progress()
+
+    def on_processing_failed(self, job_id: int, message: str) -> None:
+        """
+        Handle actions to perform when the file processing failed.
+        """
+        self._job_progress.pop(job_id, None)
+        self._failures.append(message)
+        self.status_label.setText("Verarbeitung fehlgeschlagen")
+        self._update_progress()
+
+    def on_processing_cancelled(self, job_id: int) -> None:
+        """
+        Handle actions to perform when the file processing was cancelled.
+        """
+        self._job_progress.pop(job_id, None)
+        self.status_label.setText("Verarbeitung abgebrochen")
+        self._update_progress()
+
+    def on_feed_failed(self, message: str) -> None:
+        """
+        Handle an error while listing the files to process, the remaining files are not processed.
+        """
+        self._failures.append(message)
+        self._update_progress()
+
+    def _update_progress(self) -> None:
+        """
+        Show the combined progress of all jobs that are not done yet
+        """
+        busy = bool(self._job_progress)
+        self.progress_bar.setVisible(busy)
+        self.cancel_button.setVisible(busy)
+        if not busy:
+            self.history.flush()
+            self._report_failures()
+            return
+        bytes_done = sum(done for done, _ in self._job_progress.values())
+        bytes_total = sum(total for _, total in self._job_progress.values())
+        self.progress_bar.setValue(int(bytes_done * 100 / bytes_total) if bytes_total else 0)
+
+
+    def _report_failures(self) -> None:
+        """
+        Show the collected error messages in a single message box
+        """
+        if not self._failures:
+            return
+        failures, self._failures = self._failures, []
+        details = "\n".join(failures[:10])
+        if len(failures) > 10:
+            details += f"\n... und {len(failures) - 10} weitere"
+        QMessageBox.warning(self, "Fehler", f"{len(failures)} Datei(en) konnten nicht verarbeitet werden:\n{details}", QMessageBox.StandardButton.Ok)
@@ -0,0 +1,38 @@
+from PyQt6.QtCore import QObject, pyqtSignal
+from core.processing_engine import ProcessingListener, ProcessingCancelled
+
+
+class ProcessingSignals(QObject, ProcessingListener):
+    """
+    Translates the events of the processing engine into Qt signals
+    The engine calls the listener methods from its worker threads, the signals are delivered
+    to slots in the GUI thread through queued connections
+    """
+    file_queued = pyqtSignal(int, str)
+    file_started = pyqtSignal(int, str)
+    file_progress = pyqtSignal(int, 'qlonglong', 'qlonglong')
+    file_finished = pyqtSignal(int, str)
+    file_failed = pyqtSignal(int, str)
+    file_cancelled = pyqtSignal(int)
+    feed_failed = pyqtSignal(str)
+
+    def on_queued(self, job_id, job) -> None:
+        self.file_queued.emit(job_id, job.file_path)
+
+    def on_started(self, job_id, job) -> None:
+        self.file_started.emit(job_id, job.file_path)
+
+    def on_progress(self, job_id, bytes_done, bytes_total) -> None:
+        self.file_progress.emit(job_id, bytes_done, bytes_total)
+
+    def on_finished(self, job_id, destination_path) -> None:
+        self.file_finished.emit(job_id, destination_path)
+
+    def on_failed(self, job_id, error) -> None:
+        if isinstance(error, ProcessingCancelled):
+            self.file_cancelled.emit(job_id)
+            return
+        self.file_failed.emit(job_id, str(error) or type(error).__name__)
+
+    def on_feed_failed(self, error) -> None:
+        self.feed_failed.emit(str(error) or type(error).__name__)
@@ -0,0 +1,63 @@
+import os
+import sys
+from functools import lru_cache
+
+from PyQt6.QtCore import QDir, QFile, QIODevice, QResource
+
+RESOURCE_FILE = "resources.rcc"
+
+_prefix = None
+
+
+def resource_dir() -> str:
+    """
+    Returns the directory of the resources. Works for development (relative to this module, independent
+    of the working directory) and for PyInstaller-compiled EXEs.
+    """
+    if hasattr(sys, "_MEIPASS"):
+        return os.path.join(sys._MEIPASS, "resources")
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "resources")
+
+
+def register_resources() -> str:
+    """
+    Makes the resources available to Qt, only the first call has an effect
+    The compiled resource file resources/resources.rcc (see resources/resources.qrc) is preferred, it is
+    a single file that Qt maps into memory. Without it the loose files are found through a search path
+
+    :return: Prefix of the resource paths, ":/resources/" or "resources:"
+    """
+    global _prefix
+    if _prefix is None:
+        directory = resource_dir()
+        if QResource.registerResource(os.path.join(directory, RESOURCE_FILE)):
+            _prefix = ":/resources/"
+        else:
+            QDir.addSearchPath("resources", directory)
+            _prefix = "resources:"
+    return _prefix
+
+
+def resource(name: str) -> str:
+    """
+    :param name: File name inside resources, e.g. icon.png
+    :return: Path of the resource usable with QIcon, QPixmap and QFile
+    """
+    return register_resources() + name
+
+
+@lru_cache(maxsize=None)
+def load_stylesheet(name: str = "styles.qss") -> str:
+    """
+    Reads a stylesheet once, later calls return the cached text
+
+    :param name: File name inside resources
+    :return: The stylesheet or an empty string if it is missing
+    """
+    style_file = QFile(resource(name))
+    if not style_file.open(QIODevice.OpenModeFlag.ReadOnly | QIODevice.OpenModeFlag.Text):
+        return ""
+    try:
+        return bytes(style_file.readAll()).decode("utf-8")
+    finally:
+        style_file.close()
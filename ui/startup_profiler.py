@@ -0,0 +1,87 @@
+import os
+import sys
+import time
+
+from PyQt6.QtCore import QEvent, QObject, QTimer
+from PyQt6.QtWidgets import QApplication
+
+
+def process_age() -> float:
+    """
+    :return: Seconds since the process was started, None where this is not known (only Linux is supported)
+    """
+    try:
+        with open("/proc/self/stat", "rb") as f:
+            # The command name may contain spaces, the fields after it are separated by single spaces
+            start_ticks = int(f.read().rsplit(b")", 1)[1].split()[19])
+        with open("/proc/uptime", "rb") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class StartupProfiler(QObject):
+    """
+    Records the phases from process start to the first paint of the main window
+    With --profile-startup the breakdown is printed to stderr and the application quits after the first paint.
+    With --startup-budget=<ms> the exit status is 1 if the time to first paint exceeds the budget
+    """
+    def __init__(self, started: float, budget_ms: float = None) -> None:
+        """
+        :param started: perf_counter value taken as early as possible in main.py
+        :param budget_ms: Optional cold-start budget in milliseconds
+        """
+        super().__init__()
+        self.started = started
+        self.budget_ms = budget_ms
+        self.exit_code = 0
+        # Seconds the process lived before main.py took its first timestamp
+        self.interpreter_time = None
+        age = process_age()
+        if age is not None:
+            self.interpreter_time = max(0.0, age - (time.perf_counter() - started))
+        self.phases = []
+        self._last = started
+
+    def mark(self, phase: str) -> None:
+        """
+        Ends the current phase
+        """
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def watch(self, window) -> None:
+        """
+        Waits for the first paint of window, then reports and quits the application
+        """
+        window.installEventFilter(self)
+
+    def eventFilter(self, watched, event) -> bool:
+        if event.type() == QEvent.Type.Paint:
+            watched.removeEventFilter(self)
+            self.mark("Erstes Zeichnen")
+            # Quit once the paint event has been handled
+            QTimer.singleShot(0, self.report)
+        return False
+
+    def report(self) -> None:
+        """
+        Prints the breakdown and quits the application
+        """
+        total = sum(seconds for _, seconds in self.phases)
+        lines = ["Startzeit bis zum ersten Zeichnen:"]
+        if self.interpreter_time is not None:
+            lines.append(f"  {'Interpreter':<20} {self.interpreter_time * 1000:8.1f} ms")
+        for phase, seconds in self.phases:
+            lines.append(f"  {phase:<20} {seconds * 1000:8.1f} ms")
+        lines.append(f"  {'Gesamt (main.py)':<20} {total * 1000:8.1f} ms")
+        if self.interpreter_time is not None:
+            lines.append(f"  {'Gesamt (Prozess)':<20} {(total + self.interpreter_time) * 1000:8.1f} ms")
+        if self.budget_ms is not None:
+            within_budget = total * 1000 <= self.budget_ms
+            self.exit_code = 0 if within_budget else 1
+            lines.append(f"  Budget {self.budget_ms:.0f} ms {'eingehalten' if within_budget else 'ÜBERSCHRITTEN'}")
+        print("\n".join(lines), file=sys.stderr)
+        QApplication.instance().exit(self.exit_code)